@@ -0,0 +1,117 @@
+"""
+Auth hot-path microbenchmark: JWT verification and a login storm next to
+protected reads, with the token cache and argon2 process pool off
+("before") and on ("after").
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.auth_bench
+
+Requires the usual auth settings (SECRET_KEY, ALGORITHM, ...).
+
+On a 1-CPU runner (one hashing process, the default there), 40 logins
+next to 2000 reads from 20 clients:
+
+                        reads/s   read p50   read p95
+    before              317       8.2 ms     462 ms
+    after, nice 0       404       41.0 ms    57 ms
+    after, nice 10      421       10.9 ms    18 ms
+
+verify_token went from about 81k to 1.2M ops/s with the token cache.
+At the same priority the hashing process took the CPU from the event
+loop, and read p50 got 5x worse. AUTH_HASH_NICE (default 10) fixes that.
+Login latency isn't measured here; expect logins to finish later while reads
+keep the CPU busy.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+import httpx
+
+from core.config import settings
+from db.database import async_engine
+from main import app
+from utils.auth import _verified_tokens, create_access_token, password_hasher, verify_token
+
+PASSWORD = "Bench-password-1!"
+# AUTH_HASH_WORKERS, or the default for this machine
+HASH_WORKERS = password_hasher.workers
+
+
+def bench_verify(iterations: int, cached: bool) -> float:
+    settings.AUTH_TOKEN_CACHE_SIZE = 10000 if cached else 0
+    _verified_tokens.clear()
+    token = create_access_token("bench@example.com", uuid.uuid4(), timedelta(minutes=5))
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        verify_token(token)
+    return iterations / (time.perf_counter() - started)
+
+
+async def bench_storm(logins: int, reads: int, concurrency: int, after: bool) -> dict:
+    settings.AUTH_TOKEN_CACHE_SIZE = 10000 if after else 0
+    password_hasher.shutdown()
+    password_hasher.workers = HASH_WORKERS if after else 0
+    password_hasher.max_pending = 10**6  # measure queueing, not rejections
+    _verified_tokens.clear()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        registered = await client.post(
+            "/api/users/register",
+            json={"email": email, "first_name": "Bench", "last_name": "User", "password": PASSWORD},
+        )
+        registered.raise_for_status()
+        token = create_access_token(email, uuid.uuid4(), timedelta(minutes=5))
+        headers = {"Authorization": f"Bearer {token}"}
+        latencies: list[float] = []
+
+        async def login():
+            response = await client.post(
+                "/api/users/token", json={"email": email, "password": PASSWORD}
+            )
+            response.raise_for_status()
+
+        async def reader(count: int):
+            for _ in range(count):
+                started = time.perf_counter()
+                await client.get("/api/stats/cache", headers=headers)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(login() for _ in range(logins)),
+            *(reader(reads // concurrency) for _ in range(concurrency)),
+        )
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "reads_per_second": round(len(latencies) / elapsed, 1),
+        "read_p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "read_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+        "elapsed_seconds": round(elapsed, 2),
+    }
+
+
+async def main(args):
+    for label, after in (("before", False), ("after", True)):
+        print(f"[{label}] verify_token: {bench_verify(args.iterations, after):,.0f} ops/s")
+        result = await bench_storm(args.logins, args.reads, args.concurrency, after)
+        print(f"[{label}] {args.logins} logins + {args.reads} reads: {result}")
+    password_hasher.shutdown()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+Complete-story payloads: current JSON response vs core.story_codec.
+
+Builds stories from the fake LLM in memory (no database) and reports
+payload size plus encode/decode time per format.
+
+    python -m bench.codec_bench [--depth 4] [--stories 50]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from core.fake_llm import FakeStoryLLM
+from core.models import StoryLLMResponse
+from core.story_cache import complete_story_from_nodes
+from core.story_codec import decode_story, encode_story
+from core.story_generator import StoryGenerator
+from models.story import Story, StoryNode
+from schemas.story import CompleteStoryResponse
+
+
+def build_story(llm: FakeStoryLLM, story_id: int) -> Tuple[Story, List[StoryNode]]:
+    structure = StoryLLMResponse.model_validate_json(llm._story_json(None))
+    story = Story(
+        id=story_id,
+        title=structure.title,
+        session_id="bench",
+        theme="fantasy",
+        generation_mode="batch",
+        is_complete=True,
+        created_at=datetime.now(),
+    )
+
+    # Same id assignment as _persist_story_tree: deepest level first
+    levels = StoryGenerator._collect_levels(structure.rootNode)
+    node_ids, nodes, next_id = {}, [], story_id * 1000
+    for depth in range(len(levels) - 1, -1, -1):
+        for entry in levels[depth]:
+            node_data, children = entry
+            next_id += 1
+            node_ids[id(entry)] = next_id
+            nodes.append(
+                StoryNode(
+                    id=next_id,
+                    story_id=story_id,
+                    content=node_data.content,
+                    is_root=depth == 0,
+                    is_ending=node_data.isEnding,
+                    is_winning_ending=node_data.isWinningEnding,
+                    options=[
+                        {"text": text, "node_id": node_ids[id(child)] if child else None}
+                        for text, child in children
+                    ],
+                )
+            )
+    return story, nodes
+
+
+def measure(func: Callable, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def main(args):
+    llm = FakeStoryLLM(latency=0, depth=args.depth, seed=1)
+    stories = [build_story(llm, i + 1) for i in range(args.stories)]
+
+    formats = {
+        "json": (
+            lambda s, n: complete_story_from_nodes(s, n).model_dump_json().encode(),
+            lambda b: CompleteStoryResponse.model_validate(json.loads(b)),
+        ),
+        "msgpack": (lambda s, n: encode_story(s, n), decode_story),
+        "msgpack+zstd": (lambda s, n: encode_story(s, n, zstd_level=3), decode_story),
+    }
+
+    nodes = statistics.mean(len(n) for _, n in stories)
+    print(f"{args.stories} stories, {nodes:.0f} nodes on average")
+    print(f"{'format':<14} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for name, (encode, decode) in formats.items():
+        sizes, encode_us, decode_us = [], [], []
+        for story, story_nodes in stories:
+            body = encode(story, story_nodes)
+            sizes.append(len(body))
+            encode_us.append(measure(lambda: encode(story, story_nodes), args.repeat))
+            decode_us.append(measure(lambda: decode(body), args.repeat))
+        print(
+            f"{name:<14} {statistics.mean(sizes):>8.0f}"
+            f" {statistics.mean(encode_us):>10.1f} {statistics.mean(decode_us):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--stories", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,153 @@
+"""
+LLM JSON parsing: how many broken answers are saved, and how fast.
+
+Runs the fixed corpus in bench/fixtures/json_repair_corpus.jsonl plus
+seeded random damage (fences, prose, trailing commas, truncation, ...) to
+the recorded stories. Each case goes through the old multi-pass cleanup and
+through StoryGenerator._parse_response. Exits 1 when a corpus case no longer
+parses as expected, or when fewer fuzz cases are saved than before.
+
+    python -m bench.json_repair_bench [--cases 500] [--seed 1]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import PydanticOutputParser
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+# Used unless already set, so a bench run needs no .env. Settings are read
+# on import, and nothing here opens the database.
+BENCH_ENV = {
+    "DEBUG": "false",
+    "DATABASE_URL": "sqlite:///json-repair-bench.db",
+    "SECRET_KEY": "bench-secret-key",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "LLM_BACKEND": "fake",
+}
+for name, value in BENCH_ENV.items():
+    os.environ.setdefault(name, value)
+
+from core.models import StoryLLMResponse  # noqa: E402
+from core.story_generator import StoryGenerator  # noqa: E402
+
+
+def legacy_parse(text: str) -> StoryLLMResponse:
+    """The fence regex / parse / _extract_json / json.loads chain this replaced"""
+    parser = PydanticOutputParser(pydantic_object=StoryLLMResponse)
+    text = re.sub(r"^```json|```$", "", text.strip(), flags=re.MULTILINE)
+    try:
+        return parser.parse(text)
+    except Exception:
+        text = text.strip().replace("```json", "").replace("```", "")
+        start, end = text.find("{"), text.rfind("}")
+        candidate = text[start : end + 1] if start != -1 and end > start else text
+        opened, closed = candidate.count("{"), candidate.count("}")
+        if opened > closed:
+            candidate += "}" * (opened - closed)
+        candidate = re.sub(r",(\s*[}\]])", r"\1", candidate)
+        return StoryLLMResponse.model_validate(json.loads(candidate))
+
+
+def current_parse(text: str) -> StoryLLMResponse:
+    return StoryGenerator._parse_response(AIMessage(content=text))
+
+
+def saved(parse: Callable[[str], StoryLLMResponse], text: str) -> bool:
+    """Parsed, and every nested scene is valid enough to be stored"""
+    try:
+        StoryGenerator._collect_levels(parse(text).rootNode)
+        return True
+    except Exception:
+        return False
+
+
+def damage(text: str, rng: random.Random) -> Tuple[str, str]:
+    kind = rng.choice(
+        ["fenced", "prose", "trailing_commas", "truncated", "truncated_fenced", "missing_commas"]
+    )
+    if kind == "fenced":
+        return kind, f"```json\n{text}\n```"
+    if kind == "prose":
+        return kind, f"Here is the story you asked for:\n{text}\nHave fun!"
+    if kind == "trailing_commas":
+        # `[1, 2,]`, `{"a": 1,}`
+        return kind, re.sub(
+            r'("|\d|true|false|[}\]])(\s*[}\]])', r"\1,\2", text, count=rng.randint(1, 5)
+        )
+    if kind == "missing_commas":
+        return kind, re.sub(r",(\s*\n)", r"\1", text, count=rng.randint(1, 5))
+    cut = text[: rng.randint(len(text) // 3, len(text) - 1)]
+    return kind, f"```json\n{cut}" if kind == "truncated_fenced" else cut
+
+
+def throughput(parse: Callable[[str], StoryLLMResponse], texts: List[str]) -> Tuple[float, float]:
+    started = time.perf_counter()
+    for text in texts:
+        try:
+            parse(text)
+        except Exception:
+            pass
+    elapsed = time.perf_counter() - started
+    size = sum(len(text) for text in texts)
+    return len(texts) / elapsed, size / elapsed / 1e6
+
+
+def main(args) -> int:
+    logging.disable(logging.WARNING)  # every damaged case logs its repair
+    failures = 0
+    with open(FIXTURES / "json_repair_corpus.jsonl") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    for case in corpus:
+        ok = saved(current_parse, case["text"])
+        if ok != (case["expect"] == "ok"):
+            failures += 1
+            print(f"CORPUS {case['name']}: expected {case['expect']}", file=sys.stderr)
+    print(f"corpus: {len(corpus) - failures}/{len(corpus)} as expected")
+
+    with open(FIXTURES / "story_responses.jsonl") as f:
+        stories = [json.dumps(json.loads(line), indent=2) for line in f if line.strip()]
+    rng = random.Random(args.seed)
+    fuzz = [damage(rng.choice(stories), rng) for _ in range(args.cases)]
+
+    print(f"{'damage':18} {'cases':>6} {'legacy':>8} {'repair':>8}")
+    totals = [0, 0]
+    for kind in sorted({kind for kind, _ in fuzz}):
+        texts = [text for k, text in fuzz if k == kind]
+        legacy = sum(saved(legacy_parse, text) for text in texts)
+        current = sum(saved(current_parse, text) for text in texts)
+        totals[0] += legacy
+        totals[1] += current
+        print(f"{kind:18} {len(texts):>6} {legacy:>8} {current:>8}")
+    print(f"{'total':18} {len(fuzz):>6} {totals[0]:>8} {totals[1]:>8}")
+    if totals[1] < totals[0]:
+        failures += 1
+        print("FUZZ repair saves fewer stories than the legacy cleanup", file=sys.stderr)
+
+    # The legacy path is slow on damaged text (langchain's partial-JSON
+    # fallback is quadratic), so timing uses at most 100 damaged cases
+    broken = [text for _, text in fuzz][:100]
+    for label, texts in (("valid", stories * 200), ("damaged", broken)):
+        for name, parse in (("legacy", legacy_parse), ("repair", current_parse)):
+            docs, mb = throughput(parse, texts)
+            print(f"{label:8} {name:7} {docs:10,.0f} docs/s {mb:8.2f} MB/s")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""
+Story history pagination: OFFSET vs keyset (core/story_listing.py).
+
+Seeds a scratch database with `--stories` stories, `--session-stories` of
+them in one session, then times fetching pages at growing depth both ways.
+
+    DATABASE_URL=sqlite:////tmp/list_bench.db python -m bench.list_bench
+
+Point DATABASE_URL at a throwaway database; rows are added to `stories`.
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from core.story_listing import SUMMARY_COLUMNS, encode_cursor, story_page_query
+from db.database import SessionLocal, create_table
+from models.story import Story
+
+SESSION_ID = "bench-session"
+
+
+def seed(total: int, session_stories: int, batch_size: int = 10000):
+    started_at = datetime(2024, 1, 1)
+    with SessionLocal() as db:
+        existing = db.scalar(
+            select(func.count(Story.id)).where(Story.session_id == SESSION_ID)
+        )
+        if existing >= session_stories:
+            return
+
+        for start in range(0, total, batch_size):
+            rows = [
+                {
+                    "title": f"Story {i}",
+                    "session_id": SESSION_ID if i < session_stories else str(uuid.uuid4()),
+                    "theme": "bench",
+                    # Seconds apart with repeats, so ties on created_at occur
+                    "created_at": started_at + timedelta(seconds=i // 3),
+                    "depth": 3,
+                    "node_count": 10,
+                }
+                for i in range(start, min(start + batch_size, total))
+            ]
+            db.execute(insert(Story), rows)
+            db.commit()
+
+
+def timed(db, query, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.execute(query).all()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main(args):
+    create_table()
+    seed(args.stories, args.session_stories)
+
+    print(f"{'page':>8} {'offset ms':>10} {'keyset ms':>10}")
+    with SessionLocal() as db:
+        for page in args.pages:
+            offset = (page - 1) * args.limit
+            offset_query = (
+                select(*SUMMARY_COLUMNS)
+                .where(Story.session_id == SESSION_ID)
+                .order_by(Story.created_at.desc(), Story.id.desc())
+                .offset(offset)
+                .limit(args.limit)
+            )
+
+            cursor = None
+            if offset:
+                # Last row of the previous page, as a client would hold it
+                before = db.execute(
+                    select(Story.created_at, Story.id)
+                    .where(Story.session_id == SESSION_ID)
+                    .order_by(Story.created_at.desc(), Story.id.desc())
+                    .offset(offset - 1)
+                    .limit(1)
+                ).one()
+                cursor = encode_cursor(before.created_at, before.id)
+            keyset_query = story_page_query(Story.session_id, SESSION_ID, cursor, args.limit)
+
+            print(
+                f"{page:>8} {timed(db, offset_query, args.repeat):>10.2f}"
+                f" {timed(db, keyset_query, args.repeat):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--stories", type=int, default=200_000)
+    parser.add_argument("--session-stories", type=int, default=50_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000, 2500])
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,314 @@
+"""
+Admission control for story generation.
+
+`/stories/create` asks `admission` before it queues a job. It checks the
+buckets and the queue budget first and spends the tokens last, so a
+refused request costs the caller nothing:
+
+- token buckets per user and per session limit how fast one client can
+  queue Gemini calls; over the limit is a 429 with Retry-After
+- a global budget caps queued jobs at ADMISSION_QUOTA_MINUTES of the
+  request quota of the usable API keys (about one call per job); over the
+  budget is a 503 with Retry-After set to when the queue should have room.
+  Key health comes from the workers' reports (core.key_health), so it
+  holds with the worker in its own process; with no API key at all every
+  request is a 503
+
+Buckets live in this process by default (ADMISSION_BACKEND=memory). Behind
+several API replicas use ADMISSION_BACKEND=database, so all replicas spend
+from the same buckets. Admitted jobs are shared out fairly between users
+when workers claim them (core.worker.fair_share_order).
+"""
+
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.key_health import usable_jobs_per_second
+from core.metrics import ADMISSION_REJECTIONS
+from core.worker import queue_depth
+from db.database import AsyncSessionLocal
+from models.rate_limit import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+
+def _refill(tokens: float, updated_at: float, rate: float, burst: float, now: float) -> float:
+    return min(burst, tokens + max(now - updated_at, 0.0) * rate)
+
+
+def _wait(tokens: float, rate: float) -> float:
+    """Seconds until a bucket holding `tokens` has a whole one"""
+    return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+
+def _spend(
+    tokens: float, updated_at: float, rate: float, burst: float, now: float
+) -> Tuple[float, float]:
+    """Refill a bucket and take one token: (tokens left, seconds to wait)"""
+    tokens = _refill(tokens, updated_at, rate, burst, now)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, _wait(tokens, rate)
+
+
+class BucketBackend(ABC):
+    """Where the token buckets live"""
+
+    @abstractmethod
+    async def peek(self, key: str, rate: float, burst: float, now: float) -> float:
+        """Seconds until bucket `key` has a token, without taking it"""
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        """
+        Take a token from bucket `key` (refilled at `rate` per second, up to
+        `burst`). Returns 0 if one was taken, else the seconds until one is free.
+        """
+
+    @abstractmethod
+    async def refund(self, key: str, burst: float):
+        """Put back a token taken for a request that was refused after all"""
+
+
+class MemoryBuckets(BucketBackend):
+    """Single process; the least recently used buckets are forgotten"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def peek(self, key: str, rate: float, burst: float, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        return _wait(_refill(tokens, updated_at, rate, burst, now), rate)
+
+    async def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        tokens, updated_at = self._buckets.pop(key, (burst, now))
+        tokens, wait = _spend(tokens, updated_at, rate, burst, now)
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            # A forgotten bucket comes back full, which is where an idle one ends up
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def refund(self, key: str, burst: float):
+        if key in self._buckets:
+            tokens, updated_at = self._buckets[key]
+            self._buckets[key] = (min(burst, tokens + 1), updated_at)
+
+
+class DatabaseBuckets(BucketBackend):
+    """
+    Buckets in the `rate_limit_bucket` table, shared by every API replica.
+    Updates are guarded on the values read, like job claims in core.worker,
+    so two replicas can't spend the same token even without row locks.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, prune_after: float = 3600):
+        self.session_factory = session_factory
+        # Idle buckets are full again long before this and can be dropped
+        self.prune_after = prune_after
+        self._pruned_at = 0.0
+
+    async def peek(self, key: str, rate: float, burst: float, now: float) -> float:
+        async with self.session_factory() as db:
+            row = (await db.execute(
+                select(RateLimitBucket.tokens, RateLimitBucket.updated_at)
+                .where(RateLimitBucket.key == key)
+            )).first()
+        if row is None:
+            return 0.0
+        return _wait(_refill(row.tokens, row.updated_at, rate, burst, now), rate)
+
+    async def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        async with self.session_factory() as db:
+            await self._prune(db, now)
+            for _ in range(5):
+                row = (await db.execute(
+                    select(RateLimitBucket.tokens, RateLimitBucket.updated_at)
+                    .where(RateLimitBucket.key == key)
+                )).first()
+
+                if row is None:
+                    tokens, wait = _spend(burst, now, rate, burst, now)
+                    db.add(RateLimitBucket(key=key, tokens=tokens, updated_at=now))
+                    try:
+                        await db.commit()
+                        return wait
+                    except IntegrityError:
+                        await db.rollback()  # another replica created it first
+                        continue
+
+                tokens, wait = _spend(row.tokens, row.updated_at, rate, burst, now)
+                updated = (await db.execute(
+                    update(RateLimitBucket)
+                    .where(
+                        RateLimitBucket.key == key,
+                        RateLimitBucket.tokens == row.tokens,
+                        RateLimitBucket.updated_at == row.updated_at,
+                    )
+                    # Replica clocks differ a little; never move a bucket back
+                    .values(tokens=tokens, updated_at=max(now, row.updated_at))
+                )).rowcount
+                await db.commit()
+                if updated:
+                    return wait
+
+        # Lost every race on this bucket; let the request in rather than fail it
+        logger.warning("Rate limit bucket %s is contended, admitting", key)
+        return 0.0
+
+    async def refund(self, key: str, burst: float):
+        async with self.session_factory() as db:
+            # One UPDATE, so it can't overwrite a concurrent take
+            await db.execute(
+                update(RateLimitBucket)
+                .where(RateLimitBucket.key == key)
+                .values(
+                    tokens=case(
+                        (RateLimitBucket.tokens + 1 > burst, burst),
+                        else_=RateLimitBucket.tokens + 1,
+                    )
+                )
+            )
+            await db.commit()
+
+    async def _prune(self, db: AsyncSession, now: float):
+        if now - self._pruned_at < self.prune_after / 10:
+            return
+        self._pruned_at = now
+        await db.execute(
+            delete(RateLimitBucket).where(RateLimitBucket.updated_at < now - self.prune_after)
+        )
+        await db.commit()
+
+
+def create_backend(name: str) -> BucketBackend:
+    if name == "memory":
+        return MemoryBuckets()
+    if name == "database":
+        return DatabaseBuckets()
+    raise ValueError(f"Unknown ADMISSION_BACKEND {name!r}")
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        backend: BucketBackend,
+        user_rate_per_minute: float,
+        user_burst: float,
+        session_rate_per_minute: float,
+        session_burst: float,
+        quota_minutes: float,
+        max_queue_depth: int,
+    ):
+        self.backend = backend
+        # (rate per second, burst) per scope; a zero rate disables the limit
+        self.limits = {
+            "user": (user_rate_per_minute / 60, user_burst),
+            "session": (session_rate_per_minute / 60, session_burst),
+        }
+        self.quota_minutes = quota_minutes
+        self.max_queue_depth = max_queue_depth
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"user": 0, "session": 0, "global": 0}
+
+    def _buckets(
+        self, user_id: Optional[str], session_id: Optional[str]
+    ) -> List[Tuple[str, str, float, float]]:
+        """(scope, bucket key, rate, burst) of each limit that applies"""
+        buckets = []
+        for scope, owner in (("user", user_id), ("session", session_id)):
+            rate, burst = self.limits[scope]
+            if owner and rate > 0:
+                buckets.append((scope, f"{scope}:{owner}", rate, burst))
+        return buckets
+
+    async def check_rate(self, user_id: Optional[str], session_id: Optional[str]):
+        """Raise 429 if the user or session bucket is empty, spending nothing"""
+        now = time.time()
+        for scope, key, rate, burst in self._buckets(user_id, session_id):
+            wait = await self.backend.peek(key, rate, burst, now)
+            if wait > 0:
+                self._reject(scope, 429, wait, "Too many stories requested, please slow down")
+
+    async def admit(self, user_id: Optional[str], session_id: Optional[str]):
+        """
+        Spend a token from the caller's user and session buckets, or raise
+        429. Call it once every other check has passed; when one bucket
+        refuses, the tokens already taken from the others are put back.
+        """
+        await self.check_rate(user_id, session_id)
+        now = time.time()
+        taken: List[Tuple[str, float]] = []
+        for scope, key, rate, burst in self._buckets(user_id, session_id):
+            wait = await self.backend.take(key, rate, burst, now)
+            if wait > 0:  # a concurrent request took the last token
+                for taken_key, taken_burst in taken:
+                    await self.backend.refund(taken_key, taken_burst)
+                self._reject(scope, 429, wait, "Too many stories requested, please slow down")
+            taken.append((key, burst))
+        self.admitted += 1
+
+    async def budget(self, db: AsyncSession) -> Tuple[int, float]:
+        """
+        The most jobs that may be queued, and the jobs per second the keys
+        whose circuit is closed can start (core.key_health)
+        """
+        per_second = await usable_jobs_per_second(db)
+        limit = min(self.max_queue_depth, int(per_second * 60 * self.quota_minutes))
+        return limit, per_second
+
+    async def check_capacity(self, db: AsyncSession):
+        """Raise 503 when the queue already holds as much as the keys can serve"""
+        limit, per_second = await self.budget(db)
+        depth = await queue_depth(db)
+        if depth >= limit:
+            # Time for the excess to drain at the usable keys' rate
+            wait = (
+                (depth - limit + 1) / per_second
+                if per_second
+                else settings.JOB_QUEUE_RETRY_AFTER_SECONDS
+            )
+            self._reject(
+                "global", 503, wait, "Story generation queue is full, please try again shortly"
+            )
+
+    def _reject(self, scope: str, status_code: int, wait: float, detail: str):
+        self.rejected[scope] += 1
+        ADMISSION_REJECTIONS.labels(scope).inc()
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(math.ceil(wait), 1))},
+        )
+
+    async def stats(self, db: AsyncSession) -> Dict:
+        limit, per_second = await self.budget(db)
+        return {
+            "backend": type(self.backend).__name__,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "queue_limit": limit,
+            "key_jobs_per_minute": round(per_second * 60, 2),
+        }
+
+
+admission = AdmissionController(
+    create_backend(settings.ADMISSION_BACKEND),
+    user_rate_per_minute=settings.ADMISSION_USER_RATE_PER_MINUTE,
+    user_burst=settings.ADMISSION_USER_BURST,
+    session_rate_per_minute=settings.ADMISSION_SESSION_RATE_PER_MINUTE,
+    session_burst=settings.ADMISSION_SESSION_BURST,
+    quota_minutes=settings.ADMISSION_QUOTA_MINUTES,
+    max_queue_depth=settings.JOB_QUEUE_MAX_DEPTH,
+)
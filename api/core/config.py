@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import SecretStr, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -12,13 +12,133 @@ class Settings(BaseSettings):
     SECRET_KEY: SecretStr
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    # Verified JWTs remembered until they expire (utils/auth.py)
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    # Argon2 process pool (utils/password_hashing.py); 0 hashes on the
+    # threadpool, unset leaves one CPU for the API (at least one process)
+    AUTH_HASH_WORKERS: Optional[int] = None
+    # Niceness added to the hashing processes, so requests get the CPU first
+    AUTH_HASH_NICE: int = 10
+    AUTH_HASH_MAX_PENDING: int = 64
+    # Derived from DATABASE_URL (asyncpg / aiosqlite) when not set
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # Connection pools (db/database.py); API requests and story generation
+    # each get their own, sized by DB_* and WORKER_DB_* respectively
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30
+    # Reconnect before load balancers or the server drop idle connections
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    WORKER_DB_POOL_SIZE: int = 10
+    WORKER_DB_MAX_OVERFLOW: int = 20
+    # Read replicas for read-only routes; a replica further behind than
+    # DATABASE_REPLICA_MAX_LAG_SECONDS is skipped in favour of the primary
+    DATABASE_REPLICA_URLS: List[str] = []
+    DATABASE_REPLICA_MAX_LAG_SECONDS: float = 5
+    DATABASE_REPLICA_LAG_CHECK_SECONDS: float = 5
+    # A replica that doesn't answer the lag query within this is skipped
+    DATABASE_REPLICA_LAG_TIMEOUT_SECONDS: float = 1
+
+    # "gemini" or "fake" (canned stories, no network) for offline load tests
+    LLM_BACKEND: str = "gemini"
+    FAKE_LLM_LATENCY_SECONDS: float = 2.0
+    # Fraction of fake calls that fail with a 429, to exercise the key pool
+    FAKE_LLM_RATE_LIMIT_RATE: float = 0.0
+    # Fraction of fake calls that fail with a 503
+    FAKE_LLM_FAILURE_RATE: float = 0.0
+    # JSON lines of StoryLLMResponse replayed by the fake (bench/fixtures/)
+    FAKE_LLM_RESPONSES_PATH: Optional[str] = None
+    # Overrides the Gemini API host (regional endpoint, proxy, local fake)
+    GOOGLE_API_ENDPOINT: Optional[str] = None
+
+    # Gemini API key pool (core/llm_pool.py)
+    LLM_KEY_REQUESTS_PER_MINUTE: float = 60
+    LLM_KEY_COOLDOWN_SECONDS: float = 30
+    LLM_KEY_FAILURE_THRESHOLD: int = 5
+    LLM_KEY_CIRCUIT_OPEN_SECONDS: float = 60
+    LLM_ACQUIRE_TIMEOUT_SECONDS: float = 60
+    LLM_CLIENT_MAX_RETRIES: int = 1
+    # Workers write their keys' health this often, for the API's queue budget
+    LLM_KEY_HEALTH_REPORT_SECONDS: float = 10
+    # "prompt" puts the JSON schema in the prompt; "structured" uses Gemini's
+    # JSON mode with a response schema (core/llm_schema.py) and a shorter prompt
+    LLM_OUTPUT_MODE: str = "prompt"
+    # "batch" parses the whole story first, "stream" writes nodes as they
+    # arrive, "lazy" writes the opening and generates branches on demand
+    GENERATION_MODE: str = "batch"
+    LAZY_MAX_DEPTH: int = 6
+    LAZY_BRANCH_LEVELS: int = 2
+    LAZY_PREFETCH_COUNT: int = 1
+
+    # Story generation worker
+    WORKER_CONCURRENCY: int = 32
+    WORKER_POLL_INTERVAL_SECONDS: float = 1.0
+    WORKER_STALE_JOB_SECONDS: int = 600
+    JOB_QUEUE_MAX_DEPTH: int = 200
+    JOB_QUEUE_RETRY_AFTER_SECONDS: int = 30
+    # Failed jobs are retried with jittered exponential backoff (core/retry.py)
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BASE_SECONDS: float = 2.0
+    JOB_RETRY_MAX_SECONDS: float = 60.0
+    # Share of worker slots for a user id while jobs are waiting (default 1)
+    JOB_USER_WEIGHTS: Dict[str, float] = {}
+    RUN_EMBEDDED_WORKER: bool = False
+    # Serve Prometheus metrics from `python -m core.worker` on this port
+    WORKER_METRICS_PORT: Optional[int] = None
+
+    # Admission control for /stories/create (core/admission.py): token
+    # buckets per user and per session (a rate of 0 turns one off), kept in
+    # "memory" or in the "database" when several API replicas share them
+    ADMISSION_BACKEND: str = "memory"
+    ADMISSION_USER_RATE_PER_MINUTE: float = 6
+    ADMISSION_USER_BURST: int = 10
+    ADMISSION_SESSION_RATE_PER_MINUTE: float = 6
+    ADMISSION_SESSION_BURST: int = 10
+    # Queued jobs are capped at this many minutes of the usable keys' quota
+    ADMISSION_QUOTA_MINUTES: float = 5
+
+    # Player progress (core/progress.py) is buffered and written in batches
+    # every PROGRESS_FLUSH_INTERVAL_MS, or once PROGRESS_FLUSH_MAX_EVENTS wait
+    PROGRESS_FLUSH_INTERVAL_MS: int = 500
+    PROGRESS_FLUSH_MAX_EVENTS: int = 200
+    # Kept while the database is unreachable; older moves are dropped
+    PROGRESS_MAX_PENDING: int = 50000
+
+    # Serialized complete-story responses
+    STORY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    STORY_CACHE_TTL_SECONDS: int = 3600
+
+    # Pre-generated stories per normalized theme (core/variant_cache.py).
+    # Players asking for the same theme may get the same story.
+    STORY_VARIANT_CACHE_ENABLED: bool = False
+    STORY_VARIANTS_PER_THEME: int = 3
+    STORY_VARIANT_CACHE_MAX_THEMES: int = 256
+    STORY_VARIANT_TTL_SECONDS: int = 24 * 3600
+    # Without the variant cache: overlapping requests for the same theme
+    # share one Gemini call, so those players get the same story
+    STORY_COALESCE_GENERATION: bool = False
+
+    # Completed stories kept ready per theme so /stories/create can return
+    # at once (core/warm_pool.py). Refilled by workers when the queue is quiet.
+    WARM_POOL_THEMES: List[str] = []
+    WARM_POOL_TARGET_PER_THEME: int = 5
+    WARM_POOL_REFILL_PER_MINUTE: float = 6
+    WARM_POOL_REFILL_INTERVAL_SECONDS: float = 30
+    WARM_POOL_MAX_QUEUE_DEPTH: int = 2
 
     # Use model_config instead of the deprecated Config inner class
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", case_sensitive=True
     )
 
-    @field_validator("ALLOWED_ORIGINS", "GOOGLE_API_KEYS", mode="before")
+    @field_validator(
+        "ALLOWED_ORIGINS",
+        "GOOGLE_API_KEYS",
+        "WARM_POOL_THEMES",
+        "DATABASE_REPLICA_URLS",
+        mode="before",
+    )
     def parse_list_from_str(cls, v):
         if isinstance(v, str):
             # The split() method handles the case of an empty string correctly
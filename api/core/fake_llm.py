@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from core.models import StoryLLMResponse
+
+
+@functools.lru_cache(maxsize=None)
+def load_canned_responses(path: str) -> Tuple[str, ...]:
+    """
+    Read recorded StoryLLMResponse objects, one JSON document per line,
+    so the fake can replay real model output instead of synthetic stories.
+    """
+    responses = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                responses.append(StoryLLMResponse.model_validate_json(line).model_dump_json())
+    if not responses:
+        raise ValueError(f"No canned story responses in {path}")
+    return tuple(responses)
+
+
+class FakeStoryLLM:
+    """
+    Stand-in for ChatGoogleGenerativeAI that answers with a canned story
+    after a fixed latency. Used with LLM_BACKEND=fake to measure worker
+    throughput without network access or API quota.
+
+    `responses` are full-story JSON strings replayed in turn; without them
+    stories are made up from the theme. `failure_rate` of calls fail like
+    a Gemini outage (503), `rate_limit_rate` like an exhausted key (429).
+    """
+
+    def __init__(
+        self,
+        latency: float = 2.0,
+        depth: int = 3,
+        seed: Optional[int] = None,
+        rate_limit_rate: float = 0.0,
+        failure_rate: float = 0.0,
+        responses: Sequence[str] = (),
+    ):
+        self.latency = latency
+        self.depth = depth
+        self.rate_limit_rate = rate_limit_rate
+        self.failure_rate = failure_rate
+        self.responses = responses
+        self._random = random.Random(seed)
+        self._replayed = 0
+
+    def invoke(self, prompt: Any, **kwargs: Any) -> AIMessage:
+        time.sleep(self.latency)
+        self._maybe_fail()
+        return AIMessage(content=self._story_json(prompt))
+
+    async def ainvoke(self, prompt: Any, **kwargs: Any) -> AIMessage:
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        return AIMessage(content=self._story_json(prompt))
+
+    async def astream(
+        self, prompt: Any, chunk_size: int = 64, **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        """Emit the story in chunks spread evenly over `latency`"""
+        self._maybe_fail()
+        story_json = self._story_json(prompt)
+        chunks = [
+            story_json[i : i + chunk_size] for i in range(0, len(story_json), chunk_size)
+        ]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield AIMessageChunk(content=chunk)
+
+    def _maybe_fail(self):
+        if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+            raise ResourceExhausted("429 Resource has been exhausted (fake)")
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise ServiceUnavailable("The model is overloaded (fake)")
+
+    def _story_json(self, prompt: Any) -> str:
+        theme = self._theme(prompt)
+        system_prompt = self._system_prompt(prompt)
+
+        if "Write the scene that follows" in system_prompt:
+            # Lazy branch: a short subtree with open options at the bottom
+            return json.dumps(self._node(theme, level=1, path="b", lazy_after=2))
+
+        lazy_after = 1 if "Write only the opening scene" in system_prompt else None
+        if self.responses and lazy_after is None:
+            response = self.responses[self._replayed % len(self.responses)]
+            self._replayed += 1
+            return response
+
+        story = {
+            "title": f"A {theme} adventure",
+            "rootNode": self._node(theme, level=1, path="1", lazy_after=lazy_after),
+        }
+        return json.dumps(story)
+
+    def _node(
+        self, theme: str, level: int, path: str, lazy_after: Optional[int] = None
+    ) -> Dict[str, Any]:
+        is_ending = lazy_after is None and level >= self.depth
+        is_ending = is_ending or (level > 1 and self._random.random() < 0.25)
+        node: Dict[str, Any] = {
+            "content": f"Scene {path} of a {theme} story.",
+            "isEnding": is_ending,
+            "isWinningEnding": is_ending and path.endswith("1"),
+            "options": [],
+        }
+        if not is_ending:
+            for index in range(1, self._random.randint(2, 3) + 1):
+                child_path = f"{path}.{index}"
+                option: Dict[str, Any] = {"text": f"Choose path {child_path}"}
+                if lazy_after is None or level < lazy_after:
+                    option["nextNode"] = self._node(theme, level + 1, child_path, lazy_after)
+                node["options"].append(option)
+        return node
+
+    @staticmethod
+    def _system_prompt(prompt: Any) -> str:
+        messages = prompt.to_messages() if hasattr(prompt, "to_messages") else []
+        return "".join(str(m.content) for m in messages if m.type == "system")
+
+    @staticmethod
+    def _theme(prompt: Any) -> str:
+        messages = prompt.to_messages() if hasattr(prompt, "to_messages") else []
+        for message in reversed(messages):
+            marker = "theme:"
+            content = str(message.content)
+            if marker in content:
+                return content.split(marker, 1)[1].strip()
+        return "fantasy"
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.story_cache import invalidate_story
+from models.job import StoryJob
+from schemas.job import StoryJobResponse
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "story_job_events"
+# Payload is the id of a story whose nodes changed (lazy branches)
+STORY_CHANNEL = "story_changed"
+ACTIVE_STATUSES = ("pending", "processing")
+TERMINAL_STATUSES = ("completed", "failed")
+
+# NOTIFY payloads are capped at 8000 bytes
+MAX_ERROR_LENGTH = 2000
+
+
+def job_event(job: StoryJob, **changes: Any) -> Dict[str, Any]:
+    """The job as it is returned by GET /jobs/{job_id}"""
+    event = StoryJobResponse.model_validate(job).model_dump(mode="json")
+    event.update(changes)
+    if event.get("error"):
+        event["error"] = event["error"][:MAX_ERROR_LENGTH]
+    return event
+
+
+class JobEventBus:
+    """
+    Wakes requests waiting on a job when it changes.
+
+    On Postgres, events go through LISTEN/NOTIFY so API replicas hear
+    about jobs finished by a separate worker process. Other databases only
+    notify waiters in the process that ran the job (embedded worker).
+
+    Story changes travel the same way, so every API process drops its
+    cached copy of a story another process added branches to.
+    """
+
+    def __init__(self, database_url: str):
+        self.use_postgres = make_url(database_url).get_backend_name() == "postgresql"
+        self._database_url = database_url
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers[job_id].add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(job_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[job_id]
+
+    def publish(self, event: Dict[str, Any]):
+        for queue in self._subscribers.get(event["job_id"], ()):
+            queue.put_nowait(event)
+
+    async def commit(self, db: AsyncSession, event: Dict[str, Any]):
+        """
+        Commit the session and announce the job change. On Postgres the
+        NOTIFY rides in the same transaction, so it is only delivered if
+        the change is committed.
+        """
+        if self.use_postgres:
+            await db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": json.dumps(event)},
+            )
+        await db.commit()
+        if not self.use_postgres:
+            self.publish(event)
+
+    async def story_changed(self, db: AsyncSession, story_id: int, commit: bool = True):
+        """
+        Commit the session and drop the story from every process's cache.
+        With `commit=False` the caller commits, and other processes hear
+        of it then. Without Postgres only this process's cache is
+        invalidated.
+        """
+        if self.use_postgres:
+            await db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": STORY_CHANNEL, "payload": str(story_id)},
+            )
+        if commit:
+            await db.commit()
+        invalidate_story(story_id)
+
+    async def listen(self, reconnect_delay: float = 5.0):
+        """
+        Forward Postgres notifications to local subscribers, and story
+        changes to the local cache, until cancelled
+        """
+        import asyncpg
+
+        url = make_url(self._database_url)
+        while True:
+            try:
+                conn = await asyncpg.connect(
+                    user=url.username,
+                    password=url.password,
+                    host=url.host,
+                    port=url.port,
+                    database=url.database,
+                )
+            except Exception:
+                logger.exception("Job event listener could not connect")
+                await asyncio.sleep(reconnect_delay)
+                continue
+
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda _: closed.set())
+            try:
+                await conn.add_listener(
+                    CHANNEL, lambda _conn, _pid, _channel, payload: self.publish(json.loads(payload))
+                )
+                await conn.add_listener(
+                    STORY_CHANNEL,
+                    lambda _conn, _pid, _channel, payload: invalidate_story(int(payload)),
+                )
+                await closed.wait()
+                logger.warning("Job event listener lost its connection")
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(reconnect_delay)
+
+
+job_events = JobEventBus(settings.DATABASE_URL)
@@ -0,0 +1,128 @@
+"""
+Single-pass repair of malformed JSON from the LLM.
+
+A tolerant `JSONStreamParser`: one left-to-right pass over the text, with
+the open containers on a stack, builds the value while fixing what models
+get wrong:
+
+- prose or markdown fences around the JSON, which are skipped
+- trailing or missing commas, and a missing colon after a key
+- stray characters and invalid literals between values, which are dropped
+- a `}` or `]` that closes the wrong container, which also closes the inner ones
+- unpaired `\\uD83D`-style surrogates, which become U+FFFD
+- output cut off mid-way: the open string, array and objects are closed
+  (a key with no value is dropped) and `truncated` is set
+"""
+
+from typing import Any, List, NamedTuple
+
+from core.json_stream import Event, JSONStreamError, JSONStreamParser
+
+
+class RepairedJSON(NamedTuple):
+    value: Any
+    # Problems fixed; prose and trailing commas aren't counted
+    repairs: int
+    # The text ended before the root value was closed
+    truncated: bool
+
+
+class JSONRepairParser(JSONStreamParser):
+    def __init__(self, starts: str = "{["):
+        super().__init__()
+        # Text before the first of these is skipped, so "[draft]" in the
+        # prose can't be taken for the value when an object is expected
+        self.starts = starts
+        self.repairs = 0
+        self.truncated = False
+
+    def finish(self) -> List[Event]:
+        """Close whatever the text left open; returns the events this completes"""
+        self._events = []
+        if self.done or not self._started:
+            return self._events
+
+        self.truncated = True
+        self.repairs += 1
+        if self._string is not None:
+            frame = self._stack[-1] if self._stack else None
+            if frame is not None and frame.is_object and frame.expect == "key":
+                self._string = None  # a cut-off key has no value to keep
+            else:
+                self._escape = None
+                self._end_string()
+        if self._token:
+            self._end_token()
+        while self._stack:
+            self._close("}" if self._stack[-1].is_object else "]")
+        return self._events
+
+    def _read_char(self, char: str):
+        if not self._started and char not in self.starts:
+            return
+        try:
+            super()._read_char(char)
+        except JSONStreamError:
+            # Stray character between values (quotes, comments, ...)
+            self.repairs += 1
+
+    def _end_token(self):
+        try:
+            super()._end_token()
+        except JSONStreamError:
+            # "tru", "1.", "None": drop it along with its key
+            self.repairs += 1
+            self._skip_value()
+
+    def _close(self, char: str):
+        is_object = char == "}"
+        if not any(frame.is_object == is_object for frame in self._stack):
+            self.repairs += 1
+            return
+        while self._stack[-1].is_object != is_object:
+            self.repairs += 1
+            super()._close("}" if self._stack[-1].is_object else "]")
+        super()._close(char)
+
+    def _add_value(self, value: Any, scalar: bool):
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame.is_object and frame.expect != "value":
+            self.repairs += 1
+            if frame.expect == "colon":
+                frame.expect = "value"  # "key" value, the colon went missing
+            else:
+                # A value with no key: parsed, but kept out of the result
+                return
+        super()._add_value(value, scalar)
+
+    def _end_string(self):
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame.is_object and frame.expect == "comma":
+            self.repairs += 1
+            frame.expect = "key"  # `{"a": 1 "b": 2}`
+        super()._end_string()
+
+    def _lone_surrogate(self, code: int):
+        # Half an emoji can't be stored as UTF-8; keep a visible placeholder
+        self.repairs += 1
+        self._string.append("\ufffd")  # type: ignore
+
+    def _invalid_escape(self, escape: str):
+        self.repairs += 1
+        self._string.append(escape[1:])  # type: ignore  # "\\uZZ" -> "ZZ"
+
+    def _skip_value(self):
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame.is_object:
+            frame.key = None
+            frame.expect = "comma"
+
+
+def repair_json(text: str, starts: str = "{[") -> RepairedJSON:
+    """Parse `text` as JSON, fixing it up where needed"""
+    parser = JSONRepairParser(starts)
+    parser.feed(text)
+    parser.finish()
+    if not parser._started:
+        raise JSONStreamError("No JSON value found")
+    return RepairedJSON(parser.root, parser.repairs, parser.truncated)
@@ -0,0 +1,239 @@
+"""
+Incremental JSON parser for LLM output.
+
+Text is pushed in chunks as the model streams it, and the parser reports
+what it has seen so far as events:
+
+    ("start_map", path, dict)     an object opened at `path`
+    ("end_map", path, dict)       the object at `path` is complete
+    ("start_array", path, list)   an array opened at `path`
+    ("end_array", path, list)     the array at `path` is complete
+    ("value", path, value)        a string, number, bool or null is complete
+
+`path` is a tuple of object keys and array indexes from the root. The
+containers in start events are the same objects that are filled in as
+parsing continues, so a consumer can keep a reference to them.
+
+Anything before the first `{` or `[` (prose, markdown fences) and after
+the root value is ignored.
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+Path = Tuple[Any, ...]
+Event = Tuple[str, Path, Any]
+
+_WHITESPACE = " \t\r\n"
+_TOKEN_CHARS = set("-+.0123456789eEtrufalsn")
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+class _Frame:
+    __slots__ = ("path", "container", "is_object", "key", "expect")
+
+    def __init__(self, path: Path, container: Any, is_object: bool):
+        self.path = path
+        self.container = container
+        self.is_object = is_object
+        self.key: Optional[str] = None
+        # object: "key" | "colon" | "value" | "comma"; array: "value" | "comma"
+        self.expect = "key" if is_object else "value"
+
+
+class JSONStreamParser:
+    def __init__(self):
+        self.root: Any = None
+        self.done = False
+        self._started = False
+        self._stack: List[_Frame] = []
+        self._events: List[Event] = []
+        self._string: Optional[List[str]] = None
+        self._escape: Optional[str] = None
+        # High half of a UTF-16 surrogate pair, waiting for the low half
+        self._high_surrogate: Optional[int] = None
+        self._token: List[str] = []
+
+    def feed(self, text: str) -> List[Event]:
+        """Parse the next chunk and return the events it completed"""
+        self._events = []
+        for char in text:
+            if self.done:
+                break
+            if self._string is not None:
+                self._read_string_char(char)
+            elif self._token and char not in _TOKEN_CHARS:
+                self._end_token()
+                self._read_char(char)
+            else:
+                self._read_char(char)
+        return self._events
+
+    @property
+    def path(self) -> Path:
+        """Path of the value currently being read"""
+        if not self._stack:
+            return ()
+        return self._child_path(self._stack[-1])
+
+    def _read_char(self, char: str):
+        if not self._started:
+            if char in "{[":
+                self._started = True
+            else:
+                return
+
+        if char in _WHITESPACE:
+            return
+        if char in _TOKEN_CHARS:
+            self._token.append(char)
+            return
+
+        frame = self._stack[-1] if self._stack else None
+        if char == '"':
+            self._string = []
+        elif char == "{":
+            self._open(True)
+        elif char == "[":
+            self._open(False)
+        elif char in "}]":
+            self._close(char)
+        elif char == "," and frame is not None:
+            frame.expect = "key" if frame.is_object else "value"
+        elif char == ":" and frame is not None and frame.expect == "colon":
+            frame.expect = "value"
+        else:
+            raise JSONStreamError(f"Unexpected character {char!r} at {self.path}")
+
+    def _read_string_char(self, char: str):
+        string = self._string
+        assert string is not None
+
+        if self._escape is not None:
+            if self._escape == "":
+                if char == "u":
+                    self._escape = "u"
+                    return
+                self._end_surrogate_pair()
+                string.append(_ESCAPES.get(char, char))
+                self._escape = None
+                return
+            # Collecting \uXXXX
+            self._escape += char
+            if len(self._escape) == 5:
+                escape, self._escape = self._escape, None
+                if _HEX_DIGITS.issuperset(escape[1:]):
+                    self._add_code_unit(int(escape[1:], 16))
+                else:
+                    self._invalid_escape(escape)
+            return
+
+        if char == "\\":
+            self._escape = ""
+            return
+        self._end_surrogate_pair()
+        if char == '"':
+            self._end_string()
+        else:
+            string.append(char)
+
+    def _add_code_unit(self, code: int):
+        """
+        Append a decoded \\uXXXX. Characters outside the BMP (emoji) arrive
+        as a high and a low surrogate, which are joined into one character.
+        """
+        high = self._high_surrogate
+        if high is not None and 0xDC00 <= code <= 0xDFFF:
+            self._high_surrogate = None
+            self._string.append(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)))  # type: ignore
+            return
+        self._end_surrogate_pair()
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+        elif 0xDC00 <= code <= 0xDFFF:
+            self._lone_surrogate(code)
+        else:
+            self._string.append(chr(code))  # type: ignore
+
+    def _end_surrogate_pair(self):
+        """A high surrogate not followed by its low half can't be encoded"""
+        if self._high_surrogate is not None:
+            code, self._high_surrogate = self._high_surrogate, None
+            self._lone_surrogate(code)
+
+    def _lone_surrogate(self, code: int):
+        raise JSONStreamError(f"Unpaired surrogate \\u{code:04x} at {self.path}")
+
+    def _invalid_escape(self, escape: str):
+        raise JSONStreamError(f"Invalid escape \\{escape} at {self.path}")
+
+    def _end_string(self):
+        self._end_surrogate_pair()
+        value = "".join(self._string or [])
+        self._string = None
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame.is_object and frame.expect == "key":
+            frame.key = value
+            frame.expect = "colon"
+        else:
+            self._add_value(value, scalar=True)
+
+    def _end_token(self):
+        token = "".join(self._token)
+        self._token = []
+        try:
+            value = json.loads(token)
+        except ValueError:
+            raise JSONStreamError(f"Invalid literal {token!r} at {self.path}")
+        self._add_value(value, scalar=True)
+
+    def _open(self, is_object: bool):
+        path = self.path
+        container: Any = {} if is_object else []
+        self._add_value(container, scalar=False)
+        self._stack.append(_Frame(path, container, is_object))
+        self._events.append(("start_map" if is_object else "start_array", path, container))
+
+    def _close(self, char: str):
+        if not self._stack:
+            raise JSONStreamError(f"Unexpected {char!r}")
+        frame = self._stack.pop()
+        if frame.is_object != (char == "}"):
+            raise JSONStreamError(f"Mismatched {char!r} at {frame.path}")
+        self._events.append(("end_map" if frame.is_object else "end_array", frame.path, frame.container))
+        if not self._stack:
+            self.done = True
+
+    def _add_value(self, value: Any, scalar: bool):
+        if not self._stack:
+            self.root = value
+            if scalar:
+                self.done = True
+            return
+
+        frame = self._stack[-1]
+        path = self._child_path(frame)
+        if frame.is_object:
+            if frame.expect != "value" or frame.key is None:
+                raise JSONStreamError(f"Value without a key at {frame.path}")
+            frame.container[frame.key] = value
+        else:
+            frame.container.append(value)
+        frame.expect = "comma"
+
+        if scalar:
+            self._events.append(("value", path, value))
+
+    @staticmethod
+    def _child_path(frame: _Frame) -> Path:
+        if frame.is_object:
+            return frame.path + (frame.key,)
+        if frame.expect == "comma":
+            # The last appended item is the one being read
+            return frame.path + (len(frame.container) - 1,)
+        return frame.path + (len(frame.container),)
@@ -0,0 +1,82 @@
+"""
+Gemini key health, shared by the worker and the API.
+
+Keys are leased by the worker's LLMClientPool, usually in another process
+than the API (`python -m core.worker`). Each worker writes what its pool
+knows about every key to `llm_key_health` every
+LLM_KEY_HEALTH_REPORT_SECONDS, and the API budgets the story queue
+(core.admission) from those rows.
+"""
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.llm_pool import LLMClientPool, configured_api_keys, get_llm_pool
+from models.rate_limit import LLMKeyHealth
+
+logger = logging.getLogger(__name__)
+
+# Reports from a worker that stopped this many intervals ago are ignored
+STALE_AFTER_REPORTS = 3
+
+
+async def report_key_health(db: AsyncSession, pool: LLMClientPool):
+    """Write the pool's key rates and circuit state; the pool clock is monotonic"""
+    wall, monotonic = time.time(), time.monotonic()
+    for state in pool.keys:
+        circuit_open_for = state.circuit_open_until - monotonic
+        await db.merge(
+            LLMKeyHealth(
+                key=state.key_id,
+                jobs_per_second=state.refill_per_second,
+                circuit_open_until=wall + circuit_open_for if circuit_open_for > 0 else 0.0,
+                reported_at=wall,
+            )
+        )
+    await db.commit()
+
+
+async def run_key_health_reports(session_factory, stop: asyncio.Event):
+    """Report this worker's key health until `stop` is set"""
+    try:
+        pool = get_llm_pool()
+    except ValueError as e:
+        logger.error("Not reporting LLM key health: %s", e)
+        return
+
+    while not stop.is_set():
+        try:
+            async with session_factory() as db:
+                await report_key_health(db, pool)
+        except Exception:
+            logger.exception("Failed to report LLM key health")
+        try:
+            await asyncio.wait_for(stop.wait(), settings.LLM_KEY_HEALTH_REPORT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def usable_jobs_per_second(db: AsyncSession) -> float:
+    """
+    Jobs per second the keys whose circuit is closed can start, from the
+    workers' latest reports. Keys that are only cooling down after a 429
+    still count; their quota comes back within a minute. Until a worker has
+    reported, every configured key counts, and without keys this is 0.
+    """
+    now = time.time()
+    fresh_after = now - STALE_AFTER_REPORTS * settings.LLM_KEY_HEALTH_REPORT_SECONDS
+    rows = (
+        await db.execute(
+            select(LLMKeyHealth.jobs_per_second, LLMKeyHealth.circuit_open_until).where(
+                LLMKeyHealth.reported_at >= fresh_after
+            )
+        )
+    ).all()
+    if rows:
+        return sum(row.jobs_per_second for row in rows if row.circuit_open_until <= now)
+    return len(configured_api_keys()) * settings.LLM_KEY_REQUESTS_PER_MINUTE / 60
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import weakref
+from typing import Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.job_events import job_events
+from core.models import StoryNodeLLM
+from core.progress import most_chosen_first
+from core.story_analytics import refresh_story_metrics
+from core.story_graph import link_option, path_to_node
+from core.story_generator import StoryGenerator
+from db.database import WorkerSessionLocal
+from models.story import Story, StoryNode
+
+logger = logging.getLogger(__name__)
+
+
+class BranchExpander:
+    """
+    Generates lazy story branches when a player picks an option that has
+    no `node_id` yet, and speculatively prefetches the next choices.
+
+    The parent row is locked before linking, so each option gets one
+    branch however many processes expand it: a branch that lost the race
+    is rolled back. The per-process locks only spare duplicate LLM calls.
+
+    No node is written below LAZY_MAX_DEPTH: nodes at that level become
+    endings whatever the LLM wrote.
+    """
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[Tuple[int, int], asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+        self._prefetches: Set[asyncio.Task] = set()
+
+    async def choose(
+        self, db: AsyncSession, story_id: int, node_id: int, option_index: int
+    ) -> StoryNode:
+        """Return the node behind an option, generating it if needed"""
+        parent = await self._get_node(db, story_id, node_id)
+        options = parent.options or []
+        if not 0 <= option_index < len(options):
+            raise HTTPException(status_code=400, detail="Invalid option index")
+
+        child_id = options[option_index].get("node_id")
+        if child_id is None:
+            child_id = await self.expand(db, story_id, node_id, option_index)
+
+        child = await self._get_node(db, story_id, child_id)
+        if any(option.get("node_id") is None for option in child.options or []):
+            self.schedule_prefetch(story_id, child.id)  # type: ignore
+        return child
+
+    async def expand(
+        self, db: AsyncSession, story_id: int, node_id: int, option_index: int
+    ) -> int:
+        """Generate and link the branch behind an option, returning its node id"""
+        key = (node_id, option_index)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+
+        async with lock:
+            parent = await self._get_node(db, story_id, node_id, refresh=True)
+            existing = parent.options[option_index].get("node_id")
+            if existing is not None:
+                return existing
+
+            story = await db.get(Story, story_id)
+            path = [
+                (node.content, edge.text) for node, edge in await path_to_node(db, node_id)
+            ]
+            choice = parent.options[option_index]["text"]
+            history = [*path, (parent.content, choice)]
+            depth = len(history) + 1
+            if depth > settings.LAZY_MAX_DEPTH:
+                raise HTTPException(status_code=400, detail="The story ends here")
+            # Don't hold a pooled connection during the LLM call
+            await db.commit()
+
+            branch = await StoryGenerator.generate_branch(
+                story, history, choice, depth=depth  # type: ignore
+            )
+            self._end_at_max_depth(branch, depth)
+            child_id = await StoryGenerator._persist_story_tree(
+                db, story_id, branch, is_root=False
+            )
+
+            # Link under a row lock; another replica may have won meanwhile
+            parent = (
+                await db.execute(
+                    select(StoryNode)
+                    .where(StoryNode.id == node_id)
+                    .with_for_update()
+                    .execution_options(populate_existing=True)
+                )
+            ).scalar_one()
+            existing = parent.options[option_index].get("node_id")
+            if existing is not None:
+                await db.rollback()
+                return existing
+
+            await link_option(db, parent, option_index, child_id)
+            await db.flush()
+            await refresh_story_metrics(db, story_id)
+            await job_events.story_changed(db, story_id)
+
+        return child_id
+
+    @classmethod
+    def _end_at_max_depth(cls, node: StoryNodeLLM, depth: int):
+        """Turn the nodes at LAZY_MAX_DEPTH into endings, dropping what's below"""
+        if depth >= settings.LAZY_MAX_DEPTH:
+            if not node.isEnding:
+                node.isEnding, node.isWinningEnding = True, False
+            node.options = None
+            return
+        for option in node.options or []:
+            if option.nextNode is not None:
+                child = StoryNodeLLM.model_validate(option.nextNode)
+                cls._end_at_max_depth(child, depth + 1)
+                option.nextNode = child  # type: ignore
+
+    def schedule_prefetch(self, story_id: int, node_id: int):
+        task = asyncio.create_task(self._prefetch(story_id, node_id))
+        self._prefetches.add(task)
+        task.add_done_callback(self._prefetches.discard)
+
+    async def _prefetch(self, story_id: int, node_id: int):
+        """Generate the most likely next branches before the player picks one"""
+        async with WorkerSessionLocal() as db:
+            node = await db.get(StoryNode, node_id)
+            if node is None:
+                return
+
+            missing = [
+                index
+                for index, option in enumerate(node.options or [])
+                if option.get("node_id") is None
+            ]
+            # The options players pick most first
+            pending = (await most_chosen_first(db, node_id, missing))[
+                : settings.LAZY_PREFETCH_COUNT
+            ]
+
+            for index in pending:
+                try:
+                    await self.expand(db, story_id, node_id, index)
+                except Exception:
+                    logger.exception("Prefetch of node %s option %s failed", node_id, index)
+                    await db.rollback()
+
+    @staticmethod
+    async def _get_node(
+        db: AsyncSession, story_id: int, node_id: int, refresh: bool = False
+    ) -> StoryNode:
+        node = await db.get(StoryNode, node_id, populate_existing=refresh)
+        if node is None or node.story_id != story_id:
+            raise HTTPException(status_code=404, detail="Story node not found")
+        return node
+
+
+branch_expander = BranchExpander()
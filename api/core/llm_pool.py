@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Collection, Dict, Iterator, List, Optional, Set
+
+from google.api_core.exceptions import ResourceExhausted
+
+from core.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class LLMPoolExhausted(RuntimeError):
+    """No API key became available within the acquire timeout"""
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Short, non-reversible id for logs and metrics"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    if isinstance(error, ResourceExhausted):
+        return True
+    message = str(error).lower()
+    return "429" in message or "resource exhausted" in message or "quota" in message
+
+
+class KeyScope:
+    def __init__(self, exclude: Collection[str]):
+        self.exclude: Set[str] = set(exclude)
+        # Fingerprints of the keys leased in this scope, in order
+        self.used: List[str] = []
+
+
+_key_scope: ContextVar[Optional[KeyScope]] = ContextVar("llm_key_scope", default=None)
+
+
+@contextmanager
+def key_scope(exclude: Collection[str] = ()) -> Iterator[KeyScope]:
+    """
+    LLM calls made in this context avoid the keys in `exclude` and record
+    the keys they used, so a retried job can move to a different key.
+    """
+    scope = KeyScope(exclude)
+    token = _key_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _key_scope.reset(token)
+
+
+def credit_keys(key_ids: Collection[str]):
+    """
+    Record keys another task leased for this context (a shared, coalesced
+    call) in the current `key_scope`, as if the call had been made here.
+    """
+    scope = _key_scope.get()
+    if scope is None:
+        return
+    for key_id in key_ids:
+        if key_id not in scope.used:
+            scope.used.append(key_id)
+
+
+class KeyState:
+    """A long-lived client for one API key plus its health and usage"""
+
+    def __init__(self, key_id: str, client: Any, requests_per_minute: float):
+        self.key_id = key_id
+        self.client = client
+        self.capacity = max(requests_per_minute / 60 * 10, 1.0)  # ~10s burst
+        self.refill_per_second = requests_per_minute / 60
+        self.tokens = self.capacity
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.circuit_open_until = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.latency_total = 0.0
+
+    def refill(self, now: float):
+        elapsed = now - self.refilled_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.refilled_at = now
+
+    def ready_at(self, now: float) -> float:
+        """Earliest monotonic time this key can take a request"""
+        blocked_until = max(self.cooldown_until, self.circuit_open_until)
+        if self.tokens < 1:
+            blocked_until = max(
+                blocked_until, now + (1 - self.tokens) / self.refill_per_second
+            )
+        return blocked_until
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "key": self.key_id,
+            "in_flight": self.in_flight,
+            "tokens": round(self.tokens, 2),
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "avg_latency_seconds": (
+                self.latency_total / (self.requests - self.errors)
+                if self.requests > self.errors
+                else None
+            ),
+            "cooling_down": self.cooldown_until > now,
+            "circuit_open": self.circuit_open_until > now,
+        }
+
+
+class LLMClientPool:
+    """
+    One reusable LLM client per API key (so HTTP/gRPC channels stay warm),
+    handed out to the least-loaded healthy key.
+
+    Each key has a token bucket for its request quota. A 429 puts the key
+    into cooldown, and `failure_threshold` consecutive errors open its
+    circuit for `circuit_open_seconds`, after which one trial request is let
+    through.
+    """
+
+    def __init__(
+        self,
+        api_keys: List[str],
+        client_factory: Callable[[str], Any],
+        requests_per_minute: float,
+        cooldown_seconds: float,
+        failure_threshold: int,
+        circuit_open_seconds: float,
+        acquire_timeout: float,
+    ):
+        if not api_keys:
+            raise ValueError("NO GOOGLE API KEY FOUND")
+        self.cooldown_seconds = cooldown_seconds
+        self.failure_threshold = failure_threshold
+        self.circuit_open_seconds = circuit_open_seconds
+        self.acquire_timeout = acquire_timeout
+        self.keys = [
+            KeyState(key_fingerprint(key), client_factory(key), requests_per_minute)
+            for key in api_keys
+        ]
+
+    @asynccontextmanager
+    async def acquire(self, exclude: Collection[str] = ()) -> AsyncIterator[KeyState]:
+        """
+        Lease a key for one LLM call. Keys in `exclude` (fingerprints) and
+        in the current `key_scope` are only used when no other key exists.
+        """
+        scope = _key_scope.get()
+        if scope is not None:
+            exclude = scope.exclude.union(exclude)
+        with timed("llm_acquire"):
+            state = await self._reserve(exclude)
+        if scope is not None:
+            scope.used.append(state.key_id)
+        started = time.monotonic()
+        try:
+            yield state
+        except BaseException as error:
+            self._record_failure(state, error)
+            raise
+        else:
+            self._record_success(state, time.monotonic() - started)
+        finally:
+            state.in_flight -= 1
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [state.stats(now) for state in self.keys]
+
+    async def _reserve(self, exclude: Collection[str]) -> KeyState:
+        deadline = time.monotonic() + self.acquire_timeout
+        candidates = [s for s in self.keys if s.key_id not in exclude] or self.keys
+
+        while True:
+            now = time.monotonic()
+            for state in candidates:
+                state.refill(now)
+
+            ready = [s for s in candidates if s.ready_at(now) <= now]
+            if ready:
+                state = min(ready, key=lambda s: (s.in_flight, -s.tokens))
+                state.tokens -= 1
+                state.in_flight += 1
+                state.requests += 1
+                if state.circuit_open_until and state.circuit_open_until <= now:
+                    # Half-open: this request decides whether the key recovers
+                    state.circuit_open_until = now + self.circuit_open_seconds
+                return state
+
+            wake_at = min(s.ready_at(now) for s in candidates)
+            if wake_at > deadline:
+                raise LLMPoolExhausted("All Gemini API keys are rate limited or failing")
+            await asyncio.sleep(wake_at - now)
+
+    def _record_success(self, state: KeyState, latency: float):
+        state.latency_total += latency
+        state.consecutive_failures = 0
+        state.circuit_open_until = 0.0
+
+    def _record_failure(self, state: KeyState, error: BaseException):
+        if isinstance(error, asyncio.CancelledError):
+            return
+        now = time.monotonic()
+        state.errors += 1
+        state.consecutive_failures += 1
+
+        if is_rate_limit_error(error):
+            state.rate_limited += 1
+            state.cooldown_until = now + self.cooldown_seconds
+            state.tokens = min(state.tokens, 0.0)
+            logger.warning("Gemini key %s rate limited, cooling down", state.key_id)
+
+        if state.consecutive_failures >= self.failure_threshold:
+            state.circuit_open_until = now + self.circuit_open_seconds
+            logger.warning("Gemini key %s circuit opened", state.key_id)
+
+
+_pool: Optional[LLMClientPool] = None
+
+
+def configured_api_keys() -> List[str]:
+    from core.config import settings
+
+    if settings.LLM_BACKEND == "fake" and not settings.GOOGLE_API_KEYS:
+        return ["fake-key"]
+    return settings.GOOGLE_API_KEYS
+
+
+def get_llm_pool() -> LLMClientPool:
+    """The process-wide pool, built on first use"""
+    global _pool
+    if _pool is None:
+        from core.config import settings
+        from core.story_generator import StoryGenerator
+
+        _pool = LLMClientPool(
+            configured_api_keys(),
+            StoryGenerator._create_llm,
+            requests_per_minute=settings.LLM_KEY_REQUESTS_PER_MINUTE,
+            cooldown_seconds=settings.LLM_KEY_COOLDOWN_SECONDS,
+            failure_threshold=settings.LLM_KEY_FAILURE_THRESHOLD,
+            circuit_open_seconds=settings.LLM_KEY_CIRCUIT_OPEN_SECONDS,
+            acquire_timeout=settings.LLM_ACQUIRE_TIMEOUT_SECONDS,
+        )
+    return _pool
@@ -0,0 +1,70 @@
+"""
+Response schemas for Gemini's structured output (LLM_OUTPUT_MODE=structured).
+
+Gemini schemas cannot refer to themselves, so the recursive StoryNodeLLM
+tree is unrolled to a fixed number of levels. Types and descriptions come
+from the pydantic models in core.models, so the schema and the validation
+in StoryGenerator._parse_response stay in step.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict
+
+from core.models import StoryLLMResponse, StoryNodeLLM, StoryOptionLLM
+
+# Replaces the schema text in the prompt; the schema travels in the request
+STRUCTURED_FORMAT_INSTRUCTIONS = "The JSON schema is enforced by the API; fill in every field."
+
+# A full story is 3-4 levels deep (STORY_PROMPT)
+STORY_LEVELS = 4
+
+
+def _field(model, name: str, type_: str, **extra: Any) -> Dict[str, Any]:
+    return {"type": type_, "description": model.model_fields[name].description, **extra}
+
+
+@lru_cache(maxsize=None)
+def node_schema(levels: int, open_options: bool = False) -> Dict[str, Any]:
+    """
+    A node and `levels - 1` levels below it. The deepest nodes have no
+    options, or with `open_options` options without a nextNode, which
+    lazy stories generate later.
+    """
+    properties = {
+        "content": _field(StoryNodeLLM, "content", "string"),
+        "isEnding": _field(StoryNodeLLM, "isEnding", "boolean"),
+        "isWinningEnding": _field(StoryNodeLLM, "isWinningEnding", "boolean"),
+    }
+    if levels > 1 or open_options:
+        option = {"text": _field(StoryOptionLLM, "text", "string")}
+        if levels > 1:
+            option["nextNode"] = {
+                **node_schema(levels - 1, open_options),
+                "description": StoryOptionLLM.model_fields["nextNode"].description,
+            }
+        properties["options"] = _field(
+            StoryNodeLLM,
+            "options",
+            "array",
+            items={"type": "object", "properties": option, "required": ["text"]},
+        )
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": ["content", "isEnding", "isWinningEnding"],
+    }
+
+
+@lru_cache(maxsize=None)
+def story_schema(levels: int = STORY_LEVELS, open_options: bool = False) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {
+            "title": _field(StoryLLMResponse, "title", "string"),
+            "rootNode": {
+                **node_schema(levels, open_options),
+                "description": StoryLLMResponse.model_fields["rootNode"].description,
+            },
+        },
+        "required": ["title", "rootNode"],
+    }
@@ -0,0 +1,146 @@
+"""
+Prometheus metrics and per-stage timings.
+
+`timed(stage)` observes `story_stage_seconds` and, inside `collect_stages()`,
+also adds the duration to a dict that the worker stores on the job row,
+so one slow job can be explained without the metrics backend.
+
+`MetricsMiddleware` records latency and the number of DB queries per route.
+Queries are counted by `count_queries(engine)` cursor hooks.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+STAGE_SECONDS = Histogram(
+    "story_stage_seconds",
+    "Time spent in each stage of story generation",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+JOBS = Counter("story_jobs_total", "Finished story jobs", ["status"])
+ADMISSION_REJECTIONS = Counter(
+    "story_admission_rejections_total", "Story requests refused: user, session or global", ["scope"]
+)
+# Per LLM_OUTPUT_MODE, to compare prompt-embedded schemas with structured output
+PARSE_RESULTS = Counter(
+    "llm_parse_total", "LLM answers by parse outcome: ok, repaired or failed", ["mode", "result"]
+)
+PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens",
+    "Input tokens per LLM call",
+    ["mode"],
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000),
+)
+# Callers that started a shared call (leader) or waited for one (follower)
+COALESCED_CALLS = Counter(
+    "singleflight_calls_total", "Coalesced calls by role", ["flight", "role"]
+)
+WRITE_BEHIND_ROWS = Counter(
+    "write_behind_rows_total", "Buffered rows written or dropped", ["buffer", "outcome"]
+)
+WRITE_BEHIND_BATCH_ROWS = Histogram(
+    "write_behind_batch_rows",
+    "Rows per write-behind flush",
+    ["buffer"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Request latency per route",
+    ["method", "route", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries issued while handling a request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time waiting for a pooled database connection",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("story_stages", default=None)
+# A one-item list, so counts made in copied contexts (threadpool, tasks) add up
+_queries: ContextVar[Optional[List[int]]] = ContextVar("db_queries", default=None)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    stages = _stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def collect_stages() -> Iterator[Dict[str, float]]:
+    """Collect the stages timed in this context (and tasks it starts)"""
+    stages: Dict[str, float] = {}
+    token = _stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _stages.reset(token)
+
+
+def count_queries(engine: Engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        queries = _queries.get()
+        if queries is not None:
+            queries[0] += 1
+
+
+class MetricsMiddleware:
+    """Per-route latency and DB query count, labelled by the route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        queries = [0]
+        token = _queries.set(queries)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _queries.reset(token)
+            # The router stores the matched route in the scope; unmatched
+            # paths share one label to keep the series count bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_SECONDS.labels(method, route, str(status)).observe(
+                time.perf_counter() - started
+            )
+            REQUEST_DB_QUERIES.labels(method, route).observe(queries[0])
@@ -1,6 +1,10 @@
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 
+
+class MalformedLLMResponse(ValueError):
+    """The LLM answered, but not with a story that parses and validates"""
+
 class StoryOptionLLM(BaseModel):
     text: str = Field(description="The text of the option shown to the user")
     nextNode: Optional[Dict[str, Any]] = Field(default=None, description="The next node content and its options")
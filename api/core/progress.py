@@ -0,0 +1,134 @@
+"""
+Player progress: where each player is in a story, and which options
+players choose.
+
+Every move is recorded through a write-behind buffer (core.write_behind),
+so clicking through a story costs a batched INSERT every
+PROGRESS_FLUSH_INTERVAL_MS rather than a transaction per click. Reads merge
+in the rows this process hasn't written yet. Moves still buffered in
+another API process are not seen until that process flushes them, so with
+several replicas a read can lag by up to PROGRESS_FLUSH_INTERVAL_MS.
+
+The choice counts also order lazy prefetching (core.lazy_story): the
+branches players pick most are generated first.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.write_behind import WriteBehindBuffer
+from db.database import AsyncSessionLocal
+from models.progress import StoryProgress
+from models.story import StoryNode
+
+progress_buffer = WriteBehindBuffer(
+    "story_progress",
+    StoryProgress,
+    AsyncSessionLocal,
+    flush_interval=settings.PROGRESS_FLUSH_INTERVAL_MS / 1000,
+    max_batch=settings.PROGRESS_FLUSH_MAX_EVENTS,
+    max_pending=settings.PROGRESS_MAX_PENDING,
+)
+
+# Option index -> times chosen in the last day, across all stories
+_option_counts: Dict[int, int] = {}
+_option_counts_at = 0.0
+OPTION_COUNTS_TTL_SECONDS = 300
+
+
+def record_progress(
+    story_id: int,
+    node_id: int,
+    user_id: Optional[str],
+    session_id: Optional[str],
+    from_node_id: Optional[int] = None,
+    option_index: Optional[int] = None,
+):
+    progress_buffer.add(
+        {
+            "story_id": story_id,
+            "node_id": node_id,
+            "user_id": user_id,
+            "session_id": session_id,
+            "from_node_id": from_node_id,
+            "option_index": option_index,
+            "created_at": datetime.now(timezone.utc),
+        }
+    )
+
+
+async def latest_position(db: AsyncSession, story_id: int, user_id: str) -> Optional[int]:
+    """
+    The node the user last reached in the story, or None. Moves another
+    process hasn't flushed yet are not included.
+    """
+    buffered = next(
+        (
+            row["node_id"]
+            for row in reversed(progress_buffer.pending())
+            if row["story_id"] == story_id and row["user_id"] == user_id
+        ),
+        None,
+    )
+    if buffered is not None:
+        # Not checked yet; written rows are checked by the join below
+        node = await db.get(StoryNode, buffered)
+        if node is not None and node.story_id == story_id:
+            return buffered
+
+    return await db.scalar(
+        select(StoryProgress.node_id)
+        .join(StoryNode, StoryNode.id == StoryProgress.node_id)
+        .where(
+            StoryProgress.user_id == user_id,
+            StoryProgress.story_id == story_id,
+            StoryNode.story_id == story_id,
+        )
+        .order_by(StoryProgress.created_at.desc(), StoryProgress.id.desc())
+        .limit(1)
+    )
+
+
+async def _global_option_counts(db: AsyncSession) -> Dict[int, int]:
+    global _option_counts, _option_counts_at
+    if time.monotonic() - _option_counts_at > OPTION_COUNTS_TTL_SECONDS:
+        rows = await db.execute(
+            select(StoryProgress.option_index, func.count())
+            .where(
+                StoryProgress.option_index.is_not(None),
+                StoryProgress.created_at > datetime.now(timezone.utc) - timedelta(days=1),
+            )
+            .group_by(StoryProgress.option_index)
+        )
+        _option_counts = {index: count for index, count in rows.all()}
+        _option_counts_at = time.monotonic()
+    return _option_counts
+
+
+async def most_chosen_first(
+    db: AsyncSession, node_id: int, option_indexes: Sequence[int]
+) -> List[int]:
+    """
+    `option_indexes` ordered by how often players chose them at this node,
+    then by how often players choose that position in any story (new
+    nodes have no history of their own), then by position. Counts include
+    this process's unflushed moves but not other processes'.
+    """
+    rows = await db.execute(
+        select(StoryProgress.option_index, func.count())
+        .where(StoryProgress.from_node_id == node_id)
+        .group_by(StoryProgress.option_index)
+    )
+    here: Dict[int, int] = {index: count for index, count in rows.all()}
+    for row in progress_buffer.pending():
+        if row["from_node_id"] == node_id:
+            here[row["option_index"]] = here.get(row["option_index"], 0) + 1
+    overall = await _global_option_counts(db)
+    return sorted(
+        option_indexes, key=lambda i: (-here.get(i, 0), -overall.get(i, 0), i)
+    )
@@ -1,3 +1,7 @@
+# Bump when STORY_PROMPT or LAZY_STORY_PROMPT change meaningfully, so
+# cached story variants generated from the old prompt are not served
+STORY_PROMPT_VERSION = "1"
+
 STORY_PROMPT = """
 You are a creative story writer that creates engaging choose-your-own-adventure stories.
 Generate a complete branching story with multiple paths and endings.
@@ -22,6 +26,48 @@ Here is the exact JSON structure to follow:
 {format_instructions}
 """
 
+LAZY_STORY_PROMPT = """
+You are a creative story writer that creates engaging choose-your-own-adventure stories.
+Write only the opening scene of a branching story; later scenes are written
+when the player reaches them.
+
+The story should include:
+1. A compelling title
+2. A starting situation (root node) with 2-3 options
+
+Story structure requirements:
+- Each option has only a "text" field and NO "nextNode"
+- The root node is not an ending
+
+⚠️ IMPORTANT: Output must be valid JSON ONLY.
+Do NOT include comments, extra text, or explanations outside the JSON structure.
+
+Here is the exact JSON structure to follow:
+{format_instructions}
+"""
+
+BRANCH_PROMPT = """
+You are continuing a choose-your-own-adventure story titled "{title}" with the theme "{theme}".
+
+The player's path so far (scene, then the option they chose):
+{history}
+
+Write the scene that follows the player's latest choice, as a story node.
+
+Story structure requirements:
+- Write {levels} levels: the new node and, for each of its options, the next node
+- Options of the deepest nodes have only a "text" field and NO "nextNode"
+- Each non-ending node has 2-3 options
+- The new node is at level {depth} of the story; every node at level {max_depth} or deeper must be an ending
+- Some paths should end earlier than others, with both winning and losing endings
+
+⚠️ IMPORTANT: Output must be valid JSON ONLY.
+Do NOT include comments, extra text, or explanations outside the JSON structure.
+
+Here is the exact JSON structure to follow:
+{format_instructions}
+"""
+
 # Example JSON structure for reference
 json_structure = """
 {
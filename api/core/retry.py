@@ -0,0 +1,88 @@
+"""
+Retry policy for story jobs.
+
+A failed attempt is classified by its error. Quota errors, outages,
+timeouts and malformed answers are worth another try; anything else fails
+the job at once. A retried job goes back to "pending" with `next_attempt_at`
+set and frees its worker slot while it waits. The next attempt avoids the
+API keys that failed before (core.llm_pool.key_scope).
+"""
+
+import asyncio
+import random
+from typing import Optional
+
+from google.api_core import exceptions as google_exceptions
+from pydantic import ValidationError
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from core.config import settings
+from core.json_stream import JSONStreamError
+from core.llm_pool import LLMPoolExhausted, is_rate_limit_error
+from core.models import MalformedLLMResponse
+
+RATE_LIMITED = "rate_limited"
+TRANSIENT = "transient"
+MALFORMED = "malformed"
+PERMANENT = "permanent"
+
+RETRYABLE = frozenset({RATE_LIMITED, TRANSIENT, MALFORMED})
+
+_TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.Aborted,
+    google_exceptions.RetryError,
+    asyncio.TimeoutError,
+    TimeoutError,
+    ConnectionError,
+    OperationalError,
+    InterfaceError,
+)
+
+
+def classify_error(error: BaseException) -> str:
+    if isinstance(error, LLMPoolExhausted) or is_rate_limit_error(error):
+        return RATE_LIMITED
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return TRANSIENT
+    # Unparseable or off-schema JSON; a new sample usually comes out fine.
+    # Other ValueErrors (a missing API key, a bad setting) won't fix themselves
+    if isinstance(error, (MalformedLLMResponse, JSONStreamError, ValidationError)):
+        return MALFORMED
+    return PERMANENT
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        rng: Optional[random.Random] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = rng or random.Random()
+
+    def should_retry(self, kind: str, attempts: int) -> bool:
+        return kind in RETRYABLE and attempts < self.max_attempts
+
+    def backoff(self, attempts: int) -> float:
+        """
+        Seconds before the next attempt: exponential with full jitter, so
+        jobs that failed together (an outage) don't all come back together.
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** max(attempts - 1, 0))
+        return self._random.uniform(0, ceiling)
+
+
+retry_policy = RetryPolicy(
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    base_delay=settings.JOB_RETRY_BASE_SECONDS,
+    max_delay=settings.JOB_RETRY_MAX_SECONDS,
+)
@@ -0,0 +1,64 @@
+"""
+Request coalescing ("single flight").
+
+`SingleFlight.do(key, fn)` runs `fn` once for all callers that ask for the
+same key while it is running; the others wait for and share its result (or
+its exception). Nothing is kept afterwards, caching is left to the caller.
+
+The call runs in its own task, so a caller that goes away (client
+disconnect, cancelled job) does not cancel the work for the callers still
+waiting. For the same reason `fn` must not use the first caller's database
+session.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from core.metrics import COALESCED_CALLS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        # Metric label, e.g. "story_generation"
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        self._calls: Dict[Tuple[Any, Hashable], "asyncio.Task[Any]"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        # Tasks belong to one event loop (API and embedded worker may differ)
+        call_key = (loop, key)
+        task = self._calls.get(call_key)
+        if task is None:
+            self.leaders += 1
+            COALESCED_CALLS.labels(self.name, "leader").inc()
+            task = loop.create_task(fn())
+            self._calls[call_key] = task
+            task.add_done_callback(lambda done: self._finish(call_key, done))
+        else:
+            self.followers += 1
+            COALESCED_CALLS.labels(self.name, "follower").inc()
+        return await asyncio.shield(task)
+
+    def _finish(self, call_key: Tuple[Any, Hashable], task: "asyncio.Task[Any]"):
+        if self._calls.get(call_key) is task:
+            del self._calls[call_key]
+        # Retrieved here so an exception nobody waited for isn't logged as lost
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("%s call failed: %s", self.name, task.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            # Share of calls that were served by another caller's work
+            "coalesce_ratio": self.followers / calls if calls else 0.0,
+        }
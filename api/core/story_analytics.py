@@ -0,0 +1,167 @@
+"""
+Story shape metrics (depth, node and ending counts, winning paths).
+
+They are computed when a story is written and stored on `Story`, so
+queries like "at least 2 winning endings, depth 4" never load nodes.
+Stories written before these columns existed can be backfilled with:
+
+    python -m core.story_analytics [--batch-size 500]
+"""
+
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import AsyncSessionLocal, async_engine, create_table
+from models.story import Story, StoryNode
+
+logger = logging.getLogger(__name__)
+
+# node id -> (is_ending, is_winning_ending, child node ids)
+StoryGraph = Dict[int, Tuple[bool, bool, List[int]]]
+
+METRIC_COLUMNS = (
+    "depth",
+    "node_count",
+    "ending_count",
+    "winning_ending_count",
+    "winning_path_count",
+    "shortest_winning_path",
+)
+
+
+def graph_from_nodes(nodes: Sequence[StoryNode]) -> Tuple[StoryGraph, Optional[int]]:
+    """Graph of persisted nodes and the root id (None if there's no root)"""
+    graph: StoryGraph = {}
+    root_id = None
+    for node in nodes:
+        children = [
+            option["node_id"]
+            for option in node.options or []
+            if option.get("node_id") is not None
+        ]
+        graph[node.id] = (bool(node.is_ending), bool(node.is_winning_ending), children)  # type: ignore
+        if node.is_root:
+            root_id = node.id
+    return graph, root_id  # type: ignore
+
+
+def compute_metrics(graph: StoryGraph, root_id: int) -> Dict[str, Optional[int]]:
+    """
+    Walk the graph level by level from the root. Depth counts nodes on the
+    longest path, `shortest_winning_path` counts choices to the nearest
+    winning ending. Paths are counted rather than assumed equal to
+    endings, so shared nodes are handled too.
+    """
+    paths = {root_id: 1}
+    seen = {root_id}
+    level = [root_id]
+    depth = 0
+    winning_paths = 0
+    shortest_winning_path = None
+
+    while level:
+        depth += 1
+        next_paths: Dict[int, int] = defaultdict(int)
+        for node_id in level:
+            is_ending, is_winning, children = graph[node_id]
+            if is_winning:
+                winning_paths += paths[node_id]
+                if shortest_winning_path is None:
+                    shortest_winning_path = depth - 1
+            for child_id in children:
+                # Links to unknown or already visited nodes would loop
+                if child_id in graph and child_id not in seen:
+                    next_paths[child_id] += paths[node_id]
+        seen.update(next_paths)
+        paths.update(next_paths)
+        level = list(next_paths)
+
+    reachable = [graph[node_id] for node_id in seen]
+    return {
+        "depth": depth,
+        "node_count": len(seen),
+        "ending_count": sum(1 for is_ending, _, _ in reachable if is_ending),
+        "winning_ending_count": sum(1 for _, is_winning, _ in reachable if is_winning),
+        "winning_path_count": winning_paths,
+        "shortest_winning_path": shortest_winning_path,
+    }
+
+
+async def refresh_story_metrics(db: AsyncSession, story_id: int):
+    """Recompute a story's metrics from its nodes; the caller commits"""
+    nodes = (
+        await db.scalars(select(StoryNode).where(StoryNode.story_id == story_id))
+    ).all()
+    graph, root_id = graph_from_nodes(nodes)
+    if root_id is None:
+        return
+    await db.execute(
+        update(Story)
+        .where(Story.id == story_id)
+        .values(**compute_metrics(graph, root_id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def backfill(batch_size: int) -> int:
+    """Fill metrics for stories that have none, `batch_size` stories per transaction"""
+    updated = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            story_ids = (
+                await db.scalars(
+                    select(Story.id)
+                    .where(Story.node_count.is_(None), Story.id > last_id)
+                    .order_by(Story.id)
+                    .limit(batch_size)
+                )
+            ).all()
+            if not story_ids:
+                return updated
+
+            nodes_by_story: Dict[int, List[StoryNode]] = defaultdict(list)
+            for node in await db.scalars(
+                select(StoryNode).where(StoryNode.story_id.in_(story_ids))
+            ):
+                nodes_by_story[node.story_id].append(node)  # type: ignore
+
+            rows = []
+            for story_id in story_ids:
+                graph, root_id = graph_from_nodes(nodes_by_story[story_id])
+                if root_id is not None:
+                    rows.append({"id": story_id, **compute_metrics(graph, root_id)})
+
+            if rows:
+                # Executemany of UPDATE ... WHERE id = :id
+                await db.execute(update(Story), rows)
+            await db.commit()
+
+            updated += len(rows)
+            last_id = story_ids[-1]
+            logger.info("Backfilled story metrics up to id %s (%s stories)", last_id, updated)
+
+
+async def main(batch_size: int):
+    try:
+        count = await backfill(batch_size)
+        logger.info("Backfilled metrics for %s stories", count)
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill story shape metrics")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    create_table()
+
+    asyncio.run(main(args.batch_size))
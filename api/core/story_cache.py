@@ -0,0 +1,184 @@
+from typing import Dict, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.cache import ByteLRUCache, CachedPayload
+from core.config import settings
+from core.singleflight import SingleFlight
+from core.story_codec import encode_story
+from db.database import AsyncSessionLocal, read_router
+from models.story import Story, StoryNode
+from schemas.story import (
+    CompleteStoryNodeResponse,
+    CompleteStoryResponse,
+    StoryNodesResponse,
+)
+
+# Serialized GET /stories/{story_id}/complete bodies keyed by story id.
+# Generated stories never change, so entries only leave by TTL or size.
+story_cache = ByteLRUCache(
+    max_bytes=settings.STORY_CACHE_MAX_BYTES,
+    ttl_seconds=settings.STORY_CACHE_TTL_SECONDS,
+)
+# Concurrent cache misses for one story share a single load
+story_reads = SingleFlight("complete_story")
+
+
+async def build_complete_story_tree(
+    db: AsyncSession, story: Story
+) -> CompleteStoryResponse:
+    nodes = (
+        await db.scalars(select(StoryNode).where(StoryNode.story_id == story.id))
+    ).all()
+    return complete_story_from_nodes(story, nodes)
+
+
+def node_response(node: StoryNode) -> CompleteStoryNodeResponse:
+    return CompleteStoryNodeResponse(
+        id=node.id,  # type: ignore
+        content=node.content,  # type: ignore
+        is_ending=node.is_ending,  # type: ignore
+        is_winning_ending=node.is_winning_ending,  # type: ignore
+        options=node.options,  # type: ignore
+    )
+
+
+def complete_story_from_nodes(
+    story: Story, nodes: Sequence[StoryNode]
+) -> CompleteStoryResponse:
+    node_dict = {node.id: node_response(node) for node in nodes}
+
+    root_node = next((node for node in nodes if node.is_root), None)  # type: ignore
+    if not root_node:
+        raise HTTPException(status_code=500, detail="Story root node not found")
+
+    return CompleteStoryResponse(
+        id=story.id,  # type: ignore
+        title=story.title,  # type: ignore
+        session_id=story.session_id,  # type: ignore
+        created_at=story.created_at,  # type: ignore
+        theme=story.theme,  # type: ignore
+        generation_mode=story.generation_mode or "batch",  # type: ignore
+        is_complete=story.is_complete is not False,
+        root_node_id=root_node.id,  # type: ignore
+        all_nodes=node_dict,
+    )
+
+
+async def build_node_frontier(
+    db: AsyncSession, story_id: int, from_node_id: Optional[int], depth: int
+) -> StoryNodesResponse:
+    """
+    The node `from_node_id` (default: the root) and everything up to `depth`
+    choices below it, with one query per level. Players only need what's
+    near them, so deep stories don't have to be downloaded whole.
+    """
+    story = await db.get(Story, story_id)
+    if story is None:
+        raise HTTPException(status_code=404, detail="Story not found")
+
+    root_id = await db.scalar(
+        select(StoryNode.id).where(StoryNode.story_id == story_id, StoryNode.is_root.is_(True))
+    )
+    if root_id is None:
+        raise HTTPException(status_code=500, detail="Story root node not found")
+
+    start_id = from_node_id if from_node_id is not None else root_id
+    nodes: Dict[int, StoryNode] = {}
+    level_ids = [start_id]
+    for _ in range(depth + 1):
+        level = (
+            await db.scalars(
+                select(StoryNode).where(
+                    StoryNode.story_id == story_id, StoryNode.id.in_(level_ids)
+                )
+            )
+        ).all()
+        nodes.update((node.id, node) for node in level)  # type: ignore
+        level_ids = list(
+            {
+                option["node_id"]
+                for node in level
+                for option in node.options or []
+                if option.get("node_id") is not None and option["node_id"] not in nodes
+            }
+        )
+        if not level_ids:
+            break
+
+    if not nodes:
+        raise HTTPException(status_code=404, detail="Story node not found")
+
+    return StoryNodesResponse(
+        id=story.id,  # type: ignore
+        title=story.title,  # type: ignore
+        session_id=story.session_id,  # type: ignore
+        theme=story.theme,  # type: ignore
+        generation_mode=story.generation_mode or "batch",  # type: ignore
+        is_complete=story.is_complete is not False,
+        root_node_id=root_id,
+        from_node_id=start_id,
+        depth=depth,
+        nodes={node_id: node_response(node) for node_id, node in nodes.items()},
+    )
+
+
+async def cache_complete_story(db: AsyncSession, story: Story) -> CachedPayload:
+    complete_story = await build_complete_story_tree(db, story)
+    return story_cache.put(story.id, complete_story.model_dump_json().encode())
+
+
+def invalidate_story(story_id: int):
+    """Drop every cached representation of a story"""
+    story_cache.invalidate(story_id)
+    story_cache.invalidate((story_id, "msgpack"))
+
+
+async def get_complete_story_payload(
+    story_id: int, format: str = "json"
+) -> Optional[CachedPayload]:
+    """The serialized story as JSON or in the core.story_codec format"""
+    key = story_id if format == "json" else (story_id, format)
+    payload = story_cache.get(key)
+    if payload is not None:
+        return payload
+    return await story_reads.do(key, lambda: _load_story_payload(story_id, format))
+
+
+async def _load_story_payload(story_id: int, format: str) -> Optional[CachedPayload]:
+    # Shared by every waiting request, so not tied to any one request's session
+    async with (await read_router.session_factory())() as db:
+        payload = await _serialize_story(db, story_id, format)
+    if payload is None and read_router.enabled:
+        # New stories may not have reached the replica yet
+        async with AsyncSessionLocal() as db:
+            payload = await _serialize_story(db, story_id, format)
+    return payload
+
+
+async def _serialize_story(
+    db: AsyncSession, story_id: int, format: str
+) -> Optional[CachedPayload]:
+    key = story_id if format == "json" else (story_id, format)
+    story = await db.scalar(select(Story).where(Story.id == story_id))
+    if not story:
+        return None
+
+    if format == "msgpack":
+        nodes = (
+            await db.scalars(
+                select(StoryNode).where(StoryNode.story_id == story_id).order_by(StoryNode.id)
+            )
+        ).all()
+        body = encode_story(story, nodes)
+    elif story.is_complete is not False:
+        return await cache_complete_story(db, story)
+    else:
+        body = (await build_complete_story_tree(db, story)).model_dump_json().encode()
+
+    if story.is_complete is False:
+        # Still streaming in, serve it but don't cache
+        return CachedPayload(body=body, etag=ByteLRUCache.make_etag(body))
+    return story_cache.put(key, body)
@@ -0,0 +1,286 @@
+"""
+Compact binary story format.
+
+A story is one msgpack map with a node table stored column-wise, the
+options of all nodes in one edge list (CSR: node i owns edges
+`edge_offsets[i]:edge_offsets[i + 1]`), and every piece of text
+interned in a string table. Edges point at node *positions*, so an
+archive can be imported into a database with different ids.
+
+    {"v": 1, "story": {...}, "strings": [...], "root": 0,
+     "nodes": {"id": [...], "content": [...], "flags": [...], "edge_offsets": [...]},
+     "edges": {"text": [...], "to": [...]}}
+
+Payloads can be wrapped in zstd. `decode_story` detects that on its own.
+
+Archive or restore stories with:
+
+    python -m core.story_codec export stories.bin [--story-id 1 2 ...]
+    python -m core.story_codec import stories.bin
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Sequence
+
+import msgpack
+import zstandard
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.story_graph import edge_rows, insert_edges
+from db.database import AsyncSessionLocal, async_engine, create_table
+from models.story import Story, StoryNode
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MEDIA_TYPE = "application/msgpack"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+FLAG_ROOT = 1
+FLAG_ENDING = 2
+FLAG_WINNING = 4
+
+STORY_FIELDS = (
+    "id",
+    "title",
+    "session_id",
+    "theme",
+    "generation_mode",
+    "is_complete",
+    "depth",
+    "node_count",
+    "ending_count",
+    "winning_ending_count",
+    "winning_path_count",
+    "shortest_winning_path",
+)
+
+
+class _StringTable:
+    def __init__(self):
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def story_to_dict(story: Story, nodes: Sequence[StoryNode]) -> Dict[str, Any]:
+    strings = _StringTable()
+    position = {node.id: i for i, node in enumerate(nodes)}
+
+    node_ids, contents, flags, edge_offsets = [], [], [], [0]
+    edge_texts, edge_targets = [], []
+    root = 0
+    for i, node in enumerate(nodes):
+        node_ids.append(node.id)
+        contents.append(strings.add(node.content or ""))  # type: ignore
+        flags.append(
+            (FLAG_ROOT if node.is_root else 0)
+            | (FLAG_ENDING if node.is_ending else 0)
+            | (FLAG_WINNING if node.is_winning_ending else 0)
+        )
+        if node.is_root:
+            root = i
+        for option in node.options or []:
+            edge_texts.append(strings.add(option["text"]))
+            # -1: an option a lazy story hasn't generated yet
+            edge_targets.append(position.get(option.get("node_id"), -1))
+        edge_offsets.append(len(edge_texts))
+
+    meta = {field: getattr(story, field) for field in STORY_FIELDS}
+    meta["created_at"] = story.created_at.isoformat() if story.created_at else None  # type: ignore
+
+    return {
+        "v": FORMAT_VERSION,
+        "story": meta,
+        "strings": strings.strings,
+        "root": root,
+        "nodes": {
+            "id": node_ids,
+            "content": contents,
+            "flags": flags,
+            "edge_offsets": edge_offsets,
+        },
+        "edges": {"text": edge_texts, "to": edge_targets},
+    }
+
+
+def encode_story(
+    story: Story, nodes: Sequence[StoryNode], zstd_level: int = 0
+) -> bytes:
+    """Serialize a story; `zstd_level` > 0 also compresses it"""
+    payload = msgpack.packb(story_to_dict(story, nodes), use_bin_type=True)
+    if zstd_level:
+        payload = zstandard.ZstdCompressor(level=zstd_level).compress(payload)
+    return payload
+
+
+def decode_story(payload: bytes) -> Dict[str, Any]:
+    if payload[:4] == ZSTD_MAGIC:
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    data = msgpack.unpackb(payload, raw=False)
+    if data.get("v") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported story format version: {data.get('v')}")
+    return data
+
+
+def node_options(data: Dict[str, Any], node_ids: Sequence[int]) -> List[List[dict]]:
+    """Per node, options in the API's {"text", "node_id"} shape"""
+    strings, offsets = data["strings"], data["nodes"]["edge_offsets"]
+    texts, targets = data["edges"]["text"], data["edges"]["to"]
+    return [
+        [
+            {
+                "text": strings[texts[edge]],
+                "node_id": node_ids[targets[edge]] if targets[edge] >= 0 else None,
+            }
+            for edge in range(offsets[i], offsets[i + 1])
+        ]
+        for i in range(len(offsets) - 1)
+    ]
+
+
+async def load_story(db: AsyncSession, story_id: int):
+    story = await db.get(Story, story_id)
+    if story is None:
+        return None, []
+    nodes = (
+        await db.scalars(
+            select(StoryNode).where(StoryNode.story_id == story_id).order_by(StoryNode.id)
+        )
+    ).all()
+    return story, nodes
+
+
+async def import_story(db: AsyncSession, data: Dict[str, Any]) -> int:
+    """
+    Insert a decoded story under new ids and return the new story id.
+    Nodes go in with one INSERT ... RETURNING, then their options are
+    linked to the new ids with one executemany UPDATE (and INSERT of edges).
+    """
+    meta = {k: v for k, v in data["story"].items() if k in STORY_FIELDS and k != "id"}
+    if data["story"].get("created_at"):
+        meta["created_at"] = datetime.fromisoformat(data["story"]["created_at"])
+    story = Story(**meta)
+    db.add(story)
+    await db.flush()
+
+    strings, columns = data["strings"], data["nodes"]
+    result = await db.execute(
+        insert(StoryNode).returning(StoryNode.id, sort_by_parameter_order=True),
+        [
+            {
+                "story_id": story.id,
+                "content": strings[content],
+                "is_root": bool(flags & FLAG_ROOT),
+                "is_ending": bool(flags & FLAG_ENDING),
+                "is_winning_ending": bool(flags & FLAG_WINNING),
+                "options": [],
+            }
+            for content, flags in zip(columns["content"], columns["flags"])
+        ],
+    )
+    new_ids = list(result.scalars())
+
+    rows = [
+        {"id": node_id, "options": options}
+        for node_id, options in zip(new_ids, node_options(data, new_ids))
+        if options
+    ]
+    if rows:
+        await db.execute(update(StoryNode), rows)
+        edges = [
+            edge
+            for row in rows
+            for edge in edge_rows(story.id, row["id"], row["options"])  # type: ignore
+        ]
+        await insert_edges(db, edges)
+    return story.id  # type: ignore
+
+
+def _read_archive(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f)
+        for data in msgpack.Unpacker(reader, raw=False):
+            yield data
+
+
+async def export_stories(path: str, story_ids: Sequence[int], batch_size: int = 100) -> int:
+    """Write stories as a zstd-compressed stream of msgpack maps"""
+    count = 0
+    with open(path, "wb") as f, zstandard.ZstdCompressor(level=10).stream_writer(f) as out:
+        async with AsyncSessionLocal() as db:
+            if not story_ids:
+                story_ids = (await db.scalars(select(Story.id).order_by(Story.id))).all()
+            for start in range(0, len(story_ids), batch_size):
+                batch = story_ids[start : start + batch_size]
+                stories = {
+                    s.id: s
+                    for s in await db.scalars(select(Story).where(Story.id.in_(batch)))
+                }
+                nodes: Dict[int, List[StoryNode]] = {story_id: [] for story_id in batch}
+                for node in await db.scalars(
+                    select(StoryNode)
+                    .where(StoryNode.story_id.in_(batch))
+                    .order_by(StoryNode.id)
+                ):
+                    nodes[node.story_id].append(node)  # type: ignore
+
+                for story_id in batch:
+                    if story_id in stories:
+                        out.write(
+                            msgpack.packb(
+                                story_to_dict(stories[story_id], nodes[story_id]),
+                                use_bin_type=True,
+                            )
+                        )
+                        count += 1
+                db.expunge_all()
+    return count
+
+
+async def import_stories(path: str, batch_size: int = 100) -> int:
+    count = 0
+    async with AsyncSessionLocal() as db:
+        for data in _read_archive(path):
+            if data.get("v") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported story format version: {data.get('v')}")
+            await import_story(db, data)
+            count += 1
+            if count % batch_size == 0:
+                await db.commit()
+        await db.commit()
+    return count
+
+
+async def main(args):
+    try:
+        if args.command == "export":
+            count = await export_stories(args.path, args.story_id or [])
+        else:
+            count = await import_stories(args.path)
+        logger.info("%sed %s stories (%s)", args.command.capitalize(), count, args.path)
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import story archives")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path")
+    parser.add_argument("--story-id", type=int, nargs="*", help="export only these stories")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    create_table()
+
+    asyncio.run(main(args))
@@ -1,153 +1,488 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from core.prompts import STORY_PROMPT
+from core.fake_llm import FakeStoryLLM, load_canned_responses
+from core.json_repair import repair_json
+from core.json_stream import JSONStreamParser
+from core.llm_pool import get_llm_pool
+from core.llm_schema import STRUCTURED_FORMAT_INSTRUCTIONS, node_schema, story_schema
+from core.metrics import PARSE_RESULTS, PROMPT_TOKENS, observe_stage, timed
+from core.story_graph import edge_rows, insert_edges
+from core.story_stream import StreamingStoryWriter
+from core.prompts import BRANCH_PROMPT, LAZY_STORY_PROMPT, STORY_PROMPT, STORY_PROMPT_VERSION
+from core.story_analytics import StoryGraph, compute_metrics
+from core.variant_cache import (
+    StoryVariant,
+    generate_once,
+    normalize_theme,
+    story_variant_cache,
+)
 from models.story import Story, StoryNode
-from core.models import StoryLLMResponse, StoryNodeLLM
+from core.models import MalformedLLMResponse, StoryLLMResponse, StoryNodeLLM
 from dotenv import load_dotenv
-import re
 import json
+import logging
+import time
+from functools import partial
 from core.config import settings
-import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 class StoryGenerator:
+    MODEL = "gemini-2.0-flash"
+    TEMPERATURE = 0.7
+    MAX_OUTPUT_TOKENS = 2048
 
     @classmethod
-    def _get_llm(cls):
-        """Return a Google Gemini LLM instance"""
-        if not settings.GOOGLE_API_KEYS:
-            raise ValueError("NO GOOGLE API KEY FOUND")
-        google_api_key = random.choice(settings.GOOGLE_API_KEYS)
-        print(f"🔑 Using Gemini key: {google_api_key[5:]}...")
+    def _create_llm(cls, google_api_key: str):
+        """Build the long-lived Gemini client for one API key (see core.llm_pool)"""
+        if settings.LLM_BACKEND == "fake":
+            return FakeStoryLLM(
+                latency=settings.FAKE_LLM_LATENCY_SECONDS,
+                rate_limit_rate=settings.FAKE_LLM_RATE_LIMIT_RATE,
+                failure_rate=settings.FAKE_LLM_FAILURE_RATE,
+                responses=load_canned_responses(settings.FAKE_LLM_RESPONSES_PATH)
+                if settings.FAKE_LLM_RESPONSES_PATH
+                else (),
+            )
+
+        endpoint_options = {}
+        if settings.GOOGLE_API_ENDPOINT:
+            # e.g. a regional endpoint or a local fake for tests
+            endpoint_options["client_options"] = {
+                "api_endpoint": settings.GOOGLE_API_ENDPOINT
+            }
 
         return ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
+            model=cls.MODEL,
             google_api_key=google_api_key,  # type: ignore
-            temperature=0.7,
-            max_output_tokens=2048,  # type: ignore
-            # response_mime_type="application/json",  # 👈 tells Gemini to return pure JSON # type: ignore
+            temperature=cls.TEMPERATURE,
+            max_output_tokens=cls.MAX_OUTPUT_TOKENS,  # type: ignore
+            # The key pool handles 429s by moving to another key
+            max_retries=settings.LLM_CLIENT_MAX_RETRIES,
+            **endpoint_options,
         )
 
+    @staticmethod
+    def _format_instructions(parser: PydanticOutputParser) -> str:
+        # Structured mode sends the schema with the request, not in the prompt
+        if settings.LLM_OUTPUT_MODE == "structured":
+            return STRUCTURED_FORMAT_INSTRUCTIONS
+        return parser.get_format_instructions()
+
+    @staticmethod
+    def _output_options(schema: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-call arguments that turn on Gemini's JSON mode with `schema`"""
+        if settings.LLM_OUTPUT_MODE != "structured":
+            return {}
+        return {"response_mime_type": "application/json", "response_schema": schema}
+
+    @staticmethod
+    def _record_prompt_tokens(prompt, raw_response=None):
+        usage = getattr(raw_response, "usage_metadata", None)
+        if usage and usage.get("input_tokens"):
+            tokens = usage["input_tokens"]
+        else:
+            tokens = len(prompt.to_string()) // 4  # ~4 characters per token
+        PROMPT_TOKENS.labels(settings.LLM_OUTPUT_MODE).observe(tokens)
+
+    @classmethod
+    def _build_prompt(
+        cls, theme: str, story_parser: PydanticOutputParser, system_prompt: str = STORY_PROMPT
+    ):
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", system_prompt),
+                ("human", f"Create the story with this theme: {theme}"),
+            ]
+        ).partial(format_instructions=cls._format_instructions(story_parser))
+        return prompt.invoke({})
+
     @classmethod
-    def generate_story(cls, db: Session, session_id: str, theme: str = "fantasy"):
-        llm = cls._get_llm()
+    async def generate_story(
+        cls, db: AsyncSession, session_id: str, theme: str = "fantasy"
+    ) -> Story:
+        story_structure = await cls._story_structure(theme, STORY_PROMPT)
+        return await cls._save_story(db, session_id, theme, story_structure)
+
+    @classmethod
+    async def generate_lazy_story(
+        cls, db: AsyncSession, session_id: str, theme: str = "fantasy"
+    ) -> Story:
+        """
+        Generate only the root node and its option texts. Branches are
+        written by `generate_branch` when a player picks them.
+        """
+        story_structure = await cls._story_structure(theme, LAZY_STORY_PROMPT)
+        return await cls._save_story(
+            db, session_id, theme, story_structure, generation_mode="lazy"
+        )
+
+    @classmethod
+    def _variant_key(cls, theme: str, system_prompt: str) -> Tuple:
+        prompt_kind = "lazy" if system_prompt is LAZY_STORY_PROMPT else "story"
+        return (
+            normalize_theme(theme),
+            prompt_kind,
+            STORY_PROMPT_VERSION,
+            settings.LLM_OUTPUT_MODE,
+            cls.MODEL,
+            cls.TEMPERATURE,
+            cls.MAX_OUTPUT_TOKENS,
+        )
+
+    @classmethod
+    async def _story_structure(cls, theme: str, system_prompt: str) -> StoryLLMResponse:
+        """
+        Story JSON from the variant cache when enabled, else from Gemini.
+        With STORY_COALESCE_GENERATION, overlapping requests for the same
+        theme and parameters share one call (and so one story).
+        """
+        generate = partial(cls._generate_variant, theme, system_prompt)
+        if settings.STORY_VARIANT_CACHE_ENABLED:
+            return await story_variant_cache.get_or_generate(
+                cls._variant_key(theme, system_prompt), generate
+            )
+        if settings.STORY_COALESCE_GENERATION:
+            key = cls._variant_key(theme, system_prompt)
+            return (await generate_once(key, generate)).structure
+        return (await generate()).structure
+
+    @classmethod
+    async def _generate_variant(cls, theme: str, system_prompt: str) -> StoryVariant:
         story_parser = PydanticOutputParser(pydantic_object=StoryLLMResponse)
+        started = time.monotonic()
+        prompt = cls._build_prompt(theme, story_parser, system_prompt)
+        lazy = system_prompt is LAZY_STORY_PROMPT
+        schema = story_schema(1, open_options=True) if lazy else story_schema()
+
+        key_ids: List[str] = []
+        try:
+            # Run Gemini without holding a thread for the round trip
+            async with get_llm_pool().acquire() as lease:
+                key_ids.append(lease.key_id)
+                with timed("llm_invoke"):
+                    raw_response = await lease.client.ainvoke(
+                        prompt, **cls._output_options(schema)
+                    )
+            cls._record_prompt_tokens(prompt, raw_response)
+            story_structure = cls._parse_response(raw_response)
+        except Exception as error:
+            # Shared with every caller of a coalesced call (see generate_once)
+            error.llm_key_ids = tuple(key_ids)  # type: ignore[attr-defined]
+            raise
+
+        return StoryVariant(
+            structure=story_structure,
+            latency_seconds=time.monotonic() - started,
+            tokens=cls._count_tokens(raw_response),
+            key_ids=tuple(key_ids),
+        )
+
+    @staticmethod
+    def _count_tokens(raw_response) -> int:
+        usage = getattr(raw_response, "usage_metadata", None)
+        if usage:
+            return usage.get("total_tokens", 0)
+        # Rough estimate (~4 characters per token) when usage isn't reported
+        return len(str(getattr(raw_response, "content", ""))) // 4
+
+    @classmethod
+    async def generate_branch(
+        cls,
+        story: Story,
+        path: Sequence[Tuple[str, str]],
+        choice: str,
+        depth: int,
+    ) -> StoryNodeLLM:
+        """
+        Generate the subtree behind `choice`. `path` holds the
+        (scene, chosen option) pairs from the root to the current node.
+        """
+        node_parser = PydanticOutputParser(pydantic_object=StoryNodeLLM)
+        history = "\n".join(
+            f"{index}. {scene}\n   -> {chosen}"
+            for index, (scene, chosen) in enumerate(path, start=1)
+        )
 
         prompt = ChatPromptTemplate.from_messages(
             [
-                ("system", STORY_PROMPT),
-                ("human", f"Create the story with this theme: {theme}"),
+                ("system", BRANCH_PROMPT),
+                ("human", f"Continue the story after the choice: {choice}"),
             ]
-        ).partial(format_instructions=story_parser.get_format_instructions())
+        ).partial(
+            title=story.title,
+            theme=story.theme or "adventure",
+            history=history,
+            depth=str(depth),
+            max_depth=str(settings.LAZY_MAX_DEPTH),
+            levels=str(settings.LAZY_BRANCH_LEVELS),
+            format_instructions=cls._format_instructions(node_parser),
+        ).invoke({})
+        schema = node_schema(settings.LAZY_BRANCH_LEVELS, open_options=True)
 
-        # Run Gemini
-        raw_response = llm.invoke(prompt.invoke({}))
+        async with get_llm_pool().acquire() as lease:
+            with timed("llm_invoke"):
+                raw_response = await lease.client.ainvoke(
+                    prompt, **cls._output_options(schema)
+                )
+        cls._record_prompt_tokens(prompt, raw_response)
+        return cls._parse_response(raw_response, StoryNodeLLM)
 
-        # ✅ Extract response content safely
+    @classmethod
+    def _parse_response(cls, raw_response, model: Type[BaseModel] = StoryLLMResponse):
+        mode = settings.LLM_OUTPUT_MODE
         response_text = getattr(raw_response, "content", None)
         if not response_text:
-            raise ValueError(
+            PARSE_RESULTS.labels(mode, "failed").inc()
+            raise MalformedLLMResponse(
                 "Gemini returned no content — check API quota or response format."
             )
 
-        # print("\n🧠 RAW GEMINI OUTPUT:\n", response_text[:1000])
-        # print("-" * 80)
-
-        # ✅ Clean markdown fences
-        response_text = re.sub(
-            r"^```json|```$", "", response_text.strip(), flags=re.MULTILINE
-        )
-
-        # ✅ Try direct parse
+        # Well-formed JSON is parsed and validated in one pass by pydantic-core
         try:
-            story_structure = story_parser.parse(response_text)
-        except Exception as e:
-            print(f"⚠️ JSON parsing failed: {e}")
-            cleaned_json = cls._extract_json(response_text)
-            print("🛠 CLEANED JSON:\n", cleaned_json[:800])
+            with timed("parse"):
+                result = model.model_validate_json(response_text)
+            PARSE_RESULTS.labels(mode, "ok").inc()
+            return result
+        except ValidationError as e:
+            if any(error["type"] != "json_invalid" for error in e.errors()):
+                PARSE_RESULTS.labels(mode, "failed").inc()
+                raise MalformedLLMResponse(f"❌ Story JSON does not match the schema: {e}")
+            logger.warning("Story JSON is malformed, repairing it: %s", e.errors()[0]["msg"])
 
+        # Fences, prose, stray commas or a cut-off answer: repair in one pass
+        with timed("repair"):
+            repaired = repair_json(response_text, starts="{")
+            data = repaired.value
+            if repaired.truncated:
+                data = cls._drop_truncated_nodes(data)
+            logger.debug("Repaired story JSON (%s fixes): %.800s", repaired.repairs, data)
             try:
-                data = json.loads(cleaned_json)
-                story_structure = StoryLLMResponse.model_validate(data)
-            except Exception as inner_e:
-                raise ValueError(f"❌ Still invalid JSON after cleaning: {inner_e}")
+                result = model.model_validate(data)
+            except ValidationError as inner_e:
+                PARSE_RESULTS.labels(mode, "failed").inc()
+                raise MalformedLLMResponse(f"❌ Still invalid JSON after repair: {inner_e}")
+        PARSE_RESULTS.labels(mode, "repaired").inc()
+        return result
 
-        # ✅ Save to DB
-        story_db = Story(title=story_structure.title, session_id=session_id)
+    @classmethod
+    def _drop_truncated_nodes(cls, data: Any) -> Any:
+        """
+        Make a cut-off story playable: options whose scene never arrived
+        are removed, and a scene left without options becomes an ending.
+        """
+        node = data.get("rootNode", data) if isinstance(data, dict) else None
+        if isinstance(node, dict):
+            cls._prune_node(node)
+        return data
+
+    @classmethod
+    def _prune_node(cls, node: Dict[str, Any]) -> bool:
+        """False when `node` itself was cut off before its content"""
+        if not isinstance(node.get("content"), str):
+            return False
+        options = node.get("options")
+        if not isinstance(options, list) or node.get("isEnding"):
+            return True
+
+        # Mixed options mean the later ones lost their scene to the cut
+        has_scenes = any(isinstance(o, dict) and o.get("nextNode") for o in options)
+        node["options"] = [
+            option
+            for option in options
+            if isinstance(option, dict)
+            and isinstance(option.get("text"), str)
+            and (
+                cls._prune_node(option["nextNode"])
+                if isinstance(option.get("nextNode"), dict)
+                else not has_scenes
+            )
+        ]
+        if not node["options"]:
+            node["isEnding"] = True
+            node["isWinningEnding"] = False
+        return True
+
+    @classmethod
+    async def _save_story(
+        cls,
+        db: AsyncSession,
+        session_id: str,
+        theme: str,
+        story_structure: StoryLLMResponse,
+        generation_mode: str = "batch",
+    ) -> Story:
+        story_db = Story(
+            title=story_structure.title,
+            session_id=session_id,
+            theme=theme,
+            generation_mode=generation_mode,
+        )
         db.add(story_db)
-        db.flush()
+        await db.flush()
 
         root_node_data = story_structure.rootNode
         if isinstance(root_node_data, dict):
             root_node_data = StoryNodeLLM.model_validate(root_node_data)
 
-        cls._process_story_node(db, story_db.id, root_node_data, is_root=True)  # type: ignore
+        graph: StoryGraph = {}
+        with timed("persist"):
+            root_id = await cls._persist_story_tree(
+                db, story_db.id, root_node_data, graph=graph  # type: ignore
+            )
+            for column, value in compute_metrics(graph, root_id).items():
+                setattr(story_db, column, value)
 
-        db.commit()
+        with timed("commit"):
+            await db.commit()
         return story_db
 
-    @staticmethod
-    def _extract_json(text: str) -> str:
+    @classmethod
+    async def generate_story_streaming(
+        cls,
+        db: AsyncSession,
+        session_id: str,
+        theme: str,
+        on_first_node: Callable[[Story], Awaitable[None]],
+    ) -> Story:
         """
-        Attempt to extract or repair JSON from Gemini’s output.
-        Handles truncated JSON and removes garbage.
+        Stream the story from Gemini and persist nodes as they complete.
+        `on_first_node` runs once the root node is committed.
         """
-        # Remove markdown fences
-        text = text.strip().replace("```json", "").replace("```", "")
-
-        # Extract first '{' and last '}' block
-        start = text.find("{")
-        end = text.rfind("}")
-        if start != -1 and end != -1 and end > start:
-            json_candidate = text[start : end + 1]
-        else:
-            json_candidate = text
-
-        # Try basic repair for truncated output
-        open_braces = json_candidate.count("{")
-        close_braces = json_candidate.count("}")
-        if open_braces > close_braces:
-            json_candidate += "}" * (open_braces - close_braces)
+        if settings.STORY_VARIANT_CACHE_ENABLED:
+            key = cls._variant_key(theme, STORY_PROMPT)
+            variant = story_variant_cache.take(key)
+            if variant is not None:
+                # Cached stories are complete already, nothing to stream
+                return await cls._save_story(db, session_id, theme, variant.structure)
 
-        # Remove trailing commas (common cause of JSON errors)
-        json_candidate = re.sub(r",(\s*[}\]])", r"\1", json_candidate)
+        story_parser = PydanticOutputParser(pydantic_object=StoryLLMResponse)
+        json_parser = JSONStreamParser()
+        started = time.monotonic()
+        writer = StreamingStoryWriter(db, session_id, theme, on_first_node)
 
-        return json_candidate
+        # "llm_stream" includes the parse and persist time spent per chunk,
+        # which is summed and reported once per story
+        parse_seconds = persist_seconds = 0.0
+        prompt = cls._build_prompt(theme, story_parser)
+        cls._record_prompt_tokens(prompt)
+        async with get_llm_pool().acquire() as lease:
+            with timed("llm_stream"):
+                async for chunk in lease.client.astream(
+                    prompt, **cls._output_options(story_schema())
+                ):
+                    if isinstance(chunk.content, str):
+                        chunk_started = time.perf_counter()
+                        events = json_parser.feed(chunk.content)
+                        parsed = time.perf_counter()
+                        await writer.handle(events)
+                        parse_seconds += parsed - chunk_started
+                        persist_seconds += time.perf_counter() - parsed
+        observe_stage("parse", parse_seconds)
+        observe_stage("persist", persist_seconds)
 
-    @classmethod
-    def _process_story_node(
-        cls, db: Session, story_id: int, node_data: StoryNodeLLM, is_root: bool = False
-    ) -> StoryNode:
-        node = StoryNode(
-            story_id=story_id,
-            content=node_data.content,
-            is_root=is_root,
-            is_ending=node_data.isEnding,
-            is_winning_ending=node_data.isWinningEnding,
-            options=[],
-        )
-        db.add(node)
-        db.flush()
+        if not json_parser.done:
+            raise MalformedLLMResponse("Gemini stream ended before the story JSON was complete")
 
-        if not node.is_ending and (hasattr(node_data, "options") and node_data.options):  # type: ignore
-            options_list = []
-            for option_data in node_data.options:
-                next_node = option_data.nextNode
-
-                if isinstance(next_node, dict):
-                    next_node = StoryNodeLLM.model_validate(next_node)
+        story_structure = StoryLLMResponse.model_validate(json_parser.root)
+        if settings.STORY_VARIANT_CACHE_ENABLED:
+            story_variant_cache.add(
+                key,
+                StoryVariant(
+                    structure=story_structure,
+                    latency_seconds=time.monotonic() - started,
+                    tokens=len(json.dumps(json_parser.root)) // 4,
+                ),
+            )
+        with timed("commit"):
+            return await writer.finish(story_structure)
 
-                child_node = cls._process_story_node(db, story_id, next_node, False)  # type: ignore
+    @staticmethod
+    def _collect_levels(root: StoryNodeLLM) -> List[List[Tuple[StoryNodeLLM, list]]]:
+        """
+        Flatten the LLM tree into depth levels. Each entry is the node and
+        its `(option text, child entry)` pairs; the child entry is None for
+        options left to be generated lazily.
+        """
+        root_entry: Tuple[StoryNodeLLM, list] = (root, [])
+        levels = [[root_entry]]
+        while True:
+            next_level = []
+            for node_data, children in levels[-1]:
+                if node_data.isEnding or not node_data.options:
+                    continue
+                for option_data in node_data.options:
+                    next_node = option_data.nextNode
+                    if next_node is None:
+                        children.append((option_data.text, None))
+                        continue
+                    if isinstance(next_node, dict):
+                        next_node = StoryNodeLLM.model_validate(next_node)
+                    child_entry = (next_node, [])
+                    children.append((option_data.text, child_entry))
+                    next_level.append(child_entry)
+            if not next_level:
+                return levels
+            levels.append(next_level)
 
-                options_list.append(
-                    {"text": option_data.text, "node_id": child_node.id}
-                )
+    @classmethod
+    async def _persist_story_tree(
+        cls,
+        db: AsyncSession,
+        story_id: int,
+        root: StoryNodeLLM,
+        is_root: bool = True,
+        graph: Optional[StoryGraph] = None,
+    ) -> int:
+        """
+        Insert the tree with one INSERT ... RETURNING per depth level.
+        Levels are written deepest first, so every parent row is inserted
+        with its options already pointing at real child ids. The options
+        also go to story_edges in one more executemany INSERT.
+        Returns the root node id; `graph` is filled in for analytics.
+        """
+        levels = cls._collect_levels(root)
+        node_ids: Dict[int, int] = {}
+        edges: List[Dict[str, Any]] = []
 
-            node.options = options_list  # type: ignore
+        for depth in range(len(levels) - 1, -1, -1):
+            level = levels[depth]
+            rows = [
+                {
+                    "story_id": story_id,
+                    "content": node_data.content,
+                    "is_root": is_root and depth == 0,
+                    "is_ending": node_data.isEnding,
+                    "is_winning_ending": node_data.isWinningEnding,
+                    "options": [
+                        {"text": text, "node_id": node_ids[id(child)] if child else None}
+                        for text, child in children
+                    ],
+                }
+                for node_data, children in level
+            ]
+            result = await db.execute(
+                insert(StoryNode).returning(StoryNode.id, sort_by_parameter_order=True),
+                rows,
+            )
+            for entry, row, node_id in zip(level, rows, result.scalars()):
+                node_ids[id(entry)] = node_id
+                edges.extend(edge_rows(story_id, node_id, row["options"]))
+                if graph is not None:
+                    graph[node_id] = (
+                        row["is_ending"],
+                        row["is_winning_ending"],
+                        [o["node_id"] for o in row["options"] if o["node_id"] is not None],
+                    )
 
-        db.flush()
-        return node
+        await insert_edges(db, edges)
+        return node_ids[id(levels[0][0])]
@@ -0,0 +1,319 @@
+"""
+The story graph in the `story_edges` table.
+
+Each option of a node is also an edge row (from_node_id, ordinal, text,
+to_node_id) written next to the `options` JSON, which the API still
+returns. The two are written together: `edge_rows` when a tree is first
+saved, then only `add_option` and `link_option`, which change both.
+Path questions are answered by recursive CTEs in the database instead of
+loading every node of a story into Python:
+
+- `path_to_node`: the scenes and choices from the root down to a node
+- `reachable_endings`: the endings below a node, and how many choices away
+- `replay_path`: the nodes a list of option indexes leads through, in a
+  single query on the (from_node_id, ordinal) index
+
+Stories written before the table existed are converted with:
+
+    python -m core.story_graph [--batch-size 500]
+
+`--check` then compares every node's edges with its options JSON and
+logs the nodes where they differ; `--repair` also rewrites those edges
+from the JSON, which is what players are served.
+"""
+
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, exists, insert, literal_column, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from db.database import AsyncSessionLocal, async_engine, create_table
+from models.story import Story, StoryEdge, StoryNode
+
+logger = logging.getLogger(__name__)
+
+# Recursion limit, so a corrupt edge loop can't make a query run forever
+MAX_PATH_LENGTH = 200
+
+
+def edge_rows(
+    story_id: int, node_id: int, options: Optional[Sequence[dict]]
+) -> List[Dict[str, Any]]:
+    """`story_edges` rows for a node's options JSON"""
+    return [
+        {
+            "story_id": story_id,
+            "from_node_id": node_id,
+            "to_node_id": option.get("node_id"),
+            "ordinal": ordinal,
+            "text": option["text"],
+        }
+        for ordinal, option in enumerate(options or [])
+    ]
+
+
+async def insert_edges(db: AsyncSession, rows: List[Dict[str, Any]]):
+    if rows:
+        await db.execute(insert(StoryEdge), rows)
+
+
+def add_option(db: AsyncSession, parent: StoryNode, text: str, to_node_id: Optional[int]):
+    """
+    Append an option to `parent`, in its options JSON and as an edge;
+    `to_node_id` None leaves it to be generated lazily
+    """
+    db.add(
+        StoryEdge(
+            story_id=parent.story_id,
+            from_node_id=parent.id,
+            to_node_id=to_node_id,
+            ordinal=len(parent.options),  # type: ignore
+            text=text,
+        )
+    )
+    # Assign a new list so the JSON column is flagged as changed
+    parent.options = [*parent.options, {"text": text, "node_id": to_node_id}]  # type: ignore
+
+
+async def link_option(db: AsyncSession, parent: StoryNode, ordinal: int, to_node_id: int):
+    """Point a lazy option at the branch generated for it"""
+    options = list(parent.options)  # type: ignore
+    options[ordinal] = {**options[ordinal], "node_id": to_node_id}
+    parent.options = options  # type: ignore
+    await db.execute(
+        update(StoryEdge)
+        .where(StoryEdge.from_node_id == parent.id, StoryEdge.ordinal == ordinal)
+        .values(to_node_id=to_node_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def path_to_node(db: AsyncSession, node_id: int) -> List[Tuple[StoryNode, StoryEdge]]:
+    """
+    (node, option taken) pairs from the root down to the parent of
+    `node_id`; empty for the root. Stories are trees, so each node has
+    one incoming edge and the walk up is a single chain.
+    """
+    up = (
+        select(
+            StoryEdge.id.label("edge_id"),
+            StoryEdge.from_node_id,
+            literal_column("1").label("distance"),
+        )
+        .where(StoryEdge.to_node_id == node_id)
+        .cte("path_up", recursive=True)
+    )
+    parent_edge = aliased(StoryEdge)
+    up = up.union_all(
+        select(parent_edge.id, parent_edge.from_node_id, up.c.distance + 1).where(
+            parent_edge.to_node_id == up.c.from_node_id, up.c.distance < MAX_PATH_LENGTH
+        )
+    )
+    rows = await db.execute(
+        select(StoryNode, StoryEdge)
+        .join(StoryEdge, StoryEdge.from_node_id == StoryNode.id)
+        .join(up, up.c.edge_id == StoryEdge.id)
+        .order_by(up.c.distance.desc())
+    )
+    return [(node, edge) for node, edge in rows.all()]
+
+
+async def reachable_endings(db: AsyncSession, node_id: int) -> List[Tuple[StoryNode, int]]:
+    """Ending nodes reachable from `node_id` with the number of choices to each"""
+    down = (
+        select(StoryNode.id.label("node_id"), literal_column("0").label("distance"))
+        .where(StoryNode.id == node_id)
+        .cte("reachable", recursive=True)
+    )
+    down = down.union_all(
+        select(StoryEdge.to_node_id, down.c.distance + 1).where(
+            StoryEdge.from_node_id == down.c.node_id,
+            StoryEdge.to_node_id.is_not(None),
+            down.c.distance < MAX_PATH_LENGTH,
+        )
+    )
+    rows = await db.execute(
+        select(StoryNode, down.c.distance)
+        .join(down, down.c.node_id == StoryNode.id)
+        .where(StoryNode.is_ending.is_(True))
+        .order_by(down.c.distance, StoryNode.id)
+    )
+    return [(node, distance) for node, distance in rows.all()]
+
+
+async def replay_path(
+    db: AsyncSession, story_id: int, choices: Sequence[int]
+) -> List[StoryNode]:
+    """
+    The root and the node after each choice (an option index), in order.
+    Stops early at an invalid or not yet generated option, so fewer than
+    `len(choices) + 1` nodes means the path broke off there.
+    """
+    walk = (
+        select(StoryNode.id.label("node_id"), literal_column("0").label("step"))
+        .where(StoryNode.story_id == story_id, StoryNode.is_root.is_(True))
+        .cte("walk", recursive=True)
+    )
+    if choices:
+        # The choices as a (step, ordinal) table; ints, so inlining is safe
+        steps = union_all(
+            *(
+                select(
+                    literal_column(str(step)).label("step"),
+                    literal_column(str(int(ordinal))).label("ordinal"),
+                )
+                for step, ordinal in enumerate(choices)
+            )
+        ).cte("choices")
+        walk = walk.union_all(
+            select(StoryEdge.to_node_id, walk.c.step + 1)
+            .select_from(walk)
+            .join(steps, steps.c.step == walk.c.step)
+            .join(
+                StoryEdge,
+                and_(
+                    StoryEdge.from_node_id == walk.c.node_id,
+                    StoryEdge.ordinal == steps.c.ordinal,
+                ),
+            )
+            .where(StoryEdge.to_node_id.is_not(None))
+        )
+    nodes = await db.scalars(
+        select(StoryNode).join(walk, walk.c.node_id == StoryNode.id).order_by(walk.c.step)
+    )
+    return list(nodes.all())
+
+
+async def backfill(batch_size: int) -> int:
+    """Write edges for stories that have none yet; returns the stories converted"""
+    converted = 0
+    last_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            story_ids = (
+                await db.scalars(
+                    select(Story.id)
+                    .where(
+                        Story.id > last_id,
+                        ~exists().where(StoryEdge.story_id == Story.id),
+                    )
+                    .order_by(Story.id)
+                    .limit(batch_size)
+                )
+            ).all()
+            if not story_ids:
+                return converted
+
+            nodes_by_story: Dict[int, List[StoryNode]] = defaultdict(list)
+            for node in await db.scalars(
+                select(StoryNode).where(StoryNode.story_id.in_(story_ids))
+            ):
+                nodes_by_story[node.story_id].append(node)  # type: ignore
+
+            rows = [
+                row
+                for story_id in story_ids
+                for node in nodes_by_story[story_id]
+                for row in edge_rows(story_id, node.id, node.options)  # type: ignore
+            ]
+            await insert_edges(db, rows)
+            await db.commit()
+
+            converted += len(story_ids)
+            last_id = story_ids[-1]
+            logger.info("Converted story options up to id %s (%s edges)", last_id, len(rows))
+
+
+def _edges_match(node: StoryNode, edges: Sequence[StoryEdge]) -> bool:
+    expected = [
+        (row["ordinal"], row["text"], row["to_node_id"])
+        for row in edge_rows(node.story_id, node.id, node.options)  # type: ignore
+    ]
+    return expected == sorted((edge.ordinal, edge.text, edge.to_node_id) for edge in edges)
+
+
+async def check(batch_size: int, repair: bool = False) -> int:
+    """
+    Count the nodes whose edges differ from their options JSON; `repair`
+    replaces those edges with rows made from the JSON
+    """
+    mismatched = 0
+    last_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            story_ids = (
+                await db.scalars(
+                    select(Story.id).where(Story.id > last_id).order_by(Story.id).limit(batch_size)
+                )
+            ).all()
+            if not story_ids:
+                return mismatched
+
+            edges_by_node: Dict[int, List[StoryEdge]] = defaultdict(list)
+            for edge in await db.scalars(
+                select(StoryEdge).where(StoryEdge.story_id.in_(story_ids))
+            ):
+                edges_by_node[edge.from_node_id].append(edge)  # type: ignore
+
+            nodes = await db.scalars(select(StoryNode).where(StoryNode.story_id.in_(story_ids)))
+            broken = [node for node in nodes if not _edges_match(node, edges_by_node[node.id])]  # type: ignore
+            for node in broken:
+                logger.warning(
+                    "Story %s node %s: story_edges differ from the options JSON",
+                    node.story_id,
+                    node.id,
+                )
+
+            if repair and broken:
+                await db.execute(
+                    delete(StoryEdge).where(StoryEdge.from_node_id.in_([n.id for n in broken]))
+                )
+                await insert_edges(
+                    db,
+                    [
+                        row
+                        for node in broken
+                        for row in edge_rows(node.story_id, node.id, node.options)  # type: ignore
+                    ],
+                )
+                await db.commit()
+
+            mismatched += len(broken)
+            last_id = story_ids[-1]
+
+
+async def main(batch_size: int, run_check: bool, repair: bool):
+    try:
+        count = await backfill(batch_size)
+        logger.info("Wrote story edges for %s stories", count)
+        if run_check or repair:
+            mismatched = await check(batch_size, repair)
+            logger.info(
+                "%s nodes had edges that differ from their options%s",
+                mismatched,
+                " (repaired)" if repair and mismatched else "",
+            )
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert StoryNode.options to story_edges")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--check", action="store_true", help="report nodes whose edges differ from their options"
+    )
+    parser.add_argument(
+        "--repair", action="store_true", help="rewrite those edges from the options JSON"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    create_table()
+
+    asyncio.run(main(args.batch_size, args.check, args.repair))
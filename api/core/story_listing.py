@@ -0,0 +1,67 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.orm import InstrumentedAttribute
+
+from models.story import Story
+
+# Only what a history list needs; node content never leaves the nodes table
+SUMMARY_COLUMNS = (
+    Story.id,
+    Story.title,
+    Story.session_id,
+    Story.created_at,
+    Story.theme,
+    Story.generation_mode,
+    Story.is_complete,
+    Story.depth,
+    Story.node_count,
+    Story.ending_count,
+    Story.winning_ending_count,
+    Story.winning_path_count,
+    Story.shortest_winning_path,
+)
+
+
+def encode_cursor(created_at: datetime, story_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{story_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, story_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(story_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def story_page_query(
+    owner_column: InstrumentedAttribute, owner: str, cursor: Optional[str], limit: int
+) -> Select:
+    """
+    Newest-first page of an owner's stories (by session or user).
+
+    Keyset pagination on (owner, created_at, id): the next page starts
+    after the last row seen, so every page is one index range scan however
+    deep the history goes. One extra row is fetched to tell whether there
+    is a next page.
+    """
+    query = select(*SUMMARY_COLUMNS).where(owner_column == owner)
+    if cursor:
+        created_at, story_id = decode_cursor(cursor)
+        query = query.where(tuple_(Story.created_at, Story.id) < (created_at, story_id))
+    return query.order_by(Story.created_at.desc(), Story.id.desc()).limit(limit + 1)
+
+
+def split_page(rows: Sequence, limit: int) -> Tuple[Sequence, Optional[str]]:
+    """The page to return and the cursor for the one after it"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
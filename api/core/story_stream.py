@@ -0,0 +1,177 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.json_stream import Event, Path
+from core.models import MalformedLLMResponse, StoryLLMResponse
+from core.story_analytics import refresh_story_metrics
+from core.story_graph import add_option
+from models.story import Story, StoryNode
+
+ROOT_PATH: Path = ("rootNode",)
+
+
+def _is_node_path(path: Path) -> bool:
+    return path == ROOT_PATH or (
+        len(path) > 3 and path[-1] == "nextNode" and path[-3] == "options"
+    )
+
+
+def _is_option_path(path: Path) -> bool:
+    return len(path) > 2 and path[-2] == "options" and isinstance(path[-1], int)
+
+
+async def close_truncated_story(db: AsyncSession, story_id: int):
+    """
+    Finish a streamed story whose stream broke off. Scenes whose options
+    never arrived become losing endings, so every path still ends, and the
+    story is marked complete so clients stop waiting for more of it and
+    it can be cached. The caller commits.
+    """
+    nodes = (await db.scalars(select(StoryNode).where(StoryNode.story_id == story_id))).all()
+    for node in nodes:
+        if not node.is_ending and not node.options:
+            node.is_ending = True  # type: ignore
+            node.is_winning_ending = False  # type: ignore
+    await db.execute(
+        update(Story)
+        .where(Story.id == story_id)
+        .values(is_complete=True)
+        .execution_options(synchronize_session=False)
+    )
+    await db.flush()
+    await refresh_story_metrics(db, story_id)
+
+
+class StreamingStoryWriter:
+    """
+    Persists story nodes while the LLM is still streaming the story JSON.
+
+    A node is written as soon as its content is known (its `options` array
+    opens, or the node object closes), and is linked into its parent's
+    options right away, so the start of the story is playable long before
+    the last branch arrives. Each write is committed for readers.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        theme: str,
+        on_first_node: Callable[[Story], Awaitable[None]],
+    ):
+        self.db = db
+        self.session_id = session_id
+        self.theme = theme
+        self.on_first_node = on_first_node
+        self.story: Optional[Story] = None
+        self._title: Optional[str] = None
+        self._nodes: Dict[Path, Dict[str, Any]] = {}
+        self._rows: Dict[Path, StoryNode] = {}
+        self._option_texts: Dict[Path, str] = {}
+        self._linked: Set[Path] = set()
+
+    async def handle(self, events: list[Event]):
+        for kind, path, value in events:
+            if kind == "value" and path == ("title",):
+                await self._set_title(value)
+            elif kind == "start_map" and _is_node_path(path):
+                self._nodes[path] = value
+            elif kind == "start_array" and path[-1:] == ("options",) and path[:-1] in self._nodes:
+                await self._insert_node(path[:-1])
+            elif kind == "end_map" and path in self._nodes:
+                await self._insert_node(path)
+                await self._sync_node(path)
+            elif kind == "value" and path[-1:] == ("text",) and _is_option_path(path[:-1]):
+                self._option_texts[path[:-1]] = value
+                if await self._link(path[:-1]):
+                    await self.db.commit()
+
+    async def finish(self, story_structure: StoryLLMResponse) -> Story:
+        """Mark the story complete once the full document has been validated"""
+        if self.story is None or ROOT_PATH not in self._rows:
+            raise MalformedLLMResponse("Gemini stream ended before the root node was written")
+
+        self.story.title = story_structure.title  # type: ignore
+        self.story.is_complete = True  # type: ignore
+        await self.db.flush()
+        await refresh_story_metrics(self.db, self.story.id)  # type: ignore
+        await self.db.commit()
+        await self.db.refresh(self.story)
+        return self.story
+
+    async def _ensure_story(self) -> Story:
+        if self.story is None:
+            self.story = Story(
+                title=self._title or "Untitled story",
+                session_id=self.session_id,
+                theme=self.theme,
+                generation_mode="stream",
+                is_complete=False,
+            )
+            self.db.add(self.story)
+            await self.db.flush()
+        return self.story
+
+    async def _set_title(self, title: str):
+        self._title = title
+        if self.story is not None:
+            self.story.title = title  # type: ignore
+            await self.db.commit()
+
+    async def _insert_node(self, path: Path):
+        if path in self._rows:
+            return
+
+        story = await self._ensure_story()
+        node_data = self._nodes[path]
+        node = StoryNode(
+            story_id=story.id,
+            content=node_data.get("content") or "",
+            is_root=path == ROOT_PATH,
+            is_ending=bool(node_data.get("isEnding")),
+            is_winning_ending=bool(node_data.get("isWinningEnding")),
+            options=[],
+        )
+        self.db.add(node)
+        await self.db.flush()
+        self._rows[path] = node
+
+        if path != ROOT_PATH:
+            await self._link(path[:-1])
+        await self.db.commit()
+
+        if path == ROOT_PATH:
+            await self.on_first_node(story)
+
+    async def _sync_node(self, path: Path):
+        """Pick up fields that arrived after the node was written"""
+        node, node_data = self._rows[path], self._nodes[path]
+        content = node_data.get("content") or ""
+        is_ending = bool(node_data.get("isEnding"))
+        is_winning_ending = bool(node_data.get("isWinningEnding"))
+        if (node.content, node.is_ending, node.is_winning_ending) != (
+            content,
+            is_ending,
+            is_winning_ending,
+        ):
+            node.content = content  # type: ignore
+            node.is_ending = is_ending  # type: ignore
+            node.is_winning_ending = is_winning_ending  # type: ignore
+            await self.db.commit()
+
+    async def _link(self, option_path: Path) -> bool:
+        """Add a child to its parent's options once both it and its text exist"""
+        if option_path in self._linked:
+            return False
+
+        parent = self._rows.get(option_path[:-2])
+        child = self._rows.get(option_path + ("nextNode",))
+        text = self._option_texts.get(option_path)
+        if parent is None or child is None or text is None:
+            return False
+
+        add_option(self.db, parent, text, child.id)  # type: ignore
+        self._linked.add(option_path)
+        return True
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Set, Tuple
+
+from core.config import settings
+from core.llm_pool import credit_keys
+from core.models import StoryLLMResponse
+from core.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class StoryVariant(NamedTuple):
+    structure: StoryLLMResponse
+    # What producing it cost, i.e. what every reuse saves
+    latency_seconds: float
+    tokens: int
+    # Fingerprints of the API keys leased to produce it
+    key_ids: Tuple[str, ...] = ()
+
+
+VariantFactory = Callable[[], Awaitable[StoryVariant]]
+
+
+# Identical requests that overlap share one Gemini call, keyed like the
+# variant cache; only used when players may share a story
+story_generations = SingleFlight("story_generation")
+
+
+async def generate_once(key: Hashable, factory: VariantFactory) -> StoryVariant:
+    """
+    `story_generations.do`, crediting the keys the shared call leased to
+    every caller's `key_scope`. Only the first caller's scope sees the
+    lease itself, and a job retried after a failed call must avoid the key
+    whichever caller it was (see core.worker).
+    """
+    try:
+        variant = await story_generations.do(key, factory)
+    except Exception as error:
+        credit_keys(getattr(error, "llm_key_ids", ()))
+        raise
+    credit_keys(variant.key_ids)
+    return variant
+
+
+def normalize_theme(theme: str) -> str:
+    """'  Space  Pirates! ' and 'space pirates' share cached variants"""
+    theme = re.sub(r"\s+", " ", theme.strip().lower())
+    return theme.strip(" .,!?;:'\"")
+
+
+class ThemeVariantCache:
+    """
+    Pre-generated story structures per theme (plus prompt version and model
+    parameters, so a prompt change never serves stale stories).
+
+    Each key holds up to `variants_per_key` stories served round-robin, so
+    players asking for a popular theme don't all get the same story. After
+    a miss or while a key is below its cap, the missing variants are
+    generated in the background, one LLM call per slot of the worker's
+    semaphore (`share_slots`) so refills count against its concurrency.
+    Keys are evicted least recently used.
+    """
+
+    def __init__(self, variants_per_key: int, max_keys: int, ttl_seconds: float):
+        self.variants_per_key = variants_per_key
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refills = 0
+        self.refill_failures = 0
+        self.avoided_latency_seconds = 0.0
+        self.avoided_tokens = 0
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._refilling: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        # Until a worker shares its slots (tests, scripts), one call at a time
+        self._slots = asyncio.Semaphore(1)
+        self._lock = threading.Lock()
+
+    async def get_or_generate(
+        self, key: Hashable, factory: VariantFactory
+    ) -> StoryLLMResponse:
+        variant = self.take(key)
+        if variant is None:
+            # Misses for a key share one generation; refills below don't,
+            # since they are meant to produce different variants
+            variant = await generate_once(key, lambda: self._generate(key, factory))
+        self._schedule_refill(key, factory)
+        return variant.structure
+
+    async def _generate(self, key: Hashable, factory: VariantFactory) -> StoryVariant:
+        variant = await factory()
+        self.add(key, variant)
+        return variant
+
+    def take(self, key: Hashable) -> Optional[StoryVariant]:
+        """Next variant for `key` in round-robin order, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None or not entry["variants"]:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            variants: List[StoryVariant] = entry["variants"]
+            variant = variants[entry["next"] % len(variants)]
+            entry["next"] += 1
+            self.hits += 1
+            self.avoided_latency_seconds += variant.latency_seconds
+            self.avoided_tokens += variant.tokens
+            return variant
+
+    def add(self, key: Hashable, variant: StoryVariant):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["expires_at"] < time.monotonic():
+                entry = self._entries[key] = {
+                    "variants": [],
+                    "next": 0,
+                    "expires_at": time.monotonic() + self.ttl_seconds,
+                }
+            self._entries.move_to_end(key)
+            if len(entry["variants"]) < self.variants_per_key:
+                entry["variants"].append(variant)
+
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "keys": len(self._entries),
+                "variants": sum(len(e["variants"]) for e in self._entries.values()),
+                "max_keys": self.max_keys,
+                "variants_per_key": self.variants_per_key,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refills": self.refills,
+                "refill_failures": self.refill_failures,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "avoided_llm_seconds": round(self.avoided_latency_seconds, 3),
+                "avoided_llm_tokens": self.avoided_tokens,
+            }
+
+    def _missing(self, key: Hashable) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            have = len(entry["variants"]) if entry is not None else 0
+            return self.variants_per_key - have
+
+    def share_slots(self, slots: asyncio.Semaphore):
+        """Run refill calls under the worker's concurrency semaphore"""
+        self._slots = slots
+
+    async def shutdown(self):
+        """Cancel running refills and wait for them to stop"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _schedule_refill(self, key: Hashable, factory: VariantFactory):
+        if key in self._refilling or self._missing(key) <= 0:
+            return
+        self._refilling.add(key)
+        task = asyncio.create_task(self._refill(key, factory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key: Hashable, factory: VariantFactory):
+        try:
+            for _ in range(self._missing(key)):
+                try:
+                    async with self._slots:
+                        variant = await factory()
+                except Exception:
+                    self.refill_failures += 1
+                    logger.exception("Refilling story variants for %s failed", key)
+                    return
+                self.add(key, variant)
+                self.refills += 1
+        finally:
+            self._refilling.discard(key)
+
+
+story_variant_cache = ThemeVariantCache(
+    variants_per_key=settings.STORY_VARIANTS_PER_THEME,
+    max_keys=settings.STORY_VARIANT_CACHE_MAX_THEMES,
+    ttl_seconds=settings.STORY_VARIANT_TTL_SECONDS,
+)
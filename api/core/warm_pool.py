@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.job_events import ACTIVE_STATUSES, job_events
+from core.variant_cache import normalize_theme
+from db.database import WorkerSessionLocal
+from models.job import StoryJob
+from models.story import Story
+
+logger = logging.getLogger(__name__)
+
+# Owner of pooled stories until a player claims one
+WARM_POOL_SESSION_ID = "warm-pool"
+# Postgres advisory lock held by the worker that is topping up the pool
+REFILL_LOCK_ID = 7_270_001
+
+
+class WarmPool:
+    """
+    Keeps WARM_POOL_TARGET_PER_THEME completed, unassigned stories for each
+    theme in WARM_POOL_THEMES.
+
+    Stock is made by ordinary story jobs flagged `is_pool_job`, which the
+    worker runs after player jobs. They are only enqueued while the player
+    queue is short, at most WARM_POOL_REFILL_PER_MINUTE at a time.
+    `/stories/create` hands out a pooled story by claiming it atomically.
+
+    Every worker runs the refill, but on Postgres only the one holding the
+    refill lock tops up at a time, so the workers don't each fill the same
+    gap. Other databases are expected to have a single worker.
+    """
+
+    def __init__(self):
+        self.claims = 0
+        self.claim_misses = 0
+        self.enqueued = 0
+        self._tokens = float(settings.WARM_POOL_REFILL_PER_MINUTE)
+        self._refilled_at = time.monotonic()
+
+    @staticmethod
+    def themes() -> list[str]:
+        return list(dict.fromkeys(normalize_theme(t) for t in settings.WARM_POOL_THEMES))
+
+    async def claim(
+        self, db: AsyncSession, theme: str, session_id: str, user_id: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Assign a pooled story for `theme` to the caller and return its id.
+        The caller commits. Returns None when the pool has no such story.
+        """
+        theme = normalize_theme(theme)
+        if theme not in self.themes():
+            return None
+
+        for _ in range(3):
+            story_id = await db.scalar(
+                select(Story.id)
+                .where(Story.is_pooled.is_(True), Story.theme == theme)
+                .order_by(Story.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            if story_id is None:
+                break
+
+            # Guarded like job claims so SQLite can't hand it out twice
+            claimed = (
+                await db.execute(
+                    update(Story)
+                    .where(Story.id == story_id, Story.is_pooled.is_(True))
+                    .values(
+                        is_pooled=False,
+                        session_id=session_id,
+                        user_id=user_id,
+                        created_at=datetime.now(timezone.utc),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            ).rowcount
+            if claimed:
+                # Cached copies still belong to the pool (session, created_at)
+                await job_events.story_changed(db, story_id, commit=False)
+                self.claims += 1
+                return story_id
+
+        self.claim_misses += 1
+        return None
+
+    async def player_queue_depth(self, db: AsyncSession) -> int:
+        return await db.scalar(
+            select(func.count(StoryJob.id)).where(
+                StoryJob.status.in_(ACTIVE_STATUSES), StoryJob.is_pool_job.is_(False)
+            )
+        )
+
+    async def depth(self, db: AsyncSession) -> Dict[str, Dict[str, int]]:
+        """Pooled stories and queued pool jobs per configured theme"""
+        pooled = dict(
+            (
+                await db.execute(
+                    select(Story.theme, func.count(Story.id))
+                    .where(Story.is_pooled.is_(True))
+                    .group_by(Story.theme)
+                )
+            ).all()
+        )
+        queued = dict(
+            (
+                await db.execute(
+                    select(StoryJob.theme, func.count(StoryJob.id))
+                    .where(
+                        StoryJob.is_pool_job.is_(True),
+                        StoryJob.status.in_(ACTIVE_STATUSES),
+                    )
+                    .group_by(StoryJob.theme)
+                )
+            ).all()
+        )
+        return {
+            theme: {"ready": pooled.get(theme, 0), "queued": queued.get(theme, 0)}
+            for theme in self.themes()
+        }
+
+    async def refill(self, db: AsyncSession) -> int:
+        """Enqueue pool jobs for themes below target; returns how many"""
+        now = time.monotonic()
+        rate = settings.WARM_POOL_REFILL_PER_MINUTE
+        self._tokens = min(rate, self._tokens + (now - self._refilled_at) * rate / 60)
+        self._refilled_at = now
+
+        if self._tokens < 1:
+            return 0
+        if not await self._lock_refill(db):
+            return 0  # another worker is topping up
+        if await self.player_queue_depth(db) > settings.WARM_POOL_MAX_QUEUE_DEPTH:
+            await db.rollback()
+            return 0
+
+        jobs = []
+        for theme, stock in (await self.depth(db)).items():
+            missing = settings.WARM_POOL_TARGET_PER_THEME - stock["ready"] - stock["queued"]
+            for _ in range(max(missing, 0)):
+                if self._tokens < 1:
+                    break
+                self._tokens -= 1
+                jobs.append(
+                    StoryJob(
+                        job_id=str(uuid.uuid4()),
+                        session_id=WARM_POOL_SESSION_ID,
+                        theme=theme,
+                        status="pending",
+                        is_pool_job=True,
+                    )
+                )
+
+        # Committing (or rolling back) releases the refill lock
+        if jobs:
+            db.add_all(jobs)
+            await db.commit()
+            self.enqueued += len(jobs)
+        else:
+            await db.rollback()
+        return len(jobs)
+
+    @staticmethod
+    async def _lock_refill(db: AsyncSession) -> bool:
+        """Take the refill lock for this transaction, unless another worker has it"""
+        if db.bind.dialect.name != "postgresql":
+            return True
+        return await db.scalar(
+            text("SELECT pg_try_advisory_xact_lock(:lock_id)"), {"lock_id": REFILL_LOCK_ID}
+        )
+
+    async def run(self, stop: asyncio.Event, session_factory=WorkerSessionLocal):
+        """Top up the pool every WARM_POOL_REFILL_INTERVAL_SECONDS until `stop`"""
+        while not stop.is_set():
+            try:
+                async with session_factory() as db:
+                    if count := await self.refill(db):
+                        logger.info("Queued %s warm pool stories", count)
+            except Exception:
+                logger.exception("Warm pool refill failed")
+
+            try:
+                await asyncio.wait_for(stop.wait(), settings.WARM_POOL_REFILL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self, db: AsyncSession) -> Dict[str, Any]:
+        return {
+            "target_per_theme": settings.WARM_POOL_TARGET_PER_THEME,
+            "themes": await self.depth(db),
+            "claims": self.claims,
+            "claim_misses": self.claim_misses,
+            "enqueued": self.enqueued,
+        }
+
+
+warm_pool = WarmPool()
+
+
+def completed_pool_job(
+    session_id: str, user_id: Optional[str], theme: str, story_id: int
+) -> StoryJob:
+    """Job row for a create request served from the warm pool"""
+    now = datetime.now(timezone.utc)
+    return StoryJob(
+        job_id=str(uuid.uuid4()),
+        session_id=session_id,
+        user_id=user_id,
+        theme=theme,
+        status="completed",
+        story_id=story_id,
+        started_at=now,
+        completed_at=now,
+    )
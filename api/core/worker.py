@@ -0,0 +1,475 @@
+"""
+Story generation worker.
+
+Jobs are persisted as `StoryJob` rows by the API and claimed here, so a
+burst of `/stories/create` calls never runs Gemini on the API threadpool
+and nothing is lost on restart. Generation is fully async, so a single
+worker process can keep WORKER_CONCURRENCY LLM calls in flight.
+
+Run a dedicated worker with:
+
+    python -m core.worker
+
+or drain the queue once (handy with a local SQLite database):
+
+    DATABASE_URL=sqlite:///./local.db python -m core.worker --once
+
+With LLM_BACKEND=fake the --once run reports offline throughput.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import start_http_server
+from sqlalchemy import and_, case, func, literal, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from core.config import settings
+from core.job_events import ACTIVE_STATUSES, MAX_ERROR_LENGTH, job_event, job_events
+from core.key_health import run_key_health_reports
+from core.lazy_story import branch_expander
+from core.llm_pool import key_scope
+from core.metrics import JOBS, collect_stages, observe_stage, timed
+from core.retry import classify_error, retry_policy
+from core.story_cache import cache_complete_story
+from core.story_generator import StoryGenerator
+from core.story_stream import close_truncated_story
+from core.variant_cache import story_variant_cache
+from db.database import WorkerSessionLocal, create_table, dispose_engines
+from models.job import StoryJob
+from models.story import StoryNode
+
+logger = logging.getLogger(__name__)
+
+SessionFactory = Callable[[], AsyncSession]
+
+
+async def queue_depth(db: AsyncSession) -> int:
+    """Number of jobs that are waiting for or holding a worker slot"""
+    return await db.scalar(
+        select(func.count(StoryJob.id)).where(StoryJob.status.in_(ACTIVE_STATUSES))
+    )
+
+
+def fair_share_order(weights: Dict[str, float]):
+    """
+    Sort keys that make claims take turns between users: the next job goes
+    to the owner (user, or session for anonymous jobs) with the fewest jobs
+    in progress per unit of JOB_USER_WEIGHTS, so one user with hundreds of
+    queued jobs gets a slot as often as each user with one. The oldest job
+    breaks ties. Returns (outer join target, join condition, order by).
+    """
+    running_job = aliased(StoryJob)
+    owner = func.coalesce(running_job.user_id, running_job.session_id)
+    running = (
+        select(owner.label("owner"), func.count().label("jobs"))
+        .where(running_job.status == "processing")
+        .group_by(owner)
+        .subquery()
+    )
+    share = func.coalesce(running.c.jobs, 0) * literal(1.0)
+    if weights:
+        share = share / case(weights, value=StoryJob.user_id, else_=1.0)
+    joined = running.c.owner == func.coalesce(StoryJob.user_id, StoryJob.session_id)
+    return running, joined, (StoryJob.is_pool_job, share, StoryJob.created_at, StoryJob.id)
+
+
+def _utc(value: datetime) -> datetime:
+    """Timestamps are written in UTC; SQLite hands them back without a timezone"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _rounded(stages: Dict[str, float]) -> Dict[str, float]:
+    return {stage: round(seconds, 4) for stage, seconds in stages.items()}
+
+
+async def _record_failure(
+    db: AsyncSession,
+    job: StoryJob,
+    error: Exception,
+    used_keys: List[str],
+    stages: Dict[str, float],
+):
+    """Requeue the job for a later attempt, or fail it for good"""
+    now = datetime.now(timezone.utc)
+    kind = classify_error(error)
+    key_id = used_keys[-1] if used_keys else None
+    job.attempt_errors = [  # type: ignore
+        *(job.attempt_errors or []),
+        {
+            "attempt": job.attempts,
+            "kind": kind,
+            "error": str(error)[:MAX_ERROR_LENGTH],
+            "key": key_id,
+            "at": now.isoformat(),
+        },
+    ]
+    job.last_key_id = key_id or job.last_key_id
+    job.error = str(error)  # type: ignore
+    job.stage_timings = _rounded(stages)  # type: ignore
+
+    if job.story_id is not None:
+        # A streamed story that is already playable is kept, cut off where
+        # the stream stopped, rather than generated again
+        await close_truncated_story(db, job.story_id)  # type: ignore
+
+    if job.story_id is None and retry_policy.should_retry(kind, job.attempts):  # type: ignore
+        delay = retry_policy.backoff(job.attempts)  # type: ignore
+        logger.warning(
+            "Story job %s attempt %s failed (%s: %s), retrying in %.1fs",
+            job.job_id,
+            job.attempts,
+            kind,
+            error,
+            delay,
+        )
+        job.status = "pending"  # type: ignore
+        job.started_at = None  # type: ignore
+        job.worker_id = None  # type: ignore
+        job.next_attempt_at = now + timedelta(seconds=delay)  # type: ignore
+        JOBS.labels("retried").inc()
+    else:
+        logger.error(
+            "Story job %s failed after %s attempts (%s)",
+            job.job_id,
+            job.attempts,
+            kind,
+            exc_info=error,
+        )
+        job.status = "failed"  # type: ignore
+        job.completed_at = now  # type: ignore
+        JOBS.labels("failed").inc()
+    await job_events.commit(db, job_event(job))
+
+
+async def generate_story_task(
+    job_id: str,
+    session_factory: SessionFactory = WorkerSessionLocal,
+    warm_cache: bool = False,
+):
+    async with session_factory() as db:
+        job = await db.scalar(select(StoryJob).where(StoryJob.job_id == job_id))
+
+        if not job:
+            return
+
+        if job.attempts > retry_policy.max_attempts:  # type: ignore
+            # Reclaimed after its worker died more than once; stop retrying
+            job.status = "failed"  # type: ignore
+            job.completed_at = datetime.now(timezone.utc)  # type: ignore
+            job.error = f"Gave up after {retry_policy.max_attempts} attempts"  # type: ignore
+            await job_events.commit(db, job_event(job))
+            JOBS.labels("failed").inc()
+            return
+
+        if job.story_id is not None:
+            # Reclaimed after its worker died partway through streaming
+            error = RuntimeError("The worker stopped while streaming the story")
+            await _record_failure(db, job, error, [], {})
+            return
+
+        # End the read transaction so the connection goes back to the pool
+        # for the LLM call instead of idling until the story is written
+        await db.commit()
+
+        stages: Dict[str, float] = {}
+        # Move away from keys that failed this job before
+        failed_keys = [e["key"] for e in job.attempt_errors or [] if e.get("key")]
+        try:
+            with collect_stages() as stages, key_scope(failed_keys) as keys:
+                if job.started_at and job.created_at:
+                    observe_stage(
+                        "queue_wait",
+                        (_utc(job.started_at) - _utc(job.created_at)).total_seconds(),
+                    )
+                with timed("generate"):
+                    if settings.GENERATION_MODE == "stream":
+
+                        async def on_first_node(story):
+                            # Playable from here on; the client can open the story
+                            story.user_id = job.user_id
+                            job.story_id = story.id
+                            job.first_node_at = datetime.now(timezone.utc)  # type: ignore
+                            await job_events.commit(db, job_event(job))
+
+                        story = await StoryGenerator.generate_story_streaming(
+                            db, job.session_id, job.theme, on_first_node  # type: ignore
+                        )
+                    elif settings.GENERATION_MODE == "lazy":
+                        story = await StoryGenerator.generate_lazy_story(db, job.session_id, job.theme)  # type: ignore
+                    else:
+                        story = await StoryGenerator.generate_story(db, job.session_id, job.theme)  # type: ignore
+
+            job.story_id = story.id
+            story.user_id = job.user_id
+            if job.is_pool_job:
+                # Stock for core.warm_pool, handed out by /stories/create
+                story.is_pooled = True  # type: ignore
+            job.status = "completed"  # type: ignore
+            job.completed_at = datetime.now(timezone.utc)  # type: ignore
+            job.error = None  # type: ignore  # earlier attempts stay in attempt_errors
+            job.stage_timings = _rounded(stages)  # type: ignore
+            await job_events.commit(db, job_event(job))
+            JOBS.labels("completed").inc()
+        except Exception as e:
+            await db.rollback()
+            await db.refresh(job)
+            await _record_failure(db, job, e, keys.used, stages)
+            return
+
+        if job.started_at:
+            started_at = _utc(job.started_at)
+            logger.info(
+                "Story job %s: first node after %s, complete after %s",
+                job_id,
+                job.first_node_at - started_at if job.first_node_at else "-",
+                job.completed_at - started_at,
+            )
+
+        # An embedded worker shares the API's story cache, so warm it; a
+        # standalone worker's cache serves nobody, and API processes fill
+        # theirs on first read. Pooled stories change owner when claimed.
+        if warm_cache and not job.is_pool_job:
+            try:
+                await db.refresh(story)
+                with timed("cache_warm"):
+                    await cache_complete_story(db, story)
+            except Exception:
+                logger.exception("Failed to cache story %s", story.id)
+
+        if story.generation_mode == "lazy":
+            # Have the likeliest first branches ready before the player picks
+            root_id = await db.scalar(
+                select(StoryNode.id).where(
+                    StoryNode.story_id == story.id, StoryNode.is_root.is_(True)
+                )
+            )
+            branch_expander.schedule_prefetch(story.id, root_id)  # type: ignore
+
+
+class StoryWorker:
+    """
+    Claims pending `StoryJob` rows and runs up to `concurrency` of them at
+    once. `warm_cache` puts finished stories in this process's story cache,
+    which only helps when the worker runs inside the API process.
+    """
+
+    def __init__(
+        self,
+        session_factory: SessionFactory = WorkerSessionLocal,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        stale_after: Optional[int] = None,
+        warm_cache: bool = False,
+    ):
+        self.session_factory = session_factory
+        self.warm_cache = warm_cache
+        self.concurrency = concurrency or settings.WORKER_CONCURRENCY
+        self.poll_interval = poll_interval or settings.WORKER_POLL_INTERVAL_SECONDS
+        self.stale_after = timedelta(
+            seconds=stale_after or settings.WORKER_STALE_JOB_SECONDS
+        )
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = asyncio.Event()
+
+    async def claim_job(self) -> Optional[str]:
+        """
+        Claim a pending job, or a "processing" job whose worker stopped
+        making progress, taking turns between users (fair_share_order).
+        Returns the claimed job_id.
+        """
+        now = datetime.now(timezone.utc)
+        claimable = or_(
+            and_(
+                StoryJob.status == "pending",
+                or_(StoryJob.next_attempt_at.is_(None), StoryJob.next_attempt_at <= now),
+            ),
+            and_(
+                StoryJob.status == "processing",
+                or_(
+                    StoryJob.started_at.is_(None),
+                    StoryJob.started_at < now - self.stale_after,
+                ),
+            ),
+        )
+
+        running, joined, order = fair_share_order(settings.JOB_USER_WEIGHTS)
+
+        async with self.session_factory() as db:
+            job = (await db.execute(
+                select(StoryJob)
+                .outerjoin(running, joined)
+                .where(claimable)
+                .order_by(*order)
+                .limit(1)
+                .with_for_update(of=StoryJob, skip_locked=True)
+            )).scalar_one_or_none()
+
+            if not job:
+                await db.rollback()
+                return None
+
+            job_id, reclaimed = job.job_id, job.status == "processing"
+
+            # Guard on the values we read so a backend without row locks
+            # (SQLite) still can't hand the same job to two workers
+            claimed = (await db.execute(
+                update(StoryJob)
+                .where(
+                    StoryJob.id == job.id,
+                    StoryJob.status == job.status,
+                    StoryJob.started_at.is_(None)
+                    if job.started_at is None
+                    else StoryJob.started_at == job.started_at,
+                )
+                .values(
+                    status="processing",
+                    started_at=now,
+                    worker_id=self.worker_id,
+                    attempts=StoryJob.attempts + 1,
+                )
+                .execution_options(synchronize_session=False)
+            )).rowcount
+            if claimed:
+                await job_events.commit(
+                    db, job_event(job, status="processing", attempts=job.attempts + 1)
+                )
+            else:
+                await db.rollback()
+
+            if not claimed:
+                return None
+            if reclaimed:
+                logger.warning("Re-claimed stale job %s", job_id)
+            return job_id  # type: ignore
+
+    async def run(self):
+        """Claim and run jobs until `stop()` is called"""
+        logger.info(
+            "Story worker %s started with concurrency %s",
+            self.worker_id,
+            self.concurrency,
+        )
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        # Background variant refills make LLM calls too
+        story_variant_cache.share_slots(slots)
+
+        refill = None
+        if settings.WARM_POOL_THEMES:
+            from core.warm_pool import warm_pool
+
+            refill = asyncio.create_task(warm_pool.run(self._stop, self.session_factory))
+        # Lets the API budget the queue by this worker's key health
+        key_health = asyncio.create_task(
+            run_key_health_reports(self.session_factory, self._stop)
+        )
+
+        def _finished(task):
+            tasks.discard(task)
+            slots.release()
+
+        while not self._stop.is_set():
+            await slots.acquire()
+
+            try:
+                job_id = await self.claim_job()
+            except Exception:
+                logger.exception("Failed to claim a story job")
+                job_id = None
+
+            if job_id is None:
+                slots.release()
+                await self._wait_for_stop(self.poll_interval)
+                continue
+
+            task = asyncio.create_task(
+                generate_story_task(job_id, self.session_factory, self.warm_cache)
+            )
+            tasks.add(task)
+            task.add_done_callback(_finished)
+
+        # Let in-flight generations finish before shutting down
+        if refill is not None:
+            await refill
+        await key_health
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run_until_empty(self) -> int:
+        """Run claimable jobs until the queue is drained"""
+        processed = 0
+        while True:
+            job_ids = []
+            while len(job_ids) < self.concurrency and (job_id := await self.claim_job()):
+                job_ids.append(job_id)
+            if not job_ids:
+                return processed
+
+            await asyncio.gather(
+                *(
+                    generate_story_task(job_id, self.session_factory, self.warm_cache)
+                    for job_id in job_ids
+                )
+            )
+            processed += len(job_ids)
+
+    def stop(self):
+        self._stop.set()
+
+    async def _wait_for_stop(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main(once: bool, concurrency: Optional[int]):
+    try:
+        await _run(once, concurrency)
+    finally:
+        await story_variant_cache.shutdown()
+        await dispose_engines()
+
+
+async def _run(once: bool, concurrency: Optional[int]):
+    worker = StoryWorker(concurrency=concurrency)
+
+    if once:
+        started = time.perf_counter()
+        count = await worker.run_until_empty()
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "Processed %s story jobs in %.2fs (%.1f jobs/s)",
+            count,
+            elapsed,
+            count / elapsed if elapsed else 0.0,
+        )
+        return
+
+    if settings.WORKER_METRICS_PORT:
+        start_http_server(settings.WORKER_METRICS_PORT)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the story generation worker")
+    parser.add_argument("--once", action="store_true", help="drain the queue and exit")
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if settings.DEBUG else logging.INFO)
+    create_table()
+
+    asyncio.run(main(args.once, args.concurrency))
@@ -0,0 +1,132 @@
+"""
+Write-behind buffering for high-rate, low-value inserts.
+
+`WriteBehindBuffer.add(row)` only appends to a deque in memory. A
+background task writes what has collected with one executemany INSERT
+every `flush_interval` seconds, or sooner once `max_batch` rows are
+waiting, so a burst of events costs a few transactions instead of one
+each. `close()` writes the rest on shutdown.
+
+Rows still in memory are lost if the process dies, and are only visible
+to this process until written (`pending()` lets readers merge them in).
+When the database is down rows are kept and retried, up to
+`max_pending`; beyond that the oldest are dropped.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.metrics import WRITE_BEHIND_BATCH_ROWS, WRITE_BEHIND_ROWS
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        session_factory: Callable[[], AsyncSession],
+        flush_interval: float,
+        max_batch: int,
+        max_pending: int,
+    ):
+        self.name = name
+        self.model = model
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        # Full at max_pending: appending drops the oldest row
+        self._rows: "deque[Dict[str, Any]]" = deque(maxlen=max_pending)
+        # Taken by a flush that hasn't committed yet
+        self._flushing: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+
+    def start(self):
+        """Start flushing on the running event loop"""
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def add(self, row: Dict[str, Any]):
+        if self._task is None or self._task.done():
+            self.start()  # e.g. first use without an app lifespan
+        if len(self._rows) == self.max_pending:
+            self.dropped += 1
+            WRITE_BEHIND_ROWS.labels(self.name, "dropped").inc()
+        self._rows.append(row)
+        if len(self._rows) >= self.max_batch:
+            self._wakeup.set()  # type: ignore
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Rows not written yet, oldest first"""
+        return [*self._flushing, *self._rows]
+
+    async def close(self):
+        """Stop the flush loop and write whatever is left"""
+        self._closing = True
+        if self._task is not None and not self._task.done():
+            self._wakeup.set()  # type: ignore
+            await self._task
+        self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)  # type: ignore
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()  # type: ignore
+            if not self._closing:
+                await self.flush()
+
+    async def flush(self) -> int:
+        """Write the buffered rows in one transaction; returns the rows written"""
+        if not self._rows or self._flushing:
+            return 0
+        batch = list(self._rows)
+        self._rows.clear()
+        self._flushing = batch
+        try:
+            async with self.session_factory() as db:
+                await db.execute(insert(self.model), batch)
+                await db.commit()
+        except Exception:
+            self.failed_flushes += 1
+            logger.exception("Writing %s %s rows failed, will retry", len(batch), self.name)
+            # Back in front of anything added meanwhile, keeping the newest
+            overflow = len(batch) + len(self._rows) - self.max_pending
+            self._rows = deque([*batch, *self._rows], maxlen=self.max_pending)
+            if overflow > 0:
+                self.dropped += overflow
+                WRITE_BEHIND_ROWS.labels(self.name, "dropped").inc(overflow)
+            return 0
+        finally:
+            self._flushing = []
+
+        self.written += len(batch)
+        WRITE_BEHIND_ROWS.labels(self.name, "written").inc(len(batch))
+        WRITE_BEHIND_BATCH_ROWS.labels(self.name).observe(len(batch))
+        return len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._rows) + len(self._flushing),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+            "flush_interval_seconds": self.flush_interval,
+            "max_batch": self.max_batch,
+        }
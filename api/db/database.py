@@ -1,13 +1,246 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from core.config import settings
+from core.metrics import DB_POOL_CHECKOUT_SECONDS, count_queries
+
+logger = logging.getLogger(__name__)
+
+# Async drivers for the sync URLs we accept in DATABASE_URL
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_database_url(database_url: str):
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if not driver:
+        raise ValueError(f"No async driver configured for {url.get_backend_name()}")
+    return url.set(drivername=driver)
+
+
+def _timed_pool(base: type, name: str) -> type:
+    """
+    `base` that observes how long each checkout waited for a connection
+    (including opening a new one) as db_pool_checkout_seconds{pool=name}.
+    A subclass rather than an attribute, so it survives pool recreation.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return base._do_get(self)
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+    # Same module, so the pool's logger stays under sqlalchemy.pool
+    return type(
+        f"Timed{base.__name__}", (base,), {"_do_get": _do_get, "__module__": base.__module__}
+    )
+
+
+def _pool_options(name: str, is_async: bool, pool_size: int, max_overflow: int) -> Dict[str, Any]:
+    return {
+        "poolclass": _timed_pool(AsyncAdaptedQueuePool if is_async else QueuePool, name),
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
 
-engine = create_engine(settings.DATABASE_URL)
+def _pool_status(pool) -> Dict[str, int]:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
+
+def _create_async_engine(url, name: str, pool_size: int, max_overflow: int) -> AsyncEngine:
+    async_engine = create_async_engine(
+        url, **_pool_options(name, True, pool_size, max_overflow)
+    )
+    count_queries(async_engine.sync_engine)
+    return async_engine
+
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    **_pool_options("sync", False, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW),
+)
+count_queries(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+primary_async_url = settings.ASYNC_DATABASE_URL or get_async_database_url(settings.DATABASE_URL)
+
+# API requests
+async_engine = _create_async_engine(
+    primary_async_url, "api", settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+)
+
+# Objects stay usable after commit; lazy loads are not possible on AsyncSession
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+# Story generation (core.worker, lazy branches) has its own pool, so a busy
+# worker can't make API requests wait for a connection, or the reverse
+worker_async_engine = _create_async_engine(
+    primary_async_url,
+    "worker",
+    settings.WORKER_DB_POOL_SIZE,
+    settings.WORKER_DB_MAX_OVERFLOW,
+)
+
+WorkerSessionLocal = async_sessionmaker(
+    bind=worker_async_engine, autoflush=False, expire_on_commit=False
+)
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+POSTGRES_REPLICA_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    def __init__(self, index: int, url: str):
+        async_url = get_async_database_url(url)
+        self.name = f"replica-{index}"
+        self.host = async_url.host
+        self.is_postgres = async_url.get_backend_name() == "postgresql"
+        self.engine = _create_async_engine(
+            async_url, self.name, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+        )
+        self.session_factory = async_sessionmaker(
+            bind=self.engine, autoflush=False, expire_on_commit=False
+        )
+        self.lag_seconds: Optional[float] = None
+        self.checked_at = 0.0
+        self.error: Optional[str] = None
+
+    async def check_lag(self, timeout: float):
+        try:
+            if self.is_postgres:
+                self.lag_seconds = float(
+                    await asyncio.wait_for(self._query_lag(), timeout)
+                )
+            else:
+                self.lag_seconds = 0.0  # e.g. a SQLite copy in tests
+            self.error = None
+        except Exception as e:
+            self.lag_seconds = None
+            self.error = str(e) or type(e).__name__
+            logger.warning("Read replica %s unavailable: %s", self.name, self.error)
+        self.checked_at = time.monotonic()
+
+    async def _query_lag(self) -> float:
+        async with self.engine.connect() as conn:
+            return await conn.scalar(POSTGRES_REPLICA_LAG)
+
+
+class ReadRouter:
+    """
+    Hands read-only routes a session on a read replica from
+    DATABASE_REPLICA_URLS, round-robin, skipping replicas more than
+    DATABASE_REPLICA_MAX_LAG_SECONDS behind or unreachable. With no replica
+    in shape (or none configured) reads go to the primary.
+
+    Lag is measured in the background at most every
+    DATABASE_REPLICA_LAG_CHECK_SECONDS, started by the first read after the
+    measurement expires. Reads never wait for it: they route on the last
+    known lag, and a replica not yet measured, or that didn't answer within
+    DATABASE_REPLICA_LAG_TIMEOUT_SECONDS, counts as unavailable.
+    """
+
+    def __init__(
+        self, urls: List[str], max_lag: float, check_interval: float, check_timeout: float
+    ):
+        self.replicas = [Replica(i, url) for i, url in enumerate(urls)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._next = 0
+        self._checking: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    async def session_factory(self) -> async_sessionmaker:
+        if not self.replicas:
+            return AsyncSessionLocal
+
+        expired = time.monotonic() - min(r.checked_at for r in self.replicas) > self.check_interval
+        if expired and (self._checking is None or self._checking.done()):
+            # One check at a time, however many reads notice it expired
+            self._checking = asyncio.ensure_future(
+                asyncio.gather(*(r.check_lag(self.check_timeout) for r in self.replicas))
+            )
+
+        healthy = [
+            r for r in self.replicas if r.lag_seconds is not None and r.lag_seconds <= self.max_lag
+        ]
+        if not healthy:
+            self.primary_reads += 1
+            return AsyncSessionLocal
+        self.replica_reads += 1
+        self._next += 1
+        return healthy[self._next % len(healthy)].session_factory
+
+    async def dispose(self):
+        if self._checking is not None:
+            self._checking.cancel()
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "max_lag_seconds": self.max_lag,
+            "replicas": [
+                {
+                    "name": r.name,
+                    "host": r.host,
+                    "lag_seconds": r.lag_seconds,
+                    "error": r.error,
+                    "pool": _pool_status(r.engine.pool),
+                }
+                for r in self.replicas
+            ],
+        }
+
+
+read_router = ReadRouter(
+    settings.DATABASE_REPLICA_URLS,
+    max_lag=settings.DATABASE_REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.DATABASE_REPLICA_LAG_CHECK_SECONDS,
+    check_timeout=settings.DATABASE_REPLICA_LAG_TIMEOUT_SECONDS,
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -17,5 +250,36 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db():
+    """
+    A session for read-only routes, on a replica when one is in shape.
+    Replicas can be slightly behind: look a missing row up again on the
+    primary (`read_router.enabled`) before answering 404.
+    """
+    session_factory = await read_router.session_factory()
+    async with session_factory() as db:
+        yield db
+
+async def dispose_engines():
+    await async_engine.dispose()
+    await worker_async_engine.dispose()
+    await read_router.dispose()
+
+def pool_stats() -> Dict[str, Any]:
+    return {
+        "sync": _pool_status(engine.pool),
+        "api": _pool_status(async_engine.pool),
+        "worker": _pool_status(worker_async_engine.pool),
+        "read_routing": read_router.stats(),
+    }
+
 def create_table():
+    from db.migrate import upgrade_schema
+
     Base.metadata.create_all(bind=engine)
+    # Tables from an older version get the columns added since
+    upgrade_schema()
@@ -0,0 +1,92 @@
+"""
+Brings an existing database up to the current models.
+
+`Base.metadata.create_all` creates missing tables but never changes the
+ones that exist, so a database from an older version would lack the
+columns added since (`story_job.attempts`, `stories.is_pooled`, ...). This
+adds every missing column with ALTER TABLE ... ADD COLUMN, then every
+missing index. It only ever adds: nothing is dropped, renamed or retyped.
+
+`create_table()` runs it on startup. To see or apply the statements by hand:
+
+    python -m db.migrate --sql   # print the statements that would run
+    python -m db.migrate
+
+New columns on existing tables must be nullable or have a server default,
+so that rows already in the table get a value.
+"""
+
+import argparse
+import logging
+from typing import List
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from db.database import Base, create_table, engine
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_statements(conn: Connection) -> List[str]:
+    """ALTER TABLE / CREATE INDEX statements the database is missing"""
+    inspector = inspect(conn)
+    dialect = conn.dialect
+    # Postgres skips what a concurrently starting process already added
+    if_not_exists = "IF NOT EXISTS " if dialect.name == "postgresql" else ""
+    existing_tables = set(inspector.get_table_names())
+    statements = []
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue  # created whole by create_all
+
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(
+                    f"{table.name}.{column.name} is NOT NULL without a server default "
+                    "and can't be added to a table that has rows"
+                )
+            ddl = CreateColumn(column).compile(dialect=dialect)
+            statements.append(
+                f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{str(ddl).strip()}"
+            )
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in indexes:
+                statements.append(
+                    str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect)).strip()
+                )
+
+    return statements
+
+
+def upgrade_schema(bind: Engine = engine) -> List[str]:
+    """Apply `upgrade_statements` in one transaction; returns what ran"""
+    with bind.begin() as conn:
+        statements = upgrade_statements(conn)
+        for statement in statements:
+            logger.info("Upgrading schema: %s", statement)
+            conn.exec_driver_sql(statement)
+    return statements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add missing columns and indexes")
+    parser.add_argument("--sql", action="store_true", help="print the statements, don't run them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import models.job, models.progress, models.rate_limit, models.story, models.user  # noqa: E401,F401
+
+    if args.sql:
+        with engine.connect() as conn:
+            for statement in upgrade_statements(conn):
+                print(f"{statement};")
+    else:
+        create_table()
@@ -1,19 +1,56 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from core.config import settings
-from routers import story, job, user
-from db.database import create_table
+from core.job_events import job_events
+from core.metrics import MetricsMiddleware
+from core.progress import progress_buffer
+from core.variant_cache import story_variant_cache
+from core.worker import StoryWorker
+from routers import story, job, user, stats, metrics
+from db.database import create_table, dispose_engines
+from utils.auth import password_hasher
 
 create_table()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Single-process setups can run the worker next to the API,
+    # production runs `python -m core.worker` as its own service
+    worker = StoryWorker(warm_cache=True) if settings.RUN_EMBEDDED_WORKER else None
+    worker_task = asyncio.create_task(worker.run()) if worker else None
+    # Wake long-poll / SSE waiters when any process finishes a job
+    listener_task = (
+        asyncio.create_task(job_events.listen()) if job_events.use_postgres else None
+    )
+    progress_buffer.start()
+    password_hasher.start()
+    yield
+    # Write buffered player moves before the pools close
+    await progress_buffer.close()
+    if listener_task:
+        listener_task.cancel()
+    if worker and worker_task:
+        worker.stop()
+        await worker_task
+    await story_variant_cache.shutdown()
+    password_hasher.shutdown()
+    await dispose_engines()
+
+
 app = FastAPI(
     title="Choose your Own Adventure",
     description="api to generate cool stories",
     version="0.0.1",
     docs_url="/docs",
+    lifespan=lifespan,
 )
 
 
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS,
@@ -25,6 +62,9 @@ app.add_middleware(
 app.include_router(story.router, prefix=settings.API_PREFIX)
 app.include_router(job.router, prefix=settings.API_PREFIX)
 app.include_router(user.router, prefix=settings.API_PREFIX)
+app.include_router(stats.router, prefix=settings.API_PREFIX)
+# Unprefixed and unauthenticated, where Prometheus looks by default
+app.include_router(metrics.router)
 
 
 if __name__ == "__main__":
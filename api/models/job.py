@@ -1,23 +1,39 @@
-from sqlalchemy import Column,Integer,String,DateTime
-from sqlalchemy.sql import func
+from sqlalchemy import JSON, Boolean, Column, Integer, String, DateTime, Index
+from sqlalchemy.sql import false, func
 
 from db.database import Base
 
+
 class StoryJob(Base):
     __tablename__ = "story_job"
-    
+
     id = Column(Integer, primary_key=True, index=True)
-    job_id = Column(String,index=True, unique=True)
-    session_id = Column(String,index=True)
+    job_id = Column(String, index=True, unique=True)
+    session_id = Column(String, index=True)
+    user_id = Column(String, nullable=True, index=True)
     theme = Column(String)
-    status = Column(String)
-    story_id = Column(Integer,nullable=True)
-    error  = Column(String,nullable=True)
+    status = Column(String, index=True)
+    story_id = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+    worker_id = Column(String, nullable=True)
+    # Generates a story for the warm pool rather than for a player
+    is_pool_job = Column(Boolean, default=False, server_default=false())
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    # Streaming mode: when the root node became playable
+    first_node_at = Column(DateTime(timezone=True), nullable=True)
     completed_at = Column(DateTime(timezone=True), nullable=True)
-    
-    
-    
-
+    # Attempts started so far, and {"attempt", "kind", "error", "key", "at"} for each failure
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    attempt_errors = Column(JSON, nullable=True)
+    # A retried job is not claimed again before this
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    # Fingerprint of the API key the last attempt used (core/llm_pool.py)
+    last_key_id = Column(String, nullable=True)
+    # Seconds per generation stage (core/metrics.py), e.g. {"llm_invoke": 4.2}
+    stage_timings = Column(JSON, nullable=True)
 
-    
\ No newline at end of file
+    # Workers claim the oldest pending player job first
+    __table_args__ = (
+        Index("ix_story_job_status_created_at", "status", "created_at"),
+    )
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String
+
+from db.database import Base
+
+
+class StoryProgress(Base):
+    """
+    A player arriving at a node, written in batches by core/progress.py.
+    No foreign keys: rows go in with bulk INSERTs, where one bad row
+    would fail the whole batch; readers check the node instead.
+    """
+
+    __tablename__ = "story_progress"
+
+    id = Column(Integer, primary_key=True)
+    story_id = Column(Integer, nullable=False)
+    user_id = Column(String, nullable=True)
+    session_id = Column(String, nullable=True)
+    node_id = Column(Integer, nullable=False)
+    # The choice that led here; NULL for a (re)start at the root
+    from_node_id = Column(Integer, nullable=True)
+    option_index = Column(Integer, nullable=True)
+    # When the player chose, not when the buffer was flushed
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        # Resume: a user's latest position in a story
+        Index("ix_story_progress_user_story_created", "user_id", "story_id", "created_at"),
+        # Choice counts per option, to prefetch the popular branches
+        Index("ix_story_progress_from_node_option", "from_node_id", "option_index"),
+    )
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Float, String
+
+from db.database import Base
+
+
+class RateLimitBucket(Base):
+    """A token bucket shared by API replicas (ADMISSION_BACKEND=database)"""
+
+    __tablename__ = "rate_limit_bucket"
+
+    # "user:<id>" or "session:<id>"
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Wall-clock seconds, comparable across replicas
+    updated_at = Column(Float, nullable=False)
+
+
+class LLMKeyHealth(Base):
+    """
+    What a worker's key pool last saw of one Gemini API key, so the API can
+    budget the queue (core.admission) with workers in other processes
+    """
+
+    __tablename__ = "llm_key_health"
+
+    # core.llm_pool.key_fingerprint, never the key itself
+    key = Column(String, primary_key=True)
+    jobs_per_second = Column(Float, nullable=False)
+    # Wall-clock seconds, like RateLimitBucket.updated_at; 0 when closed
+    circuit_open_until = Column(Float, nullable=False, server_default="0")
+    reported_at = Column(Float, nullable=False)
@@ -1,5 +1,17 @@
-from sqlalchemy import Column, String, DateTime, Integer, Boolean, ForeignKey, JSON
-from sqlalchemy.sql import func
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy.sql import false, func, true
 from sqlalchemy.orm import relationship
 
 from db.database import Base
@@ -11,10 +23,43 @@ class Story(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     session_id = Column(String, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Authenticated owner (TokenData.user_id); NULL for pooled stories
+    user_id = Column(String, nullable=True)
+    theme = Column(String, nullable=True)
+    # "batch", "stream" or "lazy"; lazy stories grow as players choose options
+    generation_mode = Column(String, default="batch", server_default="batch")
+    # False while a streamed story is still being written
+    is_complete = Column(Boolean, default=True, server_default=true())
+    # Pre-generated and not yet handed to a player (core/warm_pool.py)
+    is_pooled = Column(Boolean, default=False, server_default=false())
+    # Also set client-side (in UTC, like the server default) so keyset
+    # cursors compare like with like on SQLite
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+    )
+
+    # Shape metrics from core/story_analytics.py, NULL until computed.
+    # Lazy stories report the part generated so far.
+    depth = Column(Integer, nullable=True)
+    node_count = Column(Integer, nullable=True)
+    ending_count = Column(Integer, nullable=True)
+    winning_ending_count = Column(Integer, nullable=True)
+    winning_path_count = Column(Integer, nullable=True)
+    shortest_winning_path = Column(Integer, nullable=True)
 
     nodes = relationship("StoryNode", back_populates="story")
 
+    __table_args__ = (
+        Index("ix_stories_is_pooled_theme", "is_pooled", "theme"),
+        Index("ix_stories_winning_ending_count_depth", "winning_ending_count", "depth"),
+        Index("ix_stories_node_count", "node_count"),
+        # Keyset pagination of history, newest first (core/story_listing.py)
+        Index("ix_stories_session_created_at_id", "session_id", "created_at", "id"),
+        Index("ix_stories_user_created_at_id", "user_id", "created_at", "id"),
+    )
+
 
 class StoryNode(Base):
     __tablename__ = "story_nodes"
@@ -28,3 +73,28 @@ class StoryNode(Base):
     options = Column(JSON, default=list)
 
     story = relationship("Story", back_populates="nodes")
+
+
+class StoryEdge(Base):
+    """
+    One option of a node, kept alongside `StoryNode.options` so the
+    database can walk the story graph (core/story_graph.py).
+    """
+
+    __tablename__ = "story_edges"
+
+    id = Column(Integer, primary_key=True)
+    story_id = Column(Integer, ForeignKey("stories.id"), nullable=False, index=True)
+    from_node_id = Column(Integer, ForeignKey("story_nodes.id"), nullable=False)
+    # NULL until a lazy story generates the branch behind the option
+    to_node_id = Column(Integer, ForeignKey("story_nodes.id"), nullable=True)
+    # Position in the node's options, i.e. the option_index players send
+    ordinal = Column(Integer, nullable=False)
+    text = Column(String, nullable=False)
+
+    __table_args__ = (
+        # A node's options in order; one lookup per step when replaying a path
+        UniqueConstraint("from_node_id", "ordinal", name="uq_story_edges_from_node_ordinal"),
+        # "Which node leads here", walking from a node up to the root
+        Index("ix_story_edges_to_node_id", "to_node_id"),
+    )
@@ -1,10 +1,14 @@
-import uuid
+import asyncio
+import json
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from utils.auth import get_current_user
-from db.database import get_db
+from db.database import AsyncSessionLocal, get_async_db, get_read_db, read_router
+from core.job_events import TERMINAL_STATUSES, job_event, job_events
 from models.job import StoryJob
 from schemas.job import StoryJobResponse
 
@@ -13,12 +17,76 @@ router = APIRouter(
     prefix="/jobs", tags=["jobs"], dependencies=[Depends(get_current_user)]
 )
 
+SSE_HEARTBEAT_SECONDS = 15
 
-@router.get("/{job_id}", response_model=StoryJobResponse)
-def get_job(job_id: str, db: Session = Depends(get_db)):
-    job = db.query(StoryJob).filter(StoryJob.job_id == job_id).first()
+
+async def _get_job_event(db: AsyncSession, job_id: str) -> dict:
+    query = select(StoryJob).where(StoryJob.job_id == job_id)
+    job = await db.scalar(query)
+    if not job and read_router.enabled:
+        # Just created and not on the replica yet
+        async with AsyncSessionLocal() as primary:
+            job = await primary.scalar(query)
 
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return job
+    event = job_event(job)
+    # Don't hold a pooled connection while the request waits
+    await db.close()
+    return event
+
+
+@router.get("/{job_id}", response_model=StoryJobResponse)
+async def get_job(
+    job_id: str,
+    wait: int = Query(0, ge=0, le=60, description="Seconds to wait for the job to change"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    if not wait:
+        return await _get_job_event(db, job_id)
+
+    # Subscribe before reading so a change between the two isn't missed
+    queue = job_events.subscribe(job_id)
+    try:
+        job = await _get_job_event(db, job_id)
+        if job["status"] in TERMINAL_STATUSES:
+            return job
+
+        try:
+            return await asyncio.wait_for(queue.get(), wait)
+        except asyncio.TimeoutError:
+            return job
+    finally:
+        job_events.unsubscribe(job_id, queue)
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Server-Sent Events stream of job changes, closed once the job finishes"""
+    queue = job_events.subscribe(job_id)
+    try:
+        job = await _get_job_event(db, job_id)
+    except HTTPException:
+        job_events.unsubscribe(job_id, queue)
+        raise
+
+    async def event_stream():
+        try:
+            event = job
+            yield f"event: status\ndata: {json.dumps(event)}\n\n"
+            while event["status"] not in TERMINAL_STATUSES:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+        finally:
+            job_events.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.admission import admission
+from core.llm_pool import get_llm_pool
+from core.progress import progress_buffer
+from core.story_cache import story_cache, story_reads
+from core.variant_cache import story_generations, story_variant_cache
+from core.warm_pool import warm_pool
+from db.database import get_async_db, pool_stats
+from utils.auth import get_current_user
+
+
+router = APIRouter(
+    prefix="/stats", tags=["stats"], dependencies=[Depends(get_current_user)]
+)
+
+
+@router.get("/cache")
+def get_cache_stats():
+    return {
+        "complete_story": story_cache.stats(),
+        "story_variants": story_variant_cache.stats(),
+        # Requests that waited for an identical one in flight instead of repeating it
+        "coalescing": {
+            flight.name: flight.stats() for flight in (story_reads, story_generations)
+        },
+    }
+
+
+@router.get("/llm")
+def get_llm_stats():
+    """Per-key load, latency and health of the Gemini key pool in this process"""
+    try:
+        pool = get_llm_pool()
+    except ValueError:
+        # No API key configured
+        return {"keys": []}
+    return {"keys": pool.stats()}
+
+
+@router.get("/admission")
+async def get_admission_stats(db: AsyncSession = Depends(get_async_db)):
+    """Admitted and refused story requests, and the current queue budget"""
+    return await admission.stats(db)
+
+
+@router.get("/db")
+def get_db_stats():
+    """Connection pool usage per engine, and read replica lag and routing"""
+    return pool_stats()
+
+
+@router.get("/progress")
+def get_progress_stats():
+    """The player progress write-behind buffer"""
+    return progress_buffer.stats()
+
+
+@router.get("/warm-pool")
+async def get_warm_pool_stats(db: AsyncSession = Depends(get_async_db)):
+    """Ready and queued pooled stories per theme, plus claim counters"""
+    return await warm_pool.stats(db)
@@ -1,19 +1,38 @@
 import uuid
-from typing import Optional
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Cookie, Response, BackgroundTasks
-from sqlalchemy.orm import Session
+from typing import List, Optional
 
-from db.database import get_db, SessionLocal
-from models.story import Story, StoryNode
+import zstandard
+from fastapi import APIRouter, Depends, HTTPException, Cookie, Header, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import story_codec
+from core.admission import admission
+from core.progress import latest_position, record_progress
+from core.lazy_story import branch_expander
+from core.story_cache import build_node_frontier, get_complete_story_payload
+from core.story_graph import MAX_PATH_LENGTH, path_to_node, reachable_endings, replay_path
+from core.story_listing import split_page, story_page_query
+from core.warm_pool import completed_pool_job, warm_pool
+from db.database import get_async_db
 from models.job import StoryJob
+from models.story import Story, StoryNode
 from schemas.story import (
-    CompleteStoryResponse,
+    ChooseOptionRequest,
     CompleteStoryNodeResponse,
+    CompleteStoryResponse,
     CreateStoryRequest,
+    ProgressRequest,
+    ProgressResponse,
+    ReachableEndingResponse,
+    StoryNodesResponse,
+    StoryPageResponse,
+    StoryPathResponse,
+    StoryPathStep,
+    StoryReplayResponse,
+    StorySummaryResponse,
 )
 from schemas.job import StoryJobResponse
-from core.story_generator import StoryGenerator
 from utils.auth import get_current_user, CurrentUser
 
 router = APIRouter(
@@ -30,14 +49,35 @@ def get_session_id(session_id: Optional[str] = Cookie(None)):
 
 
 @router.post("/create", response_model=StoryJobResponse)
-def create_story(
+async def create_story(
     request: CreateStoryRequest,
-    background_tasks: BackgroundTasks,
     response: Response,
+    current_user: CurrentUser,  # 👈 Protected
     session_id: str = Depends(get_session_id),
-    db: Session = Depends(get_db),
-    # current_user: CurrentUser = Depends(get_current_user),  # 👈 Protected
+    db: AsyncSession = Depends(get_async_db),
 ):
+    # Every check comes before any token is spent, so a refused request
+    # (429 or 503) leaves the caller's buckets as they were
+    await admission.check_rate(current_user.user_id, session_id)
+
+    # A pre-generated story needs no worker at all; the claim is only
+    # committed once the request is admitted
+    story_id = await warm_pool.claim(db, request.theme, session_id, current_user.user_id)
+    if story_id is None:
+        # Refuse new work instead of queueing more than the API keys can serve
+        await admission.check_capacity(db)
+
+    # Counts pooled stories too: a client draining the pool starves others as well
+    await admission.admit(current_user.user_id, session_id)
+
+    if story_id is not None:
+        response.set_cookie(key="session_id", value=session_id, httponly=True)
+        job = completed_pool_job(session_id, current_user.user_id, request.theme, story_id)
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        return job
+
     response.set_cookie(key="session_id", value=session_id, httponly=True)
 
     job_id = str(uuid.uuid4())
@@ -47,79 +87,244 @@ def create_story(
         session_id=session_id,
         theme=request.theme,
         status="pending",
-        # user_id : current_user.user_id
+        user_id=current_user.user_id,
     )
     db.add(job)
-    db.commit()
-
-    background_tasks.add_task(
-        generate_story_task, job_id=job_id, theme=request.theme, session_id=session_id
-    )
+    await db.commit()
+    await db.refresh(job)
 
+    # Picked up by core.worker
     return job
 
 
-def generate_story_task(job_id: str, theme: str, session_id: str):
-    db = SessionLocal()
+@router.get("", response_model=StoryPageResponse)
+async def list_stories(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    session_id: str = Depends(get_session_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    The caller's session's stories (session cookie), newest first; pass
+    `next_cursor` back for more
+    """
+    rows = (
+        await db.execute(story_page_query(Story.session_id, session_id, cursor, limit))
+    ).all()
+    items, next_cursor = split_page(rows, limit)
+    return StoryPageResponse(items=items, next_cursor=next_cursor)  # type: ignore
 
-    try:
-        job = db.query(StoryJob).filter(StoryJob.job_id == job_id).first()
 
-        if not job:
-            return
+@router.get("/mine", response_model=StoryPageResponse)
+async def list_my_stories(
+    current_user: CurrentUser,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """The signed-in user's stories across sessions, newest first"""
+    rows = (
+        await db.execute(story_page_query(Story.user_id, current_user.user_id, cursor, limit))
+    ).all()
+    items, next_cursor = split_page(rows, limit)
+    return StoryPageResponse(items=items, next_cursor=next_cursor)  # type: ignore
 
-        try:
-            job.status = "processing"  # type: ignore
-            db.commit()
 
-            story = StoryGenerator.generate_story(db, session_id, theme)
+@router.get("/search", response_model=List[StorySummaryResponse])
+async def search_stories(
+    min_winning_endings: Optional[int] = Query(None, ge=0),
+    depth: Optional[int] = Query(None, ge=1),
+    min_depth: Optional[int] = Query(None, ge=1),
+    max_depth: Optional[int] = Query(None, ge=1),
+    max_shortest_winning_path: Optional[int] = Query(None, ge=0),
+    theme: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    session_id: str = Depends(get_session_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Filter this session's stories by their precomputed shape metrics"""
+    query = select(Story).where(Story.session_id == session_id)
+    if min_winning_endings is not None:
+        query = query.where(Story.winning_ending_count >= min_winning_endings)
+    if depth is not None:
+        query = query.where(Story.depth == depth)
+    if min_depth is not None:
+        query = query.where(Story.depth >= min_depth)
+    if max_depth is not None:
+        query = query.where(Story.depth <= max_depth)
+    if max_shortest_winning_path is not None:
+        query = query.where(Story.shortest_winning_path <= max_shortest_winning_path)
+    if theme is not None:
+        query = query.where(Story.theme == theme)
 
-            job.story_id = story.id  # todo: update story id
-            job.status = "completed"  # type: ignore
-            job.completed_at = datetime.now()  # type: ignore
-            db.commit()
-        except Exception as e:
-            job.status = "failed"  # type: ignore
-            job.completed_at = datetime.now()  # type: ignore
-            job.error = str(e)  # type: ignore
-            db.commit()
-    finally:
-        db.close()
+    stories = await db.scalars(
+        query.order_by(Story.created_at.desc(), Story.id.desc()).limit(limit)
+    )
+    return stories.all()
 
 
 @router.get("/{story_id}/complete", response_model=CompleteStoryResponse)
-def get_complete_story(story_id: int, db: Session = Depends(get_db)):
-    story = db.query(Story).filter(Story.id == story_id).first()
-    if not story:
+async def get_complete_story(
+    story_id: int,
+    format: str = Query("json", pattern="^(json|msgpack)$"),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """`format=msgpack` returns the compact core.story_codec encoding"""
+    # Stories are immutable once generated, so the serialized body is cached
+    payload = await get_complete_story_payload(story_id, format)
+    if payload is None:
         raise HTTPException(status_code=404, detail="Story not found")
 
-    complete_story = build_complete_story_tree(db, story)
-    return complete_story
+    headers = {"ETag": payload.etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or payload.etag in (tag.strip() for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=304, headers=headers)
+
+    if format == "json":
+        return Response(
+            content=payload.body, media_type="application/json", headers=headers
+        )
 
+    body = payload.body
+    headers["Vary"] = "Accept-Encoding"
+    if accept_encoding and "zstd" in accept_encoding:
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+        headers["Content-Encoding"] = "zstd"
+    return Response(content=body, media_type=story_codec.MEDIA_TYPE, headers=headers)
 
-def build_complete_story_tree(db: Session, story: Story) -> CompleteStoryResponse:
-    nodes = db.query(StoryNode).filter(StoryNode.story_id == story.id).all()
 
-    node_dict = {}
-    for node in nodes:
-        node_response = CompleteStoryNodeResponse(
-            id=node.id,  # type: ignore
+@router.get("/{story_id}/nodes", response_model=StoryNodesResponse)
+async def get_story_nodes(
+    story_id: int,
+    from_node_id: Optional[int] = Query(None, alias="from", description="Defaults to the root"),
+    depth: int = Query(2, ge=0, le=6),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """A node and the nodes up to `depth` choices ahead of it"""
+    return await build_node_frontier(db, story_id, from_node_id, depth)
+
+
+async def _story_node(db: AsyncSession, story_id: int, node_id: int) -> StoryNode:
+    node = await db.get(StoryNode, node_id)
+    if node is None or node.story_id != story_id:
+        raise HTTPException(status_code=404, detail="Story node not found")
+    return node
+
+
+@router.get("/{story_id}/nodes/{node_id}/path", response_model=StoryPathResponse)
+async def get_node_path(
+    story_id: int, node_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    """The scenes and choices that lead from the root to a node"""
+    await _story_node(db, story_id, node_id)
+    steps = [
+        StoryPathStep(
+            node_id=node.id,  # type: ignore
+            content=node.content,  # type: ignore
+            option_index=edge.ordinal,  # type: ignore
+            choice=edge.text,  # type: ignore
+        )
+        for node, edge in await path_to_node(db, node_id)
+    ]
+    return StoryPathResponse(story_id=story_id, node_id=node_id, steps=steps)
+
+
+@router.get(
+    "/{story_id}/nodes/{node_id}/endings", response_model=List[ReachableEndingResponse]
+)
+async def get_reachable_endings(
+    story_id: int, node_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    """Endings still reachable from a node, nearest first"""
+    await _story_node(db, story_id, node_id)
+    return [
+        ReachableEndingResponse(
+            node_id=node.id,  # type: ignore
             content=node.content,  # type: ignore
-            is_ending=node.is_ending,  # type: ignore
             is_winning_ending=node.is_winning_ending,  # type: ignore
-            options=node.options,  # type: ignore
+            distance=distance,
         )
-        node_dict[node.id] = node_response
-
-    root_node = next((node for node in nodes if node.is_root), None)  # type: ignore
-    if not root_node:
-        raise HTTPException(status_code=500, detail="Story root node not found")
-
-    return CompleteStoryResponse(
-        id=story.id,  # type: ignore
-        title=story.title,  # type: ignore
-        session_id=story.session_id,  # type: ignore
-        created_at=story.created_at,  # type: ignore
-        root_node=node_dict[root_node.id],  # type: ignore
-        all_nodes=node_dict,
+        for node, distance in await reachable_endings(db, node_id)
+    ]
+
+
+@router.get("/{story_id}/replay", response_model=StoryReplayResponse)
+async def replay_story_path(
+    story_id: int,
+    choices: str = Query("", description="Option indexes from the root, e.g. 0,2,1"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """The nodes a player passes through making `choices`, in one query"""
+    try:
+        indexes = [int(choice) for choice in choices.split(",") if choice.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="choices must be option indexes")
+    if len(indexes) > MAX_PATH_LENGTH or any(index < 0 for index in indexes):
+        raise HTTPException(status_code=400, detail="Invalid choices")
+
+    nodes = await replay_path(db, story_id, indexes)
+    if not nodes:
+        raise HTTPException(status_code=404, detail="Story not found")
+    return StoryReplayResponse(
+        story_id=story_id, choices=indexes, followed=len(nodes) - 1, nodes=nodes  # type: ignore
+    )
+
+
+@router.post(
+    "/{story_id}/nodes/{node_id}/choose", response_model=CompleteStoryNodeResponse
+)
+async def choose_option(
+    story_id: int,
+    node_id: int,
+    request: ChooseOptionRequest,
+    current_user: CurrentUser,
+    session_id: str = Depends(get_session_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Follow an option; lazy stories generate the branch on first visit"""
+    child = await branch_expander.choose(db, story_id, node_id, request.option_index)
+    record_progress(
+        story_id,
+        child.id,  # type: ignore
+        current_user.user_id,
+        session_id,
+        from_node_id=node_id,
+        option_index=request.option_index,
     )
+    return child
+
+
+@router.post("/{story_id}/progress", status_code=202)
+async def save_progress(
+    story_id: int,
+    request: ProgressRequest,
+    current_user: CurrentUser,
+    session_id: str = Depends(get_session_id),
+):
+    """Record a move; buffered and written in batches, so this never waits on the DB"""
+    record_progress(
+        story_id,
+        request.node_id,
+        current_user.user_id,
+        session_id,
+        from_node_id=request.from_node_id,
+        option_index=request.option_index,
+    )
+    return {"queued": True}
+
+
+@router.get("/{story_id}/progress", response_model=ProgressResponse)
+async def get_progress(
+    story_id: int,
+    current_user: CurrentUser,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Where the signed-in user left the story, to resume there"""
+    node_id = await latest_position(db, story_id, current_user.user_id)
+    if node_id is None:
+        return ProgressResponse(story_id=story_id)
+    choices = [edge.ordinal for _, edge in await path_to_node(db, node_id)]
+    return ProgressResponse(story_id=story_id, node_id=node_id, choices=choices)  # type: ignore
@@ -1,9 +1,9 @@
 from uuid import UUID
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from utils.exceptions import UserNotFoundError
 from models.user import User
-from db.database import get_db
+from db.database import AsyncSessionLocal, get_async_db, get_read_db, read_router
 from schemas.user import UserCreate, UserLogin, UserResponse, Token
 from utils.auth import register_user, login_for_access_token, CurrentUser
 
@@ -12,20 +12,26 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 # Register new user
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    return register_user(db, user)
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    return await register_user(db, user)
 
 
 # Login
 @router.post("/token", response_model=Token)
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    return login_for_access_token(user, db)
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    return await login_for_access_token(user, db)
 
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: CurrentUser, db: Session = Depends(get_db)):
+async def get_current_user_info(
+    current_user: CurrentUser, db: AsyncSession = Depends(get_read_db)
+):
     user_id = UUID(current_user.user_id)
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
+    if not user and read_router.enabled:
+        # Registered moments ago, not on the replica yet
+        async with AsyncSessionLocal() as primary:
+            user = await primary.get(User, user_id)
     if not user:
         raise UserNotFoundError()
     return user
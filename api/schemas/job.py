@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -11,8 +11,13 @@ class StoryJobResponse(BaseModel):
     status : str 
     created_at : datetime
     story_id : Optional[int] = None
+    started_at : Optional[datetime] = None
+    first_node_at : Optional[datetime] = None
     completed_at : Optional[datetime] = None
     error  : Optional[str] = None
+    stage_timings : Optional[Dict[str, float]] = None
+    attempts : int = 0
+    next_attempt_at : Optional[datetime] = None
     
 
     class Config:
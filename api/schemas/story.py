@@ -34,11 +34,103 @@ class CreateStoryRequest(BaseModel):
     theme: str
 
 
+class ChooseOptionRequest(BaseModel):
+    option_index: int
+
+
+class StorySummaryResponse(StoryBase):
+    """A story without its nodes, for listings and search"""
+
+    id: int
+    created_at: datetime
+    theme: Optional[str] = None
+    generation_mode: str = "batch"
+    is_complete: bool = True
+    depth: Optional[int] = None
+    node_count: Optional[int] = None
+    ending_count: Optional[int] = None
+    winning_ending_count: Optional[int] = None
+    winning_path_count: Optional[int] = None
+    shortest_winning_path: Optional[int] = None
+
+
+class StoryPageResponse(BaseModel):
+    items: List[StorySummaryResponse]
+    # Pass back as `cursor` for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+
 class CompleteStoryResponse(StoryBase):
     id: int
     created_at: datetime
-    root_node: CompleteStoryNodeResponse
+    theme: Optional[str] = None
+    generation_mode: str = "batch"
+    is_complete: bool = True
+    # The root is all_nodes[root_node_id]; it isn't sent twice
+    root_node_id: int
     all_nodes: Dict[int, CompleteStoryNodeResponse]
 
     class Config:
         from_attributes = True
+
+
+class StoryNodesResponse(StoryBase):
+    """Nodes within `depth` choices of `from_node_id`, plus story metadata"""
+
+    id: int
+    theme: Optional[str] = None
+    generation_mode: str = "batch"
+    is_complete: bool = True
+    root_node_id: int
+    from_node_id: int
+    depth: int
+    nodes: Dict[int, CompleteStoryNodeResponse]
+
+
+class StoryPathStep(BaseModel):
+    """A scene on the way to a node and the option taken there"""
+
+    node_id: int
+    content: str
+    option_index: int
+    choice: str
+
+
+class StoryPathResponse(BaseModel):
+    story_id: int
+    node_id: int
+    # From the root down to the node's parent; empty for the root
+    steps: List[StoryPathStep]
+
+
+class ReachableEndingResponse(BaseModel):
+    node_id: int
+    content: str
+    is_winning_ending: bool
+    # Choices between the starting node and this ending
+    distance: int
+
+
+class StoryReplayResponse(BaseModel):
+    story_id: int
+    choices: List[int]
+    # Choices that could be followed; fewer than sent means the path broke
+    # off at an invalid or not yet generated option
+    followed: int
+    nodes: List[CompleteStoryNodeResponse]
+
+
+class ProgressRequest(BaseModel):
+    """The player reached `node_id`, by an option of `from_node_id` or by (re)starting"""
+
+    node_id: int
+    from_node_id: Optional[int] = None
+    option_index: Optional[int] = None
+
+
+class ProgressResponse(BaseModel):
+    story_id: int
+    # Where to resume; None if the player hasn't started
+    node_id: Optional[int] = None
+    # Option indexes from the root to `node_id`
+    choices: List[int] = []
@@ -0,0 +1,162 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete
+
+from core.admission import (
+    AdmissionController,
+    BucketBackend,
+    DatabaseBuckets,
+    MemoryBuckets,
+    admission as app_admission,
+)
+from core.config import settings
+from core.key_health import report_key_health
+from core.llm_pool import LLMClientPool
+from models.rate_limit import LLMKeyHealth, RateLimitBucket
+
+
+def controller(backend: BucketBackend, **limits) -> AdmissionController:
+    values = {
+        "user_rate_per_minute": 0.001,
+        "user_burst": 2,
+        "session_rate_per_minute": 0.001,
+        "session_burst": 1,
+        "quota_minutes": 5,
+        "max_queue_depth": 200,
+        **limits,
+    }
+    return AdmissionController(backend, **values)
+
+
+@pytest.fixture
+async def key_health(session_factory):
+    async with session_factory() as db:
+        await db.execute(delete(LLMKeyHealth))
+        await db.commit()
+    yield
+    async with session_factory() as db:
+        await db.execute(delete(LLMKeyHealth))
+        await db.commit()
+
+
+def test_bucket_backends_must_implement_take():
+    with pytest.raises(TypeError):
+        BucketBackend()
+
+
+@pytest.mark.parametrize("backend", ["memory", "database"])
+async def test_a_refused_request_spends_no_token(session_factory, backend):
+    async with session_factory() as db:
+        await db.execute(delete(RateLimitBucket))
+        await db.commit()
+    buckets = MemoryBuckets() if backend == "memory" else DatabaseBuckets(session_factory)
+    admission = controller(buckets)
+
+    await admission.admit("user", "session-1")
+    with pytest.raises(HTTPException) as raised:
+        await admission.admit("user", "session-1")
+    assert raised.value.status_code == 429
+    assert admission.rejected["session"] == 1
+
+    # The session limit refused it, so the user's second token is still there
+    await admission.admit("user", "session-2")
+    with pytest.raises(HTTPException):
+        await admission.admit("user", "session-3")
+    assert admission.rejected["user"] == 1
+
+
+async def test_budget_follows_the_workers_key_reports(session_factory, key_health):
+    pool = LLMClientPool(
+        ["key-a", "key-b"],
+        lambda key: None,
+        requests_per_minute=60,
+        cooldown_seconds=30,
+        failure_threshold=5,
+        circuit_open_seconds=60,
+        acquire_timeout=1,
+    )
+    # A minute of quota: 60 jobs per key
+    admission = controller(MemoryBuckets(), quota_minutes=1)
+
+    async with session_factory() as db:
+        await report_key_health(db, pool)
+        assert await admission.budget(db) == (120, 2.0)
+
+        pool.keys[0].circuit_open_until = time.monotonic() + 60
+        await report_key_health(db, pool)
+        assert await admission.budget(db) == (60, 1.0)
+
+        for state in pool.keys:
+            state.circuit_open_until = time.monotonic() + 60
+        await report_key_health(db, pool)
+        with pytest.raises(HTTPException) as raised:
+            await admission.check_capacity(db)
+    assert raised.value.status_code == 503
+
+
+async def test_no_api_key_is_a_503(session_factory, key_health, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKEND", "gemini")
+    monkeypatch.setattr(settings, "GOOGLE_API_KEYS", [])
+    admission = controller(MemoryBuckets())
+
+    async with session_factory() as db:
+        with pytest.raises(HTTPException) as raised:
+            await admission.check_capacity(db)
+    assert raised.value.status_code == 503
+
+
+class RacedBuckets(MemoryBuckets):
+    """The session's last token goes to a concurrent request after the peek"""
+
+    async def take(self, key, rate, burst, now):
+        if key.startswith("session:"):
+            return 5.0
+        return await super().take(key, rate, burst, now)
+
+
+async def test_a_token_taken_before_a_refusal_is_put_back():
+    buckets = RacedBuckets()
+    admission = controller(buckets)
+
+    with pytest.raises(HTTPException) as raised:
+        await admission.admit("user", "session")
+    assert raised.value.status_code == 429
+    assert buckets._buckets["user:user"][0] == 2
+
+
+async def test_a_full_queue_spends_no_token(api_client, key_health, monkeypatch):
+    monkeypatch.setattr(app_admission, "backend", MemoryBuckets())
+    monkeypatch.setitem(app_admission.limits, "user", (0.001, 1))
+    monkeypatch.setitem(app_admission.limits, "session", (0.001, 1))
+    api_client.cookies.set("session_id", "full-queue-session")
+
+    # No API key: the queue budget is 0
+    with monkeypatch.context() as no_keys:
+        no_keys.setattr(settings, "LLM_BACKEND", "gemini")
+        no_keys.setattr(settings, "GOOGLE_API_KEYS", [])
+        response = await api_client.post("/api/stories/create", json={"theme": "pirates"})
+    assert response.status_code == 503
+
+    # The 503 cost nothing, so the one-token buckets still admit a request
+    response = await api_client.post("/api/stories/create", json={"theme": "pirates"})
+    assert response.status_code == 200
+    response = await api_client.post("/api/stories/create", json={"theme": "pirates"})
+    assert response.status_code == 429
+
+
+async def test_database_refund_is_capped_at_the_burst(session_factory):
+    buckets = DatabaseBuckets(session_factory)
+    now = time.time()
+    for _ in range(2):
+        assert await buckets.take("user:refund", 0.001, 2, now) == 0
+    assert await buckets.peek("user:refund", 0.001, 2, now) > 0
+
+    await buckets.refund("user:refund", 2)
+    assert await buckets.peek("user:refund", 0.001, 2, now) == 0
+    for _ in range(3):
+        await buckets.refund("user:refund", 2)
+    assert await buckets.take("user:refund", 0.001, 2, now) == 0
+    assert await buckets.take("user:refund", 0.001, 2, now) == 0
+    assert await buckets.take("user:refund", 0.001, 2, now) > 0
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import time
+
+from conftest import add_job
+from core.job_events import job_events
+from core.worker import StoryWorker
+
+
+async def subscribed(job_id: str):
+    """Wait until a request is listening for the job's events"""
+    while job_id not in job_events._subscribers:
+        await asyncio.sleep(0.01)
+
+
+async def test_long_poll_returns_the_job_after_the_timeout(session_factory, api_client):
+    job_id = await add_job(session_factory, "long poll timeout")
+
+    started = time.monotonic()
+    response = await api_client.get(f"/api/jobs/{job_id}", params={"wait": 1})
+
+    assert time.monotonic() - started >= 1
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+    assert job_id not in job_events._subscribers
+
+
+async def test_long_poll_wakes_when_the_job_changes(session_factory, api_client):
+    job_id = await add_job(session_factory, "long poll wake")
+    poll = asyncio.create_task(api_client.get(f"/api/jobs/{job_id}", params={"wait": 30}))
+    await subscribed(job_id)
+
+    await StoryWorker(session_factory).run_until_empty()
+    response = await asyncio.wait_for(poll, 5)
+
+    # Woken by the claim, the first change
+    assert response.json()["status"] == "processing"
+
+
+async def test_long_poll_on_a_finished_job_returns_at_once(session_factory, api_client):
+    job_id = await add_job(session_factory, "long poll done")
+    await StoryWorker(session_factory).run_until_empty()
+
+    started = time.monotonic()
+    response = await api_client.get(f"/api/jobs/{job_id}", params={"wait": 30})
+
+    assert time.monotonic() - started < 5
+    assert response.json()["status"] == "completed"
+
+
+def sse_frames(body: str):
+    return [frame for frame in body.split("\n\n") if frame]
+
+
+async def test_event_stream_ends_with_the_finished_job(
+    session_factory, api_client, monkeypatch
+):
+    monkeypatch.setattr("routers.job.SSE_HEARTBEAT_SECONDS", 0.01)
+    job_id = await add_job(session_factory, "event stream")
+    stream = asyncio.create_task(api_client.get(f"/api/jobs/{job_id}/events"))
+    await subscribed(job_id)
+    await asyncio.sleep(0.05)  # a few heartbeats
+
+    await StoryWorker(session_factory).run_until_empty()
+    response = await asyncio.wait_for(stream, 5)
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = sse_frames(response.text)
+    assert ": keep-alive" in frames
+    events = [
+        json.loads(frame.split("data: ", 1)[1])
+        for frame in frames
+        if frame.startswith("event: status")
+    ]
+    assert [event["status"] for event in events] == ["pending", "processing", "completed"]
+    assert events[-1]["story_id"] is not None
+    # Nothing follows the final frame
+    assert frames[-1].startswith("event: status")
+    assert job_id not in job_events._subscribers
+
+
+async def test_event_stream_of_an_unknown_job_is_a_404(api_client):
+    response = await api_client.get("/api/jobs/no-such-job/events")
+    assert response.status_code == 404
+    assert "no-such-job" not in job_events._subscribers
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from conftest import FIXTURES
+from core.json_repair import repair_json
+from core.json_stream import JSONStreamError
+from core.story_generator import StoryGenerator
+
+with open(FIXTURES / "json_repair_corpus.jsonl") as f:
+    CORPUS = [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case["name"] for case in CORPUS])
+def test_corpus(case):
+    """Each answer is stored, or refused, as bench/json_repair_bench.py expects"""
+    try:
+        story = StoryGenerator._parse_response(AIMessage(content=case["text"]))
+        StoryGenerator._collect_levels(story.rootNode)
+        outcome = "ok"
+    except Exception:
+        outcome = "error"
+    assert outcome == case["expect"]
+
+
+@pytest.mark.parametrize(
+    "text, value, repairs, truncated",
+    [
+        ('{"a": 1}', {"a": 1}, 0, False),
+        # Fences and trailing commas aren't counted as repairs
+        ('```json\n{"a": [1, 2,],}\n```', {"a": [1, 2]}, 0, False),
+        ('{"a": 1 "b": 2}', {"a": 1, "b": 2}, 1, False),
+        ('{"a" 1}', {"a": 1}, 1, False),
+        ('{"a": [1, 2}', {"a": [1, 2]}, 1, False),
+        ('{"a": tru, "b": 2}', {"b": 2}, 1, False),
+        ('{"a": "\\ud83d x"}', {"a": "\ufffd x"}, 1, False),
+        ('{"a": "cut', {"a": "cut"}, 1, True),
+        ('{"a": 1, "b', {"a": 1}, 1, True),
+    ],
+)
+def test_repair_json(text, value, repairs, truncated):
+    assert repair_json(text) == (value, repairs, truncated)
+
+
+def test_prose_before_the_expected_container_is_skipped():
+    assert repair_json('See [draft] {"a": 1}', starts="{").value == {"a": 1}
+
+
+def test_text_without_json_is_rejected():
+    with pytest.raises(JSONStreamError):
+        repair_json("Sorry, I can't write that story.")
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from core.json_repair import repair_json
+from core.json_stream import JSONStreamError, JSONStreamParser
+
+EMOJI_STORY = '{"title": "a \\ud83d\\ude00 b", "rootNode": {"content": "caf\\u00e9"}}'
+
+
+def parse(text: str, chunk_size: int = 1):
+    parser = JSONStreamParser()
+    for start in range(0, len(text), chunk_size):
+        parser.feed(text[start : start + chunk_size])
+    assert parser.done
+    return parser.root
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_surrogate_pairs_are_joined_across_chunks(chunk_size):
+    root = parse(EMOJI_STORY, chunk_size)
+
+    assert root == json.loads(EMOJI_STORY)
+    assert root["title"] == "a \U0001f600 b"
+    root["title"].encode("utf-8")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"title": "\\ud83d"}',  # high half at the end of the string
+        '{"title": "\\ud83d x"}',  # followed by a plain character
+        '{"title": "\\ud83d\\n"}',  # followed by another escape
+        '{"title": "\\ude00"}',  # low half on its own
+        '{"title": "\\u12G4"}',  # not hex
+    ],
+)
+def test_unpaired_surrogates_and_bad_escapes_are_rejected(text):
+    with pytest.raises(JSONStreamError):
+        parse(text)
+
+
+def test_repair_keeps_pairs_and_replaces_lone_surrogates():
+    repaired = repair_json(EMOJI_STORY.replace("\\ude00", "") + " trailing prose")
+
+    assert repaired.value["title"] == "a � b"
+    assert repaired.value["rootNode"]["content"] == "café"
+    assert repaired.repairs == 1
+    json.dumps(repaired.value, ensure_ascii=False).encode("utf-8")
+
+    assert repair_json(EMOJI_STORY).value == json.loads(EMOJI_STORY)
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from conftest import add_job, get_job
+from core.config import settings
+from core.lazy_story import branch_expander
+from core.story_cache import get_complete_story_payload, story_cache
+from core.story_graph import add_option
+from core.worker import StoryWorker
+from models.story import StoryNode
+
+
+@pytest.fixture
+async def lazy_story(session_factory, monkeypatch):
+    """A lazy story whose branches must end at the second level"""
+    monkeypatch.setattr(settings, "GENERATION_MODE", "lazy")
+    monkeypatch.setattr(settings, "LAZY_MAX_DEPTH", 2)
+    job_id = await add_job(session_factory)
+    await StoryWorker(session_factory).run_until_empty()
+    await asyncio.gather(*branch_expander._prefetches)
+
+    job = await get_job(session_factory, job_id)
+    assert job.status == "completed", job.error
+    async with session_factory() as db:
+        root = await db.scalar(
+            select(StoryNode).where(
+                StoryNode.story_id == job.story_id, StoryNode.is_root.is_(True)
+            )
+        )
+    return job.story_id, root
+
+
+async def test_branches_end_at_lazy_max_depth(session_factory, lazy_story):
+    story_id, root = lazy_story
+    async with session_factory() as db:
+        for index in range(len(root.options)):
+            child = await branch_expander.choose(db, story_id, root.id, index)
+            assert child.is_ending
+            assert not child.options
+
+
+async def test_expanding_past_lazy_max_depth_is_rejected(
+    session_factory, lazy_story, monkeypatch
+):
+    story_id, root = lazy_story
+    async with session_factory() as db:
+        child = await branch_expander.choose(db, story_id, root.id, 0)
+        # A node written under a higher limit
+        add_option(db, child, "Keep going", None)
+        await db.commit()
+
+        with pytest.raises(HTTPException) as raised:
+            await branch_expander.choose(db, story_id, child.id, 0)
+    assert raised.value.status_code == 400
+
+
+async def test_expanding_drops_the_cached_story(session_factory, lazy_story):
+    story_id, root = lazy_story
+    open_index = next(
+        index for index, option in enumerate(root.options) if option["node_id"] is None
+    )
+    await get_complete_story_payload(story_id)
+    assert story_cache.get(story_id) is not None
+
+    async with session_factory() as db:
+        await branch_expander.choose(db, story_id, root.id, open_index)
+
+    assert story_cache.get(story_id) is None
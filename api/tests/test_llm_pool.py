@@ -0,0 +1,104 @@
+import time
+
+import pytest
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+
+from core.config import settings
+from core.llm_pool import LLMClientPool, LLMPoolExhausted, key_fingerprint, key_scope
+
+
+def make_pool(*keys: str, **options) -> LLMClientPool:
+    values = {
+        "requests_per_minute": 600,
+        "cooldown_seconds": 30,
+        "failure_threshold": 2,
+        "circuit_open_seconds": 60,
+        "acquire_timeout": 0.05,
+        **options,
+    }
+    return LLMClientPool(list(keys), lambda key: key, **values)
+
+
+async def fail(pool: LLMClientPool, error: Exception) -> str:
+    """Lease a key for a call that raises `error`; returns the key used"""
+    with pytest.raises(type(error)):
+        async with pool.acquire() as lease:
+            used = lease.key_id
+            raise error
+    return used
+
+
+async def test_a_rate_limited_key_cools_down():
+    pool = make_pool("key-a", "key-b")
+    limited = await fail(pool, ResourceExhausted("429 quota"))
+
+    for _ in range(3):
+        async with pool.acquire() as lease:
+            assert lease.key_id != limited
+    assert [s["cooling_down"] for s in pool.stats()] == [True, False]
+
+
+async def test_every_key_cooling_down_exhausts_the_pool():
+    pool = make_pool("key-a")
+    await fail(pool, ResourceExhausted("429 quota"))
+
+    with pytest.raises(LLMPoolExhausted):
+        async with pool.acquire():
+            pass
+
+
+async def test_repeated_failures_open_the_circuit_until_a_trial_succeeds():
+    pool = make_pool("key-a", "key-b")
+    state = pool.keys[0]
+    pool.keys[1].cooldown_until = time.monotonic() + 60  # only key-a is usable
+    for _ in range(2):
+        await fail(pool, ServiceUnavailable("down"))
+    assert state.circuit_open_until > time.monotonic()
+    with pytest.raises(LLMPoolExhausted):
+        async with pool.acquire():
+            pass
+
+    # Half-open: one trial request, and the circuit stays open while it runs
+    state.circuit_open_until = time.monotonic() - 1
+    async with pool.acquire() as lease:
+        assert lease is state
+        assert state.circuit_open_until > time.monotonic()
+    assert state.circuit_open_until == 0.0
+    assert state.consecutive_failures == 0
+
+
+async def test_a_failed_trial_keeps_the_circuit_open():
+    pool = make_pool("key-a")
+    state = pool.keys[0]
+    state.consecutive_failures = 2
+    state.circuit_open_until = time.monotonic() - 1
+
+    await fail(pool, ServiceUnavailable("down"))
+    assert state.circuit_open_until > time.monotonic()
+
+
+async def test_key_scope_avoids_excluded_keys_and_records_the_lease():
+    pool = make_pool("key-a", "key-b")
+    excluded = key_fingerprint("key-a")
+
+    with key_scope([excluded]) as scope:
+        for _ in range(3):
+            async with pool.acquire() as lease:
+                assert lease.key_id != excluded
+    assert scope.used == [key_fingerprint("key-b")] * 3
+
+    # With every key excluded, they are all used again
+    with key_scope([state.key_id for state in pool.keys]):
+        async with pool.acquire():
+            pass
+
+
+async def test_llm_stats_without_api_keys(api_client, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKEND", "gemini")
+    monkeypatch.setattr(settings, "GOOGLE_API_KEYS", [])
+    monkeypatch.setattr("core.llm_pool._pool", None)
+
+    response = await api_client.get("/api/stats/llm")
+
+    assert response.status_code == 200
+    assert response.json() == {"keys": []}
@@ -0,0 +1,55 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from conftest import WORKDIR, add_job, get_job
+from core.worker import StoryWorker
+from db.database import Base
+from db.migrate import upgrade_schema, upgrade_statements
+
+# The tables as the first release created them
+ORIGINAL_SCHEMA = """
+CREATE TABLE story_job (
+    id INTEGER PRIMARY KEY, job_id VARCHAR, session_id VARCHAR, theme VARCHAR,
+    status VARCHAR, story_id INTEGER, error VARCHAR,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), completed_at DATETIME
+);
+CREATE TABLE stories (
+    id INTEGER PRIMARY KEY, title VARCHAR, session_id VARCHAR,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+);
+CREATE TABLE story_nodes (
+    id INTEGER PRIMARY KEY, story_id INTEGER REFERENCES stories (id), content VARCHAR,
+    is_root BOOLEAN, is_ending BOOLEAN, is_winning_ending BOOLEAN, options JSON
+);
+INSERT INTO stories (id, title, session_id) VALUES (1, 'Old story', 'old-session');
+"""
+
+
+async def test_original_database_is_upgraded_in_place():
+    url = f"sqlite:///{WORKDIR}/original.db"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        for statement in ORIGINAL_SCHEMA.split(";"):
+            if statement.strip():
+                conn.exec_driver_sql(statement)
+
+    Base.metadata.create_all(bind=engine)
+    assert upgrade_schema(engine)
+    with engine.connect() as conn:
+        assert upgrade_statements(conn) == []
+        columns = {c["name"] for c in inspect(conn).get_columns("story_job")}
+        assert {"attempts", "next_attempt_at", "worker_id", "is_pool_job"} <= columns
+        old_story = conn.execute(
+            text("SELECT is_complete, is_pooled, generation_mode FROM stories")
+        ).one()
+        assert tuple(old_story) == (1, 0, "batch")
+    engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{WORKDIR}/original.db")
+    session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    try:
+        job_id = await add_job(session_factory)
+        await StoryWorker(session_factory).run_until_empty()
+        assert (await get_job(session_factory, job_id)).status == "completed"
+    finally:
+        await async_engine.dispose()
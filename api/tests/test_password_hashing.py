@@ -0,0 +1,33 @@
+import asyncio
+import os
+
+from utils.password_hashing import PasswordHasher
+
+
+async def test_hashes_run_in_spawned_processes():
+    hasher = PasswordHasher(workers=1, max_pending=10)
+    hasher.start()
+    try:
+        assert hasher._executor._mp_context.get_start_method() == "spawn"
+        hashed = await hasher.hash("correct horse")
+        assert await hasher.verify("correct horse", hashed)
+        assert not await hasher.verify("battery staple", hashed)
+    finally:
+        hasher.shutdown()
+
+
+async def test_hashing_processes_run_at_a_lower_priority():
+    hasher = PasswordHasher(workers=1, max_pending=10, nice=5)
+    hasher.start()
+    try:
+        loop = asyncio.get_running_loop()
+        assert await loop.run_in_executor(hasher._executor, os.nice, 0) == os.nice(0) + 5
+    finally:
+        hasher.shutdown()
+
+
+def test_the_default_pool_leaves_a_cpu_for_the_api(monkeypatch):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: {0, 1, 2, 3}, raising=False)
+    assert PasswordHasher(workers=None, max_pending=10).workers == 3
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: {0}, raising=False)
+    assert PasswordHasher(workers=None, max_pending=10).workers == 1
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import time
+
+from db.database import AsyncSessionLocal, ReadRouter
+
+
+def make_router(**values) -> ReadRouter:
+    values = {"max_lag": 5, "check_interval": 60, "check_timeout": 0.2, **values}
+    return ReadRouter([os.environ["DATABASE_URL"]], **values)
+
+
+async def test_reads_use_a_replica_once_its_lag_is_known():
+    router = make_router()
+    # Not measured yet: the primary serves while the check runs
+    assert await router.session_factory() is AsyncSessionLocal
+    await router._checking
+    assert await router.session_factory() is router.replicas[0].session_factory
+    assert (router.primary_reads, router.replica_reads) == (1, 1)
+    await router.dispose()
+
+
+async def test_a_hanging_replica_never_holds_up_reads(monkeypatch):
+    router = make_router()
+    replica = router.replicas[0]
+
+    async def hang():
+        await asyncio.sleep(60)
+
+    replica.is_postgres = True
+    monkeypatch.setattr(replica, "_query_lag", hang)
+
+    started = time.monotonic()
+    for _ in range(5):
+        assert await router.session_factory() is AsyncSessionLocal
+    assert time.monotonic() - started < 0.1
+
+    await router._checking
+    assert replica.lag_seconds is None
+    assert replica.error == "TimeoutError"
+    assert await router.session_factory() is AsyncSessionLocal
+    await router.dispose()
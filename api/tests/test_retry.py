@@ -0,0 +1,23 @@
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+from langchain_core.messages import AIMessage
+
+from core.json_stream import JSONStreamError
+from core.models import StoryLLMResponse
+from core.retry import MALFORMED, PERMANENT, TRANSIENT, classify_error
+from core.story_generator import StoryGenerator
+
+
+@pytest.mark.parametrize(
+    "content", ['{"title": "No root"}', "Sorry, I can't write that story."]
+)
+def test_unusable_answers_are_malformed(content):
+    with pytest.raises(ValueError) as raised:
+        StoryGenerator._parse_response(AIMessage(content=content), StoryLLMResponse)
+    assert classify_error(raised.value) == MALFORMED
+
+
+def test_other_value_errors_are_permanent():
+    assert classify_error(ValueError("NO GOOGLE API KEY FOUND")) == PERMANENT
+    assert classify_error(JSONStreamError("Unexpected '}'")) == MALFORMED
+    assert classify_error(ServiceUnavailable("down")) == TRANSIENT
@@ -0,0 +1,104 @@
+import pytest
+
+from core.story_analytics import (
+    METRIC_COLUMNS,
+    backfill,
+    compute_metrics,
+    graph_from_nodes,
+)
+from core.story_graph import add_option
+from models.story import Story, StoryNode
+
+# root ─┬─ a ─┬─ won (winning)
+#       │     ├─ lost (ending)
+#       │     └─ bridge ── treasure (winning)
+#       └─ b ─┬─ bridge
+#             ├─ drowned (ending)
+#             └─ (not generated yet)
+TREE = {
+    "root": (False, False, ["a", "b"]),
+    "a": (False, False, ["won", "lost", "bridge"]),
+    "b": (False, False, ["bridge", "drowned", None]),
+    "won": (True, True, []),
+    "lost": (True, False, []),
+    "bridge": (False, False, ["treasure"]),
+    "drowned": (True, False, []),
+    "treasure": (True, True, []),
+}
+EXPECTED = {
+    "depth": 4,
+    "node_count": 8,
+    "ending_count": 4,
+    "winning_ending_count": 2,
+    # root-a-won, root-a-bridge-treasure, root-b-bridge-treasure
+    "winning_path_count": 3,
+    "shortest_winning_path": 2,
+}
+
+
+def test_compute_metrics():
+    ids = {name: index for index, name in enumerate(TREE, start=1)}
+    graph = {
+        ids[name]: (is_ending, is_winning, [ids[child] for child in children if child])
+        for name, (is_ending, is_winning, children) in TREE.items()
+    }
+    assert compute_metrics(graph, ids["root"]) == EXPECTED
+
+
+def test_links_to_unknown_or_visited_nodes_are_ignored():
+    graph = {1: (False, False, [2, 99]), 2: (True, True, [1])}
+    metrics = compute_metrics(graph, 1)
+    assert metrics["depth"] == 2
+    assert metrics["node_count"] == 2
+    assert metrics["winning_path_count"] == 1
+
+
+def test_a_story_without_a_winning_ending():
+    graph = {1: (False, False, [2]), 2: (True, False, [])}
+    metrics = compute_metrics(graph, 1)
+    assert metrics["winning_ending_count"] == metrics["winning_path_count"] == 0
+    assert metrics["shortest_winning_path"] is None
+
+
+@pytest.fixture
+async def unmeasured_story(session_factory):
+    """TREE as a stored story written before the metric columns existed"""
+    async with session_factory() as db:
+        story = Story(title="Known shape", session_id="analytics")
+        db.add(story)
+        await db.flush()
+        nodes = {
+            name: StoryNode(
+                story_id=story.id,
+                content=name,
+                is_root=name == "root",
+                is_ending=is_ending,
+                is_winning_ending=is_winning,
+                options=[],
+            )
+            for name, (is_ending, is_winning, _) in TREE.items()
+        }
+        db.add_all(nodes.values())
+        await db.flush()
+        for name, (_, _, children) in TREE.items():
+            for child in children:
+                add_option(db, nodes[name], f"Go to {child}", nodes[child].id if child else None)
+        await db.commit()
+        return story.id, list(nodes.values())
+
+
+async def test_graph_from_nodes(unmeasured_story):
+    story_id, nodes = unmeasured_story
+    graph, root_id = graph_from_nodes(nodes)
+    assert root_id == nodes[0].id
+    assert compute_metrics(graph, root_id) == EXPECTED
+
+
+async def test_backfill_fills_the_metric_columns(session_factory, unmeasured_story):
+    story_id, _ = unmeasured_story
+
+    assert await backfill(batch_size=1) >= 1
+
+    async with session_factory() as db:
+        story = await db.get(Story, story_id)
+        assert {column: getattr(story, column) for column in METRIC_COLUMNS} == EXPECTED
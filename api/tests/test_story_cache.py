@@ -0,0 +1,86 @@
+import pytest
+
+from conftest import add_job, get_job
+from core.cache import ByteLRUCache
+from core.story_cache import invalidate_story
+from core.worker import StoryWorker
+
+
+def test_eviction_keeps_the_cache_within_its_byte_budget():
+    cache = ByteLRUCache(max_bytes=10, ttl_seconds=60)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") is not None  # "b" is now the least recently used
+
+    cache.put("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a").body == b"aaaa"
+    assert cache.get("c").body == b"cccc"
+    assert cache.stats()["size_bytes"] == 8
+    assert cache.stats()["evictions"] == 1
+
+
+def test_a_payload_over_the_budget_is_not_stored():
+    cache = ByteLRUCache(max_bytes=10, ttl_seconds=60)
+    cache.put("a", b"aaaa")
+
+    payload = cache.put("big", b"x" * 11)
+
+    assert payload.etag == ByteLRUCache.make_etag(b"x" * 11)
+    assert cache.get("big") is None
+    assert cache.get("a") is not None
+
+
+def test_etag_depends_only_on_the_body():
+    cache = ByteLRUCache(max_bytes=100, ttl_seconds=60)
+    first = cache.put("a", b"story")
+    cache.invalidate("a")
+
+    assert cache.put("a", b"story").etag == first.etag
+    assert cache.put("b", b"story").etag == first.etag
+    assert cache.put("a", b"other story").etag != first.etag
+
+
+@pytest.fixture
+async def story_id(session_factory):
+    job_id = await add_job(session_factory, "etag harbour")
+    await StoryWorker(session_factory).run_until_empty()
+    job = await get_job(session_factory, job_id)
+    assert job.status == "completed", job.error
+    return job.story_id
+
+
+async def test_etag_is_stable_across_reloads(api_client, story_id):
+    first = await api_client.get(f"/api/stories/{story_id}/complete")
+    invalidate_story(story_id)
+    second = await api_client.get(f"/api/stories/{story_id}/complete")
+
+    assert first.status_code == second.status_code == 200
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert first.content == second.content
+
+
+@pytest.mark.parametrize("matches", [True, False])
+async def test_if_none_match(api_client, story_id, matches):
+    etag = (await api_client.get(f"/api/stories/{story_id}/complete")).headers["ETag"]
+    if_none_match = f'"stale", {etag}' if matches else '"stale"'
+
+    response = await api_client.get(
+        f"/api/stories/{story_id}/complete", headers={"If-None-Match": if_none_match}
+    )
+
+    if matches:
+        assert response.status_code == 304
+        assert response.content == b""
+    else:
+        assert response.status_code == 200
+        assert response.json()["id"] == story_id
+    assert response.headers["ETag"] == etag
+
+
+async def test_if_none_match_star(api_client, story_id):
+    response = await api_client.get(
+        f"/api/stories/{story_id}/complete", headers={"If-None-Match": "*"}
+    )
+    assert response.status_code == 304
@@ -0,0 +1,144 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import add_job, get_job
+from core.story_cache import complete_story_from_nodes
+from core.story_codec import (
+    MEDIA_TYPE,
+    ZSTD_MAGIC,
+    decode_story,
+    encode_story,
+    import_story,
+    load_story,
+    node_options,
+)
+from core.worker import StoryWorker
+from models.story import Story, StoryNode
+from schemas.story import CompleteStoryResponse
+
+
+def small_story():
+    story = Story(
+        id=7,
+        title="Round trip",
+        session_id="codec",
+        theme="tides",
+        generation_mode="lazy",
+        is_complete=True,
+        created_at=datetime(2024, 5, 1, tzinfo=timezone.utc),
+        depth=2,
+        node_count=3,
+    )
+    options = [
+        {"text": "Swim", "node_id": 12},
+        {"text": "Wait", "node_id": 13},
+        # Not generated yet
+        {"text": "Sail", "node_id": None},
+    ]
+    nodes = [
+        StoryNode(
+            id=node_id,
+            story_id=7,
+            content=content,
+            is_root=node_id == 11,
+            is_ending=node_id != 11,
+            is_winning_ending=node_id == 12,
+            options=options if node_id == 11 else [],
+        )
+        for node_id, content in ((11, "The tide rises."), (12, "Ashore."), (13, "Ashore."))
+    ]
+    return story, nodes
+
+
+def test_json_round_trip():
+    story, nodes = small_story()
+    response = complete_story_from_nodes(story, nodes)
+
+    decoded = CompleteStoryResponse.model_validate_json(response.model_dump_json())
+
+    assert decoded == response
+
+
+@pytest.mark.parametrize("zstd_level", [0, 3])
+def test_msgpack_round_trip(zstd_level):
+    story, nodes = small_story()
+
+    payload = encode_story(story, nodes, zstd_level=zstd_level)
+    data = decode_story(payload)
+
+    assert (payload[:4] == ZSTD_MAGIC) == bool(zstd_level)
+    assert data["story"]["title"] == "Round trip"
+    assert data["story"]["created_at"] == "2024-05-01T00:00:00+00:00"
+    assert data["nodes"]["id"] == [11, 12, 13]
+    assert [data["strings"][i] for i in data["nodes"]["content"]] == [
+        node.content for node in nodes
+    ]
+    assert data["nodes"]["flags"] == [1, 6, 2]
+    assert node_options(data, data["nodes"]["id"]) == [node.options for node in nodes]
+    # Repeated text is stored once
+    assert data["strings"].count("Ashore.") == 1
+
+
+def test_an_unknown_version_is_rejected():
+    with pytest.raises(ValueError):
+        decode_story(b"\x81\xa1v\x02")
+
+
+async def test_import_restores_the_story_under_new_ids(session_factory):
+    story, nodes = small_story()
+    async with session_factory() as db:
+        story_id = await import_story(db, decode_story(encode_story(story, nodes, 3)))
+        await db.commit()
+        restored, restored_nodes = await load_story(db, story_id)
+
+    assert restored.title == story.title
+    assert restored.depth == 2
+    assert [node.content for node in restored_nodes] == [node.content for node in nodes]
+    ids = [node.id for node in restored_nodes]
+    assert restored_nodes[0].options == [
+        {"text": "Swim", "node_id": ids[1]},
+        {"text": "Wait", "node_id": ids[2]},
+        {"text": "Sail", "node_id": None},
+    ]
+
+
+@pytest.fixture
+async def story_id(session_factory):
+    job_id = await add_job(session_factory, "codec cove")
+    await StoryWorker(session_factory).run_until_empty()
+    job = await get_job(session_factory, job_id)
+    assert job.status == "completed", job.error
+    return job.story_id
+
+
+async def test_complete_defaults_to_json(api_client, story_id):
+    response = await api_client.get(f"/api/stories/{story_id}/complete")
+
+    assert response.headers["content-type"] == "application/json"
+    story = CompleteStoryResponse.model_validate_json(response.content)
+    assert story.id == story_id
+    assert story.root_node_id in story.all_nodes
+
+
+@pytest.mark.parametrize("accept_encoding", ["identity", "zstd"])
+async def test_complete_as_msgpack(api_client, story_id, accept_encoding):
+    json_story = (await api_client.get(f"/api/stories/{story_id}/complete")).json()
+
+    response = await api_client.get(
+        f"/api/stories/{story_id}/complete",
+        params={"format": "msgpack"},
+        headers={"Accept-Encoding": accept_encoding},
+    )
+
+    assert response.headers["content-type"] == MEDIA_TYPE
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers.get("content-encoding") == (
+        "zstd" if accept_encoding == "zstd" else None
+    )
+    # httpx has undone any zstd Content-Encoding
+    data = decode_story(response.content)
+    assert data["story"]["id"] == story_id
+    node_ids = data["nodes"]["id"]
+    assert sorted(map(str, node_ids)) == sorted(json_story["all_nodes"])
+    assert node_ids[data["root"]] == json_story["root_node_id"]
@@ -0,0 +1,26 @@
+from sqlalchemy import select, update
+
+from conftest import add_job, get_job
+from core.story_graph import check
+from core.worker import StoryWorker
+from models.story import StoryEdge
+
+
+async def test_check_finds_and_repairs_edges_that_differ_from_options(session_factory):
+    job_id = await add_job(session_factory)
+    await StoryWorker(session_factory).run_until_empty()
+    story_id = (await get_job(session_factory, job_id)).story_id
+
+    # Every writer keeps the options JSON and the edges in step
+    assert await check(batch_size=2) == 0
+
+    async with session_factory() as db:
+        edge_id = await db.scalar(
+            select(StoryEdge.id).where(StoryEdge.story_id == story_id).limit(1)
+        )
+        await db.execute(update(StoryEdge).where(StoryEdge.id == edge_id).values(text="Edited"))
+        await db.commit()
+
+    assert await check(batch_size=2) == 1
+    assert await check(batch_size=2, repair=True) == 1
+    assert await check(batch_size=2) == 0
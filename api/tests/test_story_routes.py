@@ -0,0 +1,18 @@
+import uuid
+
+from models.story import Story
+
+
+async def test_story_list_only_shows_the_callers_session(session_factory, api_client):
+    mine, theirs = str(uuid.uuid4()), str(uuid.uuid4())
+    async with session_factory() as db:
+        db.add_all(
+            [Story(title="Mine", session_id=mine), Story(title="Theirs", session_id=theirs)]
+        )
+        await db.commit()
+
+    api_client.cookies.set("session_id", mine)
+    response = await api_client.get("/api/stories", params={"session_id": theirs})
+
+    assert response.status_code == 200
+    assert [item["title"] for item in response.json()["items"]] == ["Mine"]
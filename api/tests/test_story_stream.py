@@ -0,0 +1,46 @@
+from google.api_core.exceptions import ServiceUnavailable
+from sqlalchemy import select
+
+from conftest import add_job, get_job
+from core.config import settings
+from core.llm_pool import get_llm_pool
+from core.story_cache import get_complete_story_payload, story_cache
+from core.worker import StoryWorker
+from models.story import Story, StoryNode
+
+
+async def test_stream_cut_off_after_the_first_node_leaves_a_finished_story(
+    session_factory, monkeypatch
+):
+    monkeypatch.setattr(settings, "GENERATION_MODE", "stream")
+    client = get_llm_pool().keys[0].client
+    astream = client.astream
+
+    async def broken_stream(prompt, **kwargs):
+        chunks = 0
+        async for chunk in astream(prompt, chunk_size=64, **kwargs):
+            yield chunk
+            chunks += 1
+            if chunks == 12:
+                raise ServiceUnavailable("stream reset (test)")
+
+    monkeypatch.setattr(client, "astream", broken_stream)
+    job_id = await add_job(session_factory)
+
+    await StoryWorker(session_factory).run_until_empty()
+
+    job = await get_job(session_factory, job_id)
+    assert job.status == "failed"
+    assert job.story_id is not None
+    async with session_factory() as db:
+        story = await db.get(Story, job.story_id)
+        nodes = (
+            await db.scalars(select(StoryNode).where(StoryNode.story_id == story.id))
+        ).all()
+    assert story.is_complete
+    assert story.node_count == len(nodes) > 1
+    assert all(node.is_ending or node.options for node in nodes)
+
+    story_cache.invalidate(story.id)
+    assert await get_complete_story_payload(story.id) is not None
+    assert story_cache.get(story.id) is not None
@@ -0,0 +1,55 @@
+import asyncio
+
+from core.models import StoryLLMResponse
+from core.variant_cache import StoryVariant, ThemeVariantCache
+
+
+def variant_factory(calls: list):
+    async def factory() -> StoryVariant:
+        calls.append(None)
+        structure = StoryLLMResponse.model_validate(
+            {
+                "title": f"Variant {len(calls)}",
+                "rootNode": {"content": "The end.", "isEnding": True, "isWinningEnding": True},
+            }
+        )
+        return StoryVariant(structure, latency_seconds=1.0, tokens=100)
+
+    return factory
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def test_refills_wait_for_a_worker_slot():
+    cache = ThemeVariantCache(variants_per_key=3, max_keys=10, ttl_seconds=60)
+    slots = asyncio.Semaphore(1)
+    cache.share_slots(slots)
+    calls: list = []
+
+    async with slots:  # the worker is busy
+        await cache.get_or_generate("slots", variant_factory(calls))
+        await settle()
+        assert len(calls) == 1
+
+    await asyncio.gather(*cache._tasks)
+    assert len(calls) == 3
+    assert cache.refills == 2
+
+
+async def test_shutdown_cancels_refills():
+    cache = ThemeVariantCache(variants_per_key=3, max_keys=10, ttl_seconds=60)
+    slots = asyncio.Semaphore(1)
+    cache.share_slots(slots)
+    calls: list = []
+
+    async with slots:
+        await cache.get_or_generate("shutdown", variant_factory(calls))
+        await settle()
+        await cache.shutdown()
+
+    assert not cache._tasks
+    assert not cache._refilling
+    assert len(calls) == 1
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from conftest import add_job, get_job
+from core.config import settings
+from core.story_cache import get_complete_story_payload
+from core.warm_pool import WARM_POOL_SESSION_ID, WarmPool
+from core.worker import StoryWorker
+from models.job import StoryJob
+
+
+@pytest.fixture
+def pool_settings(monkeypatch):
+    monkeypatch.setattr(settings, "WARM_POOL_THEMES", ["haunted lighthouse"])
+    monkeypatch.setattr(settings, "WARM_POOL_TARGET_PER_THEME", 3)
+    monkeypatch.setattr(settings, "WARM_POOL_REFILL_PER_MINUTE", 100)
+    monkeypatch.setattr(settings, "WARM_POOL_MAX_QUEUE_DEPTH", 1000)
+
+
+async def queued_pool_jobs(session_factory) -> int:
+    async with session_factory() as db:
+        return await db.scalar(
+            select(func.count(StoryJob.id)).where(
+                StoryJob.is_pool_job.is_(True), StoryJob.theme == "haunted lighthouse"
+            )
+        )
+
+
+async def test_refill_tops_up_to_the_target(session_factory, pool_settings):
+    pool = WarmPool()
+    for _ in range(2):
+        async with session_factory() as db:
+            await pool.refill(db)
+
+    assert await queued_pool_jobs(session_factory) == 3
+
+
+@pytest.mark.postgres
+async def test_concurrent_workers_do_not_overshoot(
+    postgres_session_factory, pool_settings, monkeypatch
+):
+    read_depth = WarmPool.depth
+
+    async def slow_depth(self, db):
+        # Let the other workers read the same depth before anyone inserts
+        depth = await read_depth(self, db)
+        await asyncio.sleep(0.05)
+        return depth
+
+    monkeypatch.setattr(WarmPool, "depth", slow_depth)
+
+    async def refill(pool: WarmPool) -> int:
+        async with postgres_session_factory() as db:
+            return await pool.refill(db)
+
+    # One WarmPool per worker process
+    for _ in range(3):
+        await asyncio.gather(*(refill(WarmPool()) for _ in range(4)))
+
+    assert await queued_pool_jobs(postgres_session_factory) == 3
+
+
+async def test_claiming_a_story_drops_its_cached_copy(session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "WARM_POOL_THEMES", ["sunken library"])
+    job_id = await add_job(
+        session_factory, "sunken library", session_id=WARM_POOL_SESSION_ID, is_pool_job=True
+    )
+    await StoryWorker(session_factory).run_until_empty()
+    story_id = (await get_job(session_factory, job_id)).story_id
+
+    pooled = json.loads((await get_complete_story_payload(story_id)).body)
+    assert pooled["session_id"] == WARM_POOL_SESSION_ID
+
+    async with session_factory() as db:
+        assert await WarmPool().claim(db, "sunken library", "player-session") == story_id
+        await db.commit()
+
+    claimed = await get_complete_story_payload(story_id)
+    assert json.loads(claimed.body)["session_id"] == "player-session"
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import ServiceUnavailable
+from sqlalchemy import update
+
+from conftest import add_job, get_job
+from core.config import settings
+from core.llm_pool import LLMClientPool, key_fingerprint
+from core.story_cache import story_cache
+from core.story_generator import StoryGenerator
+from core.worker import StoryWorker, generate_story_task
+from models.job import StoryJob
+
+
+async def test_run_until_empty_completes_queued_jobs(session_factory):
+    job_ids = [await add_job(session_factory, theme) for theme in ("pirates", "space")]
+
+    processed = await StoryWorker(session_factory, concurrency=4).run_until_empty()
+
+    assert processed >= 2
+    for job_id in job_ids:
+        job = await get_job(session_factory, job_id)
+        assert job.status == "completed", job.error
+        assert job.story_id is not None
+        assert job.attempts == 1
+        assert job.completed_at >= job.started_at
+
+
+async def test_claim_skips_jobs_waiting_for_a_retry(session_factory):
+    job_id = await add_job(
+        session_factory, next_attempt_at=datetime.now(timezone.utc) + timedelta(hours=1)
+    )
+
+    await StoryWorker(session_factory).run_until_empty()
+
+    assert (await get_job(session_factory, job_id)).status == "pending"
+
+
+async def test_stale_processing_job_is_reclaimed(session_factory):
+    job_id = await add_job(session_factory)
+    async with session_factory() as db:
+        await db.execute(
+            update(StoryJob)
+            .where(StoryJob.job_id == job_id)
+            .values(
+                status="processing",
+                started_at=datetime.now(timezone.utc) - timedelta(hours=1),
+                worker_id="dead-worker",
+                attempts=1,
+            )
+        )
+        await db.commit()
+
+    await StoryWorker(session_factory, stale_after=60).run_until_empty()
+
+    job = await get_job(session_factory, job_id)
+    assert job.status == "completed"
+    assert job.attempts == 2
+    assert job.worker_id != "dead-worker"
+
+
+async def test_only_an_embedded_worker_warms_the_story_cache(session_factory):
+    standalone, embedded = await add_job(session_factory), await add_job(session_factory)
+
+    await generate_story_task(standalone, session_factory)
+    await generate_story_task(embedded, session_factory, warm_cache=True)
+
+    standalone_job = await get_job(session_factory, standalone)
+    embedded_job = await get_job(session_factory, embedded)
+    assert story_cache.get(standalone_job.story_id) is None
+    assert story_cache.get(embedded_job.story_id) is not None
+
+
+class DownLLM:
+    async def ainvoke(self, prompt, **options):
+        # Slow enough for the second job to join the call
+        await asyncio.sleep(0.05)
+        raise ServiceUnavailable("down")
+
+
+async def test_a_coalesced_failure_moves_every_job_off_the_key(
+    session_factory, monkeypatch
+):
+    monkeypatch.setattr(settings, "STORY_COALESCE_GENERATION", True)
+    pool = LLMClientPool(
+        ["down-key", "up-key"],
+        lambda key: DownLLM() if key == "down-key" else StoryGenerator._create_llm(key),
+        requests_per_minute=60,
+        cooldown_seconds=30,
+        failure_threshold=5,
+        circuit_open_seconds=60,
+        acquire_timeout=1,
+    )
+    monkeypatch.setattr("core.story_generator.get_llm_pool", lambda: pool)
+    down, up = pool.keys
+    job_ids = [await add_job(session_factory, "coalesced comet") for _ in range(2)]
+
+    await asyncio.gather(
+        *(generate_story_task(job_id, session_factory) for job_id in job_ids)
+    )
+    assert down.requests == 1
+
+    # Left alone the pool would pick the down key again
+    up.tokens = 1.0
+    for job_id in job_ids:
+        job = await get_job(session_factory, job_id)
+        assert job.status == "pending"
+        assert [e["key"] for e in job.attempt_errors] == [key_fingerprint("down-key")]
+
+        await generate_story_task(job_id, session_factory)
+        assert (await get_job(session_factory, job_id)).status == "completed"
+        up.tokens = 1.0
+    assert down.requests == 1
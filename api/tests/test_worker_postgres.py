@@ -0,0 +1,23 @@
+import pytest
+
+from conftest import add_job, get_job
+from core.config import settings
+from core.worker import StoryWorker
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.mark.parametrize("mode", ["batch", "stream"])
+async def test_jobs_complete_on_postgres(postgres_session_factory, monkeypatch, mode):
+    # timestamptz columns come back timezone-aware on Postgres
+    monkeypatch.setattr(settings, "GENERATION_MODE", mode)
+    job_id = await add_job(postgres_session_factory)
+
+    await StoryWorker(postgres_session_factory).run_until_empty()
+
+    job = await get_job(postgres_session_factory, job_id)
+    assert job.status == "completed", job.error
+    assert job.started_at.tzinfo is not None
+    assert job.created_at <= job.started_at <= job.completed_at
+    if mode == "stream":
+        assert job.started_at <= job.first_node_at <= job.completed_at
@@ -0,0 +1,44 @@
+from core.write_behind import WriteBehindBuffer
+from models.progress import StoryProgress
+
+
+def failing_session():
+    raise ConnectionError("database is down")
+
+
+def make_buffer(session_factory=failing_session) -> WriteBehindBuffer:
+    return WriteBehindBuffer(
+        "test", StoryProgress, session_factory, flush_interval=60, max_batch=100, max_pending=3
+    )
+
+
+async def test_a_full_buffer_drops_the_oldest_rows():
+    buffer = make_buffer()
+    for index in range(5):
+        buffer.add({"index": index})
+
+    assert [row["index"] for row in buffer.pending()] == [2, 3, 4]
+    assert buffer.dropped == 2
+    buffer._task.cancel()
+
+
+async def test_a_failed_flush_keeps_the_newest_rows():
+    buffer = make_buffer()
+    for index in range(2):
+        buffer.add({"index": index})
+
+    original_factory = buffer.session_factory
+
+    def add_then_fail():
+        # Rows that arrive while the batch is being written
+        buffer.add({"index": 2})
+        buffer.add({"index": 3})
+        return original_factory()
+
+    buffer.session_factory = add_then_fail
+    assert await buffer.flush() == 0
+
+    assert [row["index"] for row in buffer.pending()] == [1, 2, 3]
+    assert buffer.dropped == 1
+    assert buffer.failed_flushes == 1
+    buffer._task.cancel()
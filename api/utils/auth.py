@@ -1,20 +1,26 @@
 import os
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
 from uuid import UUID, uuid4
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
 import jwt
 from jwt import PyJWTError
-from passlib.context import CryptContext
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 
-from db.database import get_db
+from core.config import settings
+from db.database import get_async_db
 from models.user import User
 from schemas.user import Token, TokenData, UserCreate, UserLogin
+from .password_hashing import PasswordHasher
 from .exceptions import (
     UserError,
     AuthenticationError,
@@ -31,27 +37,31 @@ if not SECRET_KEY or not ALGORITHM or not ACCESS_TOKEN_EXPIRE_MINUTES:
 
 # Security & OAuth
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="users/token")
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+password_hasher = PasswordHasher(
+    workers=settings.AUTH_HASH_WORKERS,
+    max_pending=settings.AUTH_HASH_MAX_PENDING,
+    nice=settings.AUTH_HASH_NICE,
+)
 
 
 # ------------------------
 # Password Utilities
 # ------------------------
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
 
 
 # ------------------------
 # User Authentication
 # ------------------------
-def authenticate_user(email: str, password: str, db: Session) -> User | bool:
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(email: str, password: str, db: AsyncSession) -> User | bool:
+    user = await db.scalar(select(User).where(User.email == email))
+    if not user or not await verify_password(password, user.hashed_password):  # type: ignore
         logging.warning(f"Failed authentication attempt for email: {email}")
         return False
     return user
@@ -69,23 +79,46 @@ def create_access_token(email: str, user_id: UUID, expires_delta: timedelta) ->
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
+# Tokens that already passed jwt.decode, keyed by digest, until their exp
+_verified_tokens: "OrderedDict[bytes, tuple[TokenData, float]]" = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+
 def verify_token(token: str) -> TokenData:
+    digest = hashlib.sha256(token.encode()).digest()
+    with _verified_tokens_lock:
+        cached = _verified_tokens.get(digest)
+        if cached is not None:
+            if cached[1] > time.time():
+                _verified_tokens.move_to_end(digest)
+                return cached[0]
+            del _verified_tokens[digest]
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])  # type: ignore
         user_id: str = payload.get("id")
         if not user_id:
             logging.warning("Token payload missing user_id")
             raise AuthenticationError("Invalid token")
-        return TokenData(user_id=user_id)
+        token_data = TokenData(user_id=user_id)
     except PyJWTError as e:
         logging.warning(f"Token verification failed: {str(e)}")
         raise AuthenticationError("Invalid token")
 
+    # Tokens without exp never expire, so they aren't worth pinning in memory
+    if payload.get("exp") and settings.AUTH_TOKEN_CACHE_SIZE:
+        with _verified_tokens_lock:
+            _verified_tokens[digest] = (token_data, float(payload["exp"]))
+            while len(_verified_tokens) > settings.AUTH_TOKEN_CACHE_SIZE:
+                _verified_tokens.popitem(last=False)
+    return token_data
+
 
 # ------------------------
 # FastAPI Dependencies
 # ------------------------
-def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]) -> TokenData:
+async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]) -> TokenData:
+    # async so the (usually cached) check doesn't hop to the threadpool
     return verify_token(token)
 
 
@@ -95,34 +128,37 @@ CurrentUser = Annotated[TokenData, Depends(get_current_user)]
 # ------------------------
 # Register & Login
 # ------------------------
-def register_user(db: Session, user_req: UserCreate) -> User:
+async def register_user(db: AsyncSession, user_req: UserCreate) -> User:
     # Check if email already exists
-    existing_user = db.query(User).filter(User.email == user_req.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_req.email))
     if existing_user:
         raise UserError(status_code=409, detail="Email already registered")
 
+    # Outside the try so a saturated hasher surfaces as its 503
+    hashed_password = await get_password_hash(user_req.password)
+
     try:
         db_user = User(
             id=uuid4(),
             email=user_req.email,
             first_name=user_req.first_name,
             last_name=user_req.last_name,
-            hashed_password=get_password_hash(user_req.password),
+            hashed_password=hashed_password,
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     except Exception as e:
         logging.error(f"Error registering user: {str(e)}")
         raise UserError(status_code=500, detail="Failed to register user")
 
 
-def login_for_access_token(
+async def login_for_access_token(
     user_data: UserLogin,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ) -> Token:
-    user = authenticate_user(user_data.email, user_data.password, db)
+    user = await authenticate_user(user_data.email, user_data.password, db)
     if not user:
         raise AuthenticationError("Invalid credentials")
     token = create_access_token(
@@ -0,0 +1,108 @@
+"""
+Argon2 hashing off the event loop.
+
+Argon2 is slow and memory-hard on purpose, so a burst of logins or
+registrations would otherwise eat the API's threadpool and stall every
+other request. Hashes run in a small process pool instead, and once
+AUTH_HASH_MAX_PENDING hashes are queued further requests get a 503.
+
+The pool still competes with the API for CPU. By default it has one
+process less than the available CPUs (at least one), and its processes
+run at a lower priority, so on a small machine sign-ins slow down before
+other requests do.
+
+Pool processes are spawned, not forked: a fork of the running API would
+copy its event loop, open connections and locks into the child. A spawned
+process imports only this module, which is kept free of app imports so
+it starts cheaply. The app lifespan calls `start()`, before any request
+is served.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+T = TypeVar("T")
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def default_workers() -> int:
+    """One process less than the CPUs this process may run on, at least one"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    return max(cpus - 1, 1)
+
+
+def _lower_priority(nice: int):
+    """Pool process initializer"""
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+
+class PasswordHasher:
+    """Runs `hash_password` / `verify_password` with bounded concurrency"""
+
+    def __init__(self, workers: Optional[int], max_pending: int, nice: int = 0):
+        # workers=0 hashes on the threadpool like a plain sync endpoint would
+        self.workers = default_workers() if workers is None else workers
+        self.max_pending = max_pending
+        self.nice = nice
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def start(self):
+        if self.workers and self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority,
+                initargs=(self.nice,),
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many sign-in requests, please try again shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            if not self.workers:
+                return await run_in_threadpool(func, *args)
+            self.start()  # no-op once the lifespan started the pool
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
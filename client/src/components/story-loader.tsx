@@ -18,9 +18,18 @@ import {
   Loader2,
 } from "lucide-react";
 import { api } from "../api";
-import type { Story, StoryNode, StoryOption } from "../lib/types";
+import type {
+  ProgressResponse,
+  Story,
+  StoryNode,
+  StoryNodesResponse,
+  StoryOption,
+} from "../lib/types";
 import { cn } from "../lib/utils";
 
+const STORY_REFRESH_MS = 2000;
+const FRONTIER_DEPTH = 3;
+
 export default function StoryLoader() {
   const { id } = useParams<{ id: string }>();
   const navigate = useNavigate();
@@ -35,16 +44,65 @@ export default function StoryLoader() {
   const [isWinningEnding, setIsWinningEnding] = useState(false);
   const [selectedOption, setSelectedOption] = useState<number | null>(null);
 
+  // Only the nodes a few choices ahead are fetched; more follow as the
+  // player moves, so deep stories never download whole
+  const fetchNodes = async (fromId?: number) => {
+    const response = await api.get<StoryNodesResponse>(`/stories/${id}/nodes`, {
+      params: { depth: FRONTIER_DEPTH, ...(fromId !== undefined && { from: fromId }) },
+    });
+    return response.data;
+  };
+
+  // Fire and forget: losing a progress event only costs the resume point
+  const recordProgress = (
+    nodeId: number,
+    fromNodeId: number | null = null,
+    optionIndex: number | null = null
+  ) => {
+    api
+      .post(`/stories/${id}/progress`, {
+        node_id: nodeId,
+        from_node_id: fromNodeId,
+        option_index: optionIndex,
+      })
+      .catch(() => {});
+  };
+
+  const mergeNodes = (frontier: StoryNodesResponse) =>
+    setStory((prev) => ({
+      id: frontier.id,
+      title: frontier.title,
+      theme: frontier.theme,
+      root_node_id: frontier.root_node_id,
+      is_complete: frontier.is_complete,
+      all_nodes: { ...prev?.all_nodes, ...frontier.nodes },
+    }));
+
   // Load story from API
   useEffect(() => {
     if (!id) return;
     const fetchStory = async () => {
       try {
         setLoading(true);
-        const response = await api.get<Story>(`/stories/${id}/complete`);
-        const loadedStory = response.data;
-        setStory(loadedStory);
-        setCurrentNodeId(loadedStory.root_node?.id ?? null);
+        const [frontier, progress] = await Promise.all([
+          fetchNodes(),
+          api
+            .get<ProgressResponse>(`/stories/${id}/progress`)
+            .then((response) => response.data)
+            .catch(() => null),
+        ]);
+        mergeNodes(frontier);
+        // Resume where the player left off
+        const resumeId = progress?.node_id ?? frontier.root_node_id;
+        if (resumeId !== frontier.root_node_id) {
+          try {
+            mergeNodes(await fetchNodes(resumeId));
+          } catch {
+            setCurrentNodeId(frontier.root_node_id);
+            return;
+          }
+        }
+        setCurrentNodeId(resumeId);
       } catch (err: any) {
         if (err.response?.status === 401) {
           setError("You must be logged in to view this story");
@@ -61,6 +119,21 @@ export default function StoryLoader() {
     fetchStory();
   }, [id, navigate]);
 
+  // Streamed stories grow while being played; pick up new nodes. A failed
+  // stream is closed server-side, so is_complete always turns true
+  useEffect(() => {
+    if (!id || !story || story.is_complete !== false) return;
+    const refresh = setTimeout(async () => {
+      try {
+        mergeNodes(await fetchNodes(currentNodeId ?? undefined));
+      } catch {
+        // Keep playing what we have; the next refresh retries
+        setStory({ ...story });
+      }
+    }, STORY_REFRESH_MS);
+    return () => clearTimeout(refresh);
+  }, [id, story, currentNodeId]);
+
   // Update node on navigation
   useEffect(() => {
     if (currentNodeId !== null && story && story.all_nodes) {
@@ -81,14 +154,71 @@ export default function StoryLoader() {
   }, [currentNodeId, story]);
 
   const restartStory = () => {
-    if (story?.root_node) setCurrentNodeId(story.root_node.id);
+    if (!story) return;
+    setCurrentNodeId(story.root_node_id);
+    recordProgress(story.root_node_id);
   };
 
   const createNewStory = () => navigate("/generate");
 
-  const chooseOption = (optionId: number) => {
-    setSelectedOption(optionId);
-    setTimeout(() => setCurrentNodeId(optionId), 300);
+  const chooseOption = async (index: number) => {
+    const nextNodeId = options[index].node_id;
+    setSelectedOption(index);
+
+    if (nextNodeId !== null) {
+      recordProgress(nextNodeId, currentNodeId, index);
+      const next = story?.all_nodes[nextNodeId];
+      const ahead = next?.options?.filter((o) => o.node_id !== null) ?? [];
+      // A node without options or an ending is still streaming (or was
+      // closed as an ending when the stream failed): fetch it again
+      const settled = next && (next.is_ending || ahead.length > 0);
+      if (settled && ahead.every((o) => story?.all_nodes[o.node_id as number])) {
+        setTimeout(() => setCurrentNodeId(nextNodeId), 300);
+        return;
+      }
+      // Past the loaded frontier: fetch the next few levels first
+      try {
+        mergeNodes(await fetchNodes(nextNodeId));
+        setCurrentNodeId(nextNodeId);
+      } catch {
+        setSelectedOption(null);
+        setError("Failed to continue the story");
+      }
+      return;
+    }
+
+    // Lazy stories write the next branch when it is first chosen (the
+    // server records the move)
+    const parentId = currentNodeId;
+    if (parentId === null) return;
+    try {
+      const response = await api.post<StoryNode>(
+        `/stories/${id}/nodes/${parentId}/choose`,
+        { option_index: index }
+      );
+      const node = response.data;
+      setStory((prev) => {
+        if (!prev) return prev;
+        const parent = prev.all_nodes[parentId];
+        return {
+          ...prev,
+          all_nodes: {
+            ...prev.all_nodes,
+            [node.id]: node,
+            [parentId]: {
+              ...parent,
+              options: parent.options?.map((o, i) =>
+                i === index ? { ...o, node_id: node.id } : o
+              ),
+            },
+          },
+        };
+      });
+      setCurrentNodeId(node.id);
+    } catch {
+      setSelectedOption(null);
+      setError("Failed to continue the story");
+    }
   };
 
   // ------------- UI -------------
@@ -223,12 +353,12 @@ export default function StoryLoader() {
                       {options.map((option, index) => (
                         <Button
                           key={index}
-                          onClick={() => chooseOption(option.node_id)}
+                          onClick={() => chooseOption(index)}
                           variant="outline"
                           size="lg"
                           className={cn(
                             "h-auto justify-start whitespace-normal p-4 text-left transition-all",
-                            selectedOption === option.node_id &&
+                            selectedOption === index &&
                               "border-primary bg-primary/5"
                           )}
                         >
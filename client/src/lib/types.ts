@@ -2,9 +2,11 @@ export interface Story {
   id: number;
   title: string;
   theme: string;
-  root_node: StoryNode;
+  root_node_id: number;
+  // May hold only the nodes near the player (see StoryNodesResponse)
   all_nodes: Record<number, StoryNode>;
   created_at?: string;
+  is_complete?: boolean;
 }
 
 export interface StoryNode {
@@ -17,16 +19,39 @@ export interface StoryNode {
 
 export interface StoryOption {
   text: string;
-  node_id: number;
+  // null until a lazily generated branch is first chosen
+  node_id: number | null;
 }
 
+// GET /stories/{id}/nodes?from=&depth=: a node and those `depth` choices ahead
+export interface StoryNodesResponse {
+  id: number;
+  title: string;
+  theme: string;
+  is_complete: boolean;
+  root_node_id: number;
+  from_node_id: number;
+  depth: number;
+  nodes: Record<number, StoryNode>;
+}
+
+// GET /stories/{id}/progress: where the player left off
+export interface ProgressResponse {
+  story_id: number;
+  node_id: number | null;
+  // Option indexes from the root to node_id
+  choices: number[];
+}
+
+export type JobStatus = "pending" | "processing" | "completed" | "failed";
+
 export interface JobResponse {
   job_id: string;
-  status: "processing" | "completed" | "failed";
+  status: JobStatus;
 }
 
 export interface JobStatusResponse {
-  status: "processing" | "completed" | "failed";
+  status: JobStatus;
   story_id?: number;
   error?: string;
 }
@@ -42,7 +67,8 @@ export interface Story {
   id: number;
   title: string;
   theme: string;
-  root_node: StoryNode;
+  root_node_id: number;
   all_nodes: Record<number, StoryNode>;
   created_at?: string;
+  is_complete?: boolean;
 }
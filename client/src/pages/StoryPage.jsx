@@ -35,8 +35,8 @@ export default function StoryPage() {
   }, [id]);
 
   useEffect(() => {
-    if (story && story.root_node) {
-      setCurrentNodeId(story.root_node.id);
+    if (story) {
+      setCurrentNodeId(story.root_node_id);
     }
   }, [story]);
 
@@ -87,8 +87,8 @@ export default function StoryPage() {
   };
 
   const restartStory = () => {
-    if (story && story.root_node) {
-      setCurrentNodeId(story.root_node.id);
+    if (story) {
+      setCurrentNodeId(story.root_node_id);
     }
   };
 
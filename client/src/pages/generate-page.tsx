@@ -1,6 +1,10 @@
 import { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
-import type { JobResponse, JobStatusResponse } from "../lib/types";
+import type {
+  JobResponse,
+  JobStatus,
+  JobStatusResponse,
+} from "../lib/types";
 import { api } from "../api";
 import {
   Card,
@@ -18,12 +22,12 @@ import { useForm } from "react-hook-form";
 import { zodResolver } from "@hookform/resolvers/zod";
 import { themeSchema, type ThemeFormData } from "../validation/themeSchema";
 
+const JOB_WAIT_SECONDS = 25;
+
 export default function GeneratePage() {
   const navigate = useNavigate();
   const [jobId, setJobId] = useState<string | null>(null);
-  const [jobStatus, setJobStatus] = useState<
-    "processing" | "completed" | "failed" | null
-  >(null);
+  const [jobStatus, setJobStatus] = useState<JobStatus | null>(null);
   const [error, setError] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
   const [progress, setProgress] = useState(0);
@@ -38,28 +42,35 @@ export default function GeneratePage() {
     defaultValues: { theme: "" },
   });
 
-  // Poll job status every few seconds
+  // Long-poll job status; the server answers as soon as the status changes
   useEffect(() => {
-    let pollInterval: ReturnType<typeof setInterval>;
+    if (!jobId) return;
+    let cancelled = false;
 
-    if (jobId && jobStatus === "processing") {
-      pollInterval = setInterval(() => pollJobStatus(jobId), 3000);
-    }
+    const waitForJob = async () => {
+      let status: JobStatus | null = "pending";
+      while (!cancelled && (status === "pending" || status === "processing")) {
+        status = await pollJobStatus(jobId, JOB_WAIT_SECONDS);
+      }
+    };
+    waitForJob();
 
     return () => {
-      if (pollInterval) clearInterval(pollInterval);
+      cancelled = true;
     };
-  }, [jobId, jobStatus]);
+  }, [jobId]);
+
+  const isWaiting = jobStatus === "pending" || jobStatus === "processing";
 
   // Smooth progress bar simulation
   useEffect(() => {
-    if (jobStatus === "processing") {
+    if (isWaiting) {
       const progressInterval = setInterval(() => {
         setProgress((prev) => (prev >= 90 ? prev : prev + Math.random() * 10));
       }, 500);
       return () => clearInterval(progressInterval);
     }
-  }, [jobStatus]);
+  }, [isWaiting]);
 
   const onSubmit = async (data: ThemeFormData) => {
     setLoading(true);
@@ -72,8 +83,6 @@ export default function GeneratePage() {
       setJobId(job_id);
       setJobStatus(status);
       setLoading(false);
-
-      pollJobStatus(job_id);
     } catch (err: any) {
       setLoading(false);
       if (err.response?.status === 401) {
@@ -88,24 +97,37 @@ export default function GeneratePage() {
     }
   };
 
-  const pollJobStatus = async (id: string) => {
+  const pollJobStatus = async (
+    id: string,
+    wait: number
+  ): Promise<JobStatus | null> => {
     try {
-      const response = await api.get<JobStatusResponse>(`/jobs/${id}`);
+      const response = await api.get<JobStatusResponse>(`/jobs/${id}`, {
+        params: { wait },
+      });
       const { status, story_id, error: jobError } = response.data;
       setJobStatus(status);
 
       if (status === "completed" && story_id) {
         setProgress(100);
         setTimeout(() => navigate(`/story/${story_id}`), 1000);
+        return status;
+      } else if (status === "processing" && story_id) {
+        // Streamed stories are playable as soon as the first node is written
+        navigate(`/story/${story_id}`);
+        return status;
       } else if (status === "failed" || jobError) {
         setError(jobError || "Failed to generate story");
         setJobStatus("failed");
+        return "failed";
       }
+      return status;
     } catch (err: any) {
       if (err.response?.status !== 404) {
         setError("Failed to check story status");
         setJobStatus("failed");
       }
+      return null;
     }
   };
 
@@ -177,7 +199,7 @@ export default function GeneratePage() {
             </Card>
           )}
 
-          {(loading || jobStatus === "processing") && (
+          {(loading || isWaiting) && (
             <Card>
               <CardContent className="flex flex-col items-center gap-6 py-12">
                 <div className="flex h-16 w-16 items-center justify-center rounded-full bg-primary/10">
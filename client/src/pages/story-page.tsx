@@ -29,8 +29,8 @@ export default function StoryPage() {
 
   // Initialize story
   useEffect(() => {
-    if (story && story.root_node) {
-      setCurrentNodeId(story.root_node.id);
+    if (story) {
+      setCurrentNodeId(story.root_node_id);
     }
   }, [story]);
 
@@ -54,8 +54,8 @@ export default function StoryPage() {
   }, [currentNodeId, story]);
 
   const restartStory = () => {
-    if (story && story.root_node) {
-      setCurrentNodeId(story.root_node.id);
+    if (story) {
+      setCurrentNodeId(story.root_node_id);
     }
   };
 